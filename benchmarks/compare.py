@@ -0,0 +1,55 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2015-2020 Óscar García Amor <ogarcia@connectical.com>
+#
+# Distributed under terms of the GNU GPLv3 license.
+
+"""
+Compare two benchmark results files, exiting with error if some scenario
+got worse than allowed
+"""
+
+import argparse
+import json
+import sys
+
+# Compared values of every scenario and how to get them from a result
+METRICS = [
+        ('seconds', lambda result: result['seconds']),
+        ('requests', lambda result: result['counters']['trello_requests']),
+        ('commands', lambda result: result['counters']['taskwarrior_commands']),
+        ('peak_rss_kib', lambda result: result['peak_rss_kib'])]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('base', help='results of base commit')
+    parser.add_argument('new', help='results of new commit')
+    parser.add_argument('-t', '--threshold', type=float, default=10, help='maximum percent that a value can grow, default: %(default)s')
+    args = parser.parse_args()
+    with open(args.base) as base_file, open(args.new) as new_file:
+        base, new = json.load(base_file), json.load(new_file)
+    if base['parameters'] != new['parameters']:
+        sys.stderr.write('Warning: results were run with different parameters\n')
+    base_results = {result['scenario']: result for result in base['results']}
+    regressions = []
+    sys.stdout.write('Comparing {} with {}\n'.format(base.get('commit'), new.get('commit')))
+    for result in new['results']:
+        base_result = base_results.get(result['scenario'])
+        if base_result is None:
+            continue
+        for name, value in METRICS:
+            base_value, new_value = value(base_result), value(result)
+            change = (new_value - base_value) * 100 / base_value if base_value else 0
+            flag = ''
+            if change > args.threshold:
+                flag = ' REGRESSION'
+                regressions.append('{} {}'.format(result['scenario'], name))
+            sys.stdout.write('{:<14} {:<14} {:>12} {:>12} {:>+8.1f}%{}\n'.format(result['scenario'], name,
+                round(base_value, 2), round(new_value, 2), change, flag))
+    if regressions:
+        sys.exit('Regressions: {}'.format(', '.join(regressions)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,292 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2015-2020 Óscar García Amor <ogarcia@connectical.com>
+#
+# Distributed under terms of the GNU GPLv3 license.
+
+"""
+Local stand-in of the part of Trello API used by TrelloWarrior, keeping
+boards, lists, labels and cards in memory
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import datetime
+import gzip
+import itertools
+import json
+import re
+import threading
+import time
+
+# Trello IDs are 24 hex digits, the first 8 ones are the creation timestamp
+ID_REGEX = r'([0-9a-f]{24})'
+# Lists of new boards
+DEFAULT_LISTS = ['To Do', 'Doing', 'Done']
+# Fake ID of token owner
+MEMBER_ID = '5a0000000000000000000001'
+
+def now():
+    return datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+def only_fields(json_obj, fields):
+    """
+    Keep only the requested fields of an object, like Trello does
+    """
+    if fields is None or fields == 'all':
+        return dict(json_obj)
+    return {key: value for key, value in json_obj.items() if key == 'id' or key in fields.split(',')}
+
+class NotFound(Exception):
+    pass
+
+class FakeTrello:
+    """
+    In memory Trello data and the handlers of the API routes
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.boards = {}
+        self.lists = {}
+        self.labels = {}
+        self.cards = {}
+        self.actions = []
+        self.requests = {} # Requests by endpoint
+        self._ids = itertools.count(1)
+        self.routes = [
+                ('GET', r'/members/me', self.get_me),
+                ('GET', r'/members/me/boards', self.get_my_boards),
+                ('POST', r'/boards', self.post_board),
+                ('GET', r'/boards/{}'.format(ID_REGEX), self.get_board),
+                ('GET', r'/boards/{}/lists'.format(ID_REGEX), self.get_board_lists),
+                ('GET', r'/boards/{}/labels'.format(ID_REGEX), self.get_board_labels),
+                ('GET', r'/boards/{}/cards/open'.format(ID_REGEX), self.get_board_cards),
+                ('GET', r'/boards/{}/members/{}/cards'.format(ID_REGEX, ID_REGEX), self.get_board_cards),
+                ('GET', r'/boards/{}/actions'.format(ID_REGEX), self.get_board_actions),
+                ('POST', r'/lists', self.post_list),
+                ('POST', r'/labels', self.post_label),
+                ('POST', r'/cards', self.post_card),
+                ('GET', r'/cards/{}'.format(ID_REGEX), self.get_card),
+                ('DELETE', r'/cards/{}'.format(ID_REGEX), self.delete_card),
+                ('PUT', r'/cards/{}/(name|desc|due|idList|closed)'.format(ID_REGEX), self.put_card_attribute),
+                ('POST', r'/cards/{}/(idLabels|idMembers)'.format(ID_REGEX), self.post_card_relation),
+                ('DELETE', r'/cards/{}/(idLabels|idMembers)/{}'.format(ID_REGEX, ID_REGEX), self.delete_card_relation),
+                ('GET', r'/tokens/([^/]+)/webhooks', lambda query, body, token: []),
+                ('POST', r'/webhooks', lambda query, body: {'id': self.new_id()})]
+
+    def new_id(self):
+        return '{:08x}{:016x}'.format(int(time.time()), next(self._ids))
+
+    def handle(self, method, path, query, body):
+        """
+        Run the handler of a request
+
+        :return: HTTP status and JSON answer
+        :rtype: tuple
+        """
+        path = path[2:] if path.startswith('/1/') else path
+        path = path.rstrip('/') or '/'
+        for route_method, route_path, handler in self.routes:
+            match = re.fullmatch(route_path, path)
+            if route_method == method and match is not None:
+                endpoint = '{} {}'.format(method, re.sub(ID_REGEX, '{id}', path))
+                with self.lock:
+                    self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+                    try:
+                        return 200, handler(query, body, *match.groups())
+                    except (KeyError, NotFound):
+                        return 404, 'The requested resource was not found.'
+        return 404, 'Cannot {} {}'.format(method, path)
+
+    def add_board(self, name, lists=DEFAULT_LISTS):
+        """
+        Add a board with some lists
+
+        :return: the board
+        :rtype: dict
+        """
+        board = {'id': self.new_id(), 'name': name, 'desc': '', 'closed': False, 'url': 'https://trello.com/b/{}'.format(name)}
+        self.boards[board['id']] = board
+        for position, list_name in enumerate(lists):
+            self.add_list(board['id'], list_name, position)
+        return board
+
+    def add_list(self, board_id, name, position=None):
+        trello_list = {'id': self.new_id(), 'name': name, 'closed': False, 'idBoard': board_id,
+                'pos': position if position is not None else len(self.lists)}
+        self.lists[trello_list['id']] = trello_list
+        return trello_list
+
+    def add_label(self, board_id, name, color='black'):
+        label = {'id': self.new_id(), 'idBoard': board_id, 'name': name, 'color': color}
+        self.labels[label['id']] = label
+        return label
+
+    def add_card(self, list_id, name, desc='', due=None, labels_ids=None, members_ids=None):
+        card = {'id': self.new_id(), 'name': name, 'desc': desc, 'due': due, 'closed': False, 'idList': list_id,
+                'idBoard': self.lists[list_id]['idBoard'], 'idLabels': list(labels_ids or []), 'idMembers': list(members_ids or []),
+                'dateLastActivity': now()}
+        card['shortUrl'] = 'https://trello.com/c/{}'.format(card['id'][-8:])
+        self.cards[card['id']] = card
+        self.touch(card, 'createCard')
+        return card
+
+    def touch(self, card, action_type='updateCard'):
+        """
+        Record a change of a card as Trello does
+        """
+        card['dateLastActivity'] = now()
+        self.actions.append({'id': self.new_id(), 'type': action_type, 'date': card['dateLastActivity'], 'idMemberCreator': MEMBER_ID,
+            'data': {'card': {'id': card['id']}, 'board': {'id': card['idBoard']}}})
+
+    def card_json(self, card, fields=None):
+        card_json = dict(card, labels=[self.labels[label_id] for label_id in card['idLabels']])
+        return only_fields(card_json, fields)
+
+    def get_me(self, query, body):
+        return only_fields({'id': MEMBER_ID, 'username': 'trellowarrior', 'fullName': 'TrelloWarrior'}, query.get('fields'))
+
+    def get_my_boards(self, query, body):
+        boards = self.boards.values()
+        if query.get('filter') == 'open':
+            boards = [board for board in boards if not board['closed']]
+        return list(boards)
+
+    def post_board(self, query, body):
+        return self.add_board(body['name'])
+
+    def get_board(self, query, body, board_id):
+        board_json = only_fields(self.boards[board_id], query.get('fields'))
+        if query.get('lists') is not None:
+            board_json['lists'] = [only_fields(trello_list, query.get('list_fields')) for trello_list in self.lists.values()
+                    if trello_list['idBoard'] == board_id and (query['lists'] != 'open' or not trello_list['closed'])]
+        if query.get('labels') is not None:
+            board_json['labels'] = [only_fields(label, query.get('label_fields')) for label in self.labels.values() if label['idBoard'] == board_id]
+        return board_json
+
+    def get_board_lists(self, query, body, board_id):
+        return [trello_list for trello_list in self.lists.values() if trello_list['idBoard'] == board_id and
+                (query.get('filter') != 'open' or not trello_list['closed'])]
+
+    def get_board_labels(self, query, body, board_id):
+        return [label for label in self.labels.values() if label['idBoard'] == board_id][:int(query.get('limit', 50))]
+
+    def get_board_cards(self, query, body, board_id, member_id=None):
+        cards = [card for card in self.cards.values() if card['idBoard'] == board_id and not card['closed'] and
+                (member_id is None or member_id in card['idMembers'])]
+        if 'before' in query:
+            cards = [card for card in cards if card['id'] < query['before']]
+        cards.sort(key=lambda card: card['id'], reverse=True) # Newest first
+        return [self.card_json(card, query.get('fields')) for card in cards[:int(query.get('limit', 1000))]]
+
+    def get_board_actions(self, query, body, board_id):
+        since = query.get('since', '')[:19]
+        actions = [action for action in reversed(self.actions) if action['data']['board']['id'] == board_id and action['date'][:19] >= since]
+        return actions[:int(query.get('limit', 50))]
+
+    def post_list(self, query, body):
+        return self.add_list(body['idBoard'], body['name'])
+
+    def post_label(self, query, body):
+        return self.add_label(body['idBoard'], body['name'], body.get('color', 'black'))
+
+    def post_card(self, query, body):
+        labels_ids = [label_id for label_id in (body.get('idLabels') or '').split(',') if label_id]
+        members_ids = [member_id for member_id in (body.get('idMembers') or '').split(',') if member_id]
+        card = self.add_card(body['idList'], body['name'], body.get('desc', ''), body.get('due'), labels_ids, members_ids)
+        return self.card_json(card)
+
+    def get_card(self, query, body, card_id):
+        return self.card_json(self.cards[card_id], query.get('fields'))
+
+    def delete_card(self, query, body, card_id):
+        card = self.cards.pop(card_id)
+        self.touch(card, 'deleteCard')
+        return {}
+
+    def put_card_attribute(self, query, body, card_id, attribute):
+        card = self.cards[card_id]
+        card[attribute] = body['value']
+        self.touch(card)
+        return self.card_json(card)
+
+    def post_card_relation(self, query, body, card_id, relation):
+        card = self.cards[card_id]
+        if body['value'] not in card[relation]:
+            card[relation].append(body['value'])
+        self.touch(card)
+        return card[relation]
+
+    def delete_card_relation(self, query, body, card_id, relation, related_id):
+        card = self.cards[card_id]
+        if related_id not in card[relation]:
+            raise NotFound()
+        card[relation].remove(related_id)
+        self.touch(card)
+        return card[relation]
+
+class FakeTrelloServer(ThreadingHTTPServer):
+    """
+    HTTP server of a FakeTrello, listening in a random local port
+    """
+
+    daemon_threads = True
+
+    def __init__(self, trello=None, host='127.0.0.1', port=0):
+        self.trello = trello if trello is not None else FakeTrello()
+        super().__init__((host, port), FakeTrelloHandler)
+        self._thread = None
+
+    @property
+    def api_url(self):
+        return 'http://{}:{}/1/'.format(*self.server_address)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='faketrello', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+class FakeTrelloHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # Keep connections alive as Trello does
+
+    def handle_request(self, method):
+        url = urlsplit(self.path)
+        query = dict(parse_qsl(url.query))
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length).decode('utf-8')) if length else {}
+        status, answer = self.server.trello.handle(method, url.path, query, body)
+        if status == 200:
+            content, content_type = json.dumps(answer).encode('utf-8'), 'application/json; charset=utf-8'
+        else:
+            content, content_type = answer.encode('utf-8'), 'text/plain; charset=utf-8'
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            content = gzip.compress(content, compresslevel=1)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def do_PUT(self):
+        self.handle_request('PUT')
+
+    def do_DELETE(self):
+        self.handle_request('DELETE')
+
+    def log_message(self, format, *args):
+        pass
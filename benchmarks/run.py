@@ -0,0 +1,225 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2015-2020 Óscar García Amor <ogarcia@connectical.com>
+#
+# Distributed under terms of the GNU GPLv3 license.
+
+"""
+Benchmark TrelloWarrior project sync end to end, against a local Trello
+stand-in and synthetic Taskwarrior data
+
+Every sync runs in its own process, so its peak RSS is measured alone
+"""
+
+import os
+import sys
+
+# Benchmark the TrelloWarrior of this tree even if other one is installed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from faketrello import FakeTrelloServer
+from taskdata import create_taskrc, export_tasks, generate_tasks, import_tasks, task_date
+
+import argparse
+import datetime
+import json
+import multiprocessing
+import platform
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import tempfile
+
+SCENARIOS = ['first-import', 'noop', 'changed', 'bulk-delete']
+PROJECT = 'bench'
+BOARD = 'Benchmark'
+CONFIG = '''[DEFAULT]
+taskwarrior_taskrc_location = {taskrc}
+taskwarrior_data_location = {data_location}
+trello_api_key = benchmark
+trello_api_secret = benchmark
+trello_token = benchmark
+trello_token_secret = benchmark
+trello_api_url = {api_url}
+sync_projects = {project}
+
+[{project}]
+taskwarrior_project_name = {project}
+trello_board_name = {board}
+incremental_sync = {incremental_sync}
+'''
+
+def run_sync(config_file, cache_home, rate_limits):
+    """
+    Sync the benchmark project (in a child process) and get its stats
+    """
+    os.environ['XDG_CACHE_HOME'] = cache_home
+    from trellowarrior.clients import scheduler
+    if not rate_limits:
+        # Measure TrelloWarrior itself, not the waits for Trello rate limits
+        scheduler.API_KEY_LIMIT = scheduler.TOKEN_LIMIT = (1000000, 1)
+    from trellowarrior.clients.trellowarrior import TrelloWarriorClient
+    from trellowarrior.config import config
+    config.configure(config_file=config_file)
+    plan = TrelloWarriorClient(config).sync_project(config.sync_projects[0])
+    result = plan.stats.as_dict()
+    result['trello_changes'] = plan.trello_writes()
+    result['taskwarrior_changes'] = plan.taskwarrior_changes()
+    result['peak_rss_kib'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return result
+
+class Benchmark:
+    """
+    A benchmark project: a fake Trello board and a Taskwarrior data directory
+    """
+
+    def __init__(self, args, directory):
+        self.args = args
+        self.directory = directory
+        self.generator = random.Random(args.seed)
+        self.server = FakeTrelloServer().start()
+        self.trello = self.server.trello
+        self.taskrc, data_location = create_taskrc(directory)
+        self.config_file = os.path.join(directory, 'trellowarrior.conf')
+        with open(self.config_file, 'w') as config_file:
+            config_file.write(CONFIG.format(taskrc=self.taskrc, data_location=data_location, api_url=self.server.api_url,
+                project=PROJECT, board=BOARD, incremental_sync=args.incremental))
+        self.cache_home = os.path.join(directory, 'cache')
+        # Board with the basic lists, the extra ones and labels
+        board = self.trello.add_board(BOARD)
+        extra_lists = ['List {}'.format(number) for number in range(max(0, args.lists - 3))]
+        for list_name in extra_lists:
+            self.trello.add_list(board['id'], list_name)
+        labels = [self.trello.add_label(board['id'], 'label{}'.format(number)) for number in range(args.labels)]
+        lists = [trello_list for trello_list in self.trello.lists.values() if trello_list['idBoard'] == board['id']]
+        for number in range(args.cards):
+            self.trello.add_card(self.generator.choice(lists)['id'], 'Benchmark card {}'.format(number),
+                    desc='Description of card {}'.format(number) if self.generator.random() < 0.3 else '',
+                    labels_ids=[label['id'] for label in self.generator.sample(labels, min(len(labels), self.generator.randint(0, 2)))])
+        import_tasks(self.taskrc, generate_tasks(args.tasks, PROJECT, ['To Do'] + extra_lists,
+            [label['name'] for label in labels], seed=args.seed))
+
+    def sync(self):
+        """
+        Sync the project in a new process
+
+        :return: sync stats
+        :rtype: dict
+        """
+        requests = dict(self.trello.requests)
+        # A new pool for every sync, so its process starts from scratch
+        with multiprocessing.get_context('spawn').Pool(1) as pool:
+            result = pool.apply(run_sync, (self.config_file, self.cache_home, self.args.rate_limits))
+        result['server_requests'] = sum(self.trello.requests.values()) - sum(requests.values())
+        return result
+
+    def change(self, ratio):
+        """
+        Change some cards in Trello and some tasks in Taskwarrior
+        """
+        cards = sorted(self.trello.cards.values(), key=lambda card: card['id'])
+        lists = [trello_list['id'] for trello_list in self.trello.lists.values()]
+        for card in self.generator.sample(cards, int(len(cards) * ratio)):
+            card['name'] = '{} (changed)'.format(card['name'])
+            card['idList'] = self.generator.choice(lists)
+            self.trello.touch(card)
+        tasks = export_tasks(self.taskrc, PROJECT)
+        now = task_date(datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=1))
+        changed_tasks = self.generator.sample(tasks, int(len(tasks) * ratio))
+        for task in changed_tasks:
+            task['description'] = '{} (changed)'.format(task['description'])
+            task['modified'] = now
+        import_tasks(self.taskrc, changed_tasks)
+
+    def delete(self, ratio):
+        """
+        Delete some cards in Trello and some tasks in Taskwarrior
+        """
+        cards = sorted(self.trello.cards.values(), key=lambda card: card['id'])
+        for card in self.generator.sample(cards, int(len(cards) * ratio)):
+            del self.trello.cards[card['id']]
+            self.trello.touch(card, 'deleteCard')
+        tasks = [task for task in export_tasks(self.taskrc, PROJECT) if task['status'] != 'deleted']
+        now = task_date(datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=1))
+        deleted_tasks = self.generator.sample(tasks, int(len(tasks) * ratio))
+        for task in deleted_tasks:
+            task['status'] = 'deleted'
+            task['end'] = task['modified'] = now
+        import_tasks(self.taskrc, deleted_tasks)
+
+    def close(self):
+        self.server.stop()
+
+def run_scenario(args, scenario):
+    """
+    Prepare a new benchmark project for a scenario and measure its sync
+
+    :return: stats of measured sync
+    :rtype: dict
+    """
+    directory = tempfile.mkdtemp(prefix='trellowarrior-benchmark-')
+    benchmark = Benchmark(args, directory)
+    try:
+        if scenario != 'first-import':
+            benchmark.sync() # Not measured
+        if scenario == 'changed':
+            benchmark.change(args.change_ratio)
+        elif scenario == 'bulk-delete':
+            benchmark.delete(args.delete_ratio)
+        return benchmark.sync()
+    finally:
+        benchmark.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-s', '--scenario', action='append', choices=SCENARIOS, help='scenario to run (can be repeated), default: all')
+    parser.add_argument('-t', '--tasks', type=int, default=1000, help='Taskwarrior tasks not synchronized yet, default: %(default)s')
+    parser.add_argument('-c', '--cards', type=int, default=1000, help='Trello cards not synchronized yet, default: %(default)s')
+    parser.add_argument('-l', '--lists', type=int, default=5, help='number of Trello lists, default: %(default)s')
+    parser.add_argument('-b', '--labels', type=int, default=10, help='number of Trello labels, default: %(default)s')
+    parser.add_argument('-r', '--repeat', type=int, default=1, help='times that every scenario is run, default: %(default)s')
+    parser.add_argument('-i', '--incremental', action='store_true', help='enable incremental sync in benchmark project')
+    parser.add_argument('--change-ratio', type=float, default=0.01, help='ratio of cards and tasks changed in changed scenario, default: %(default)s')
+    parser.add_argument('--delete-ratio', type=float, default=0.1, help='ratio of cards and tasks deleted in bulk-delete scenario, default: %(default)s')
+    parser.add_argument('--rate-limits', action='store_true', help='apply Trello rate limits (slow with many cards)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed of generated data, default: %(default)s')
+    parser.add_argument('-o', '--output', help='write results in this JSON file')
+    args = parser.parse_args()
+    if shutil.which('task') is None:
+        sys.exit('Taskwarrior (task command) is needed to run benchmarks')
+    report = {
+            'commit': git_commit(),
+            'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'taskwarrior': subprocess.run(['task', '--version'], stdout=subprocess.PIPE, universal_newlines=True).stdout.strip(),
+            'parameters': {key: value for key, value in vars(args).items() if key not in ['scenario', 'output']},
+            'results': []}
+    sys.stdout.write('{:<14} {:>10} {:>10} {:>10} {:>10} {:>12}\n'.format('Scenario', 'Seconds', 'Requests', 'Changes', 'Commands', 'Peak RSS'))
+    for scenario in args.scenario or SCENARIOS:
+        runs = [run_scenario(args, scenario) for repetition in range(args.repeat)]
+        seconds = [run['wall_seconds'] for run in runs]
+        result = dict(runs[-1], scenario=scenario, seconds=statistics.median(seconds), runs_seconds=seconds,
+                peak_rss_kib=max(run['peak_rss_kib'] for run in runs))
+        report['results'].append(result)
+        sys.stdout.write('{:<14} {:>10.2f} {:>10} {:>10} {:>10} {:>9} KiB\n'.format(scenario, result['seconds'],
+            result['counters']['trello_requests'], result['trello_changes'] + result['taskwarrior_changes'],
+            result['counters']['taskwarrior_commands'], result['peak_rss_kib']))
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+            output_file.write('\n')
+
+if __name__ == '__main__':
+    main()
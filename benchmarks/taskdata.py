@@ -0,0 +1,127 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2015-2020 Óscar García Amor <ogarcia@connectical.com>
+#
+# Distributed under terms of the GNU GPLv3 license.
+
+"""
+Synthetic Taskwarrior data directories for benchmarks
+"""
+
+import datetime
+import json
+import os
+import random
+import subprocess
+import tempfile
+import uuid
+
+# Taskwarrior config of benchmarks, with the UDAs that TrelloWarrior needs
+TASKRC = '''data.location={data_location}
+confirmation=off
+hooks=off
+verbose=nothing
+uda.trelloid.type=string
+uda.trelloid.label=Trello ID
+uda.trellolistname.type=string
+uda.trellolistname.label=Trello List Name
+'''
+
+def task_date(date):
+    return date.astimezone(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+def create_taskrc(directory):
+    """
+    Create an empty Taskwarrior data directory and its taskrc
+
+    :param directory: directory where create them
+    :return: taskrc path and data directory path
+    :rtype: tuple
+    """
+    data_location = os.path.join(directory, 'task')
+    os.makedirs(data_location, exist_ok=True)
+    taskrc = os.path.join(directory, 'taskrc')
+    with open(taskrc, 'w') as taskrc_file:
+        taskrc_file.write(TASKRC.format(data_location=data_location))
+    return taskrc, data_location
+
+def run_task(taskrc, *args):
+    """
+    Run a task command
+
+    :param taskrc: taskrc path
+    :param args: command arguments
+    :return: command output
+    :rtype: string
+    """
+    environment = dict(os.environ, TASKRC=taskrc)
+    environment.pop('TASKDATA', None)
+    return subprocess.run(['task'] + list(args), env=environment, check=True, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, universal_newlines=True).stdout
+
+def import_tasks(taskrc, tasks):
+    """
+    Import (create or replace) tasks in a single command
+
+    :param taskrc: taskrc path
+    :param tasks: list of tasks dicts
+    """
+    if not tasks:
+        return
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.json') as import_file:
+        json.dump(tasks, import_file)
+        import_file.flush()
+        run_task(taskrc, 'import', import_file.name)
+
+def export_tasks(taskrc, project):
+    """
+    Export all tasks of a project
+
+    :param taskrc: taskrc path
+    :param project: Taskwarrior project name
+    :return: list of tasks dicts
+    :rtype: list
+    """
+    return json.loads(run_task(taskrc, 'project:{}'.format(project), 'export') or '[]')
+
+def generate_tasks(count, project, lists_names, labels_names, seed=0):
+    """
+    Generate new tasks (never synchronized) with a mix of statuses, tags,
+    due dates and lists
+
+    :param count: number of tasks
+    :param project: Taskwarrior project name
+    :param lists_names: names of Trello lists that tasks can be in
+    :param labels_names: names of tags that tasks can have
+    :param seed: random seed, same seed generates the same tasks
+    :return: list of tasks dicts
+    :rtype: list
+    """
+    generator = random.Random(seed)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    tasks = []
+    for number in range(count):
+        entry = now - datetime.timedelta(minutes=generator.randint(60, 60 * 24 * 30))
+        task = {
+                'uuid': str(uuid.UUID(int=generator.getrandbits(128), version=4)),
+                'description': 'Benchmark task {}'.format(number),
+                'project': project,
+                'status': 'pending',
+                'entry': task_date(entry),
+                'modified': task_date(entry)}
+        if labels_names and generator.random() < 0.5:
+            task['tags'] = generator.sample(labels_names, generator.randint(1, min(3, len(labels_names))))
+        if generator.random() < 0.3:
+            task['due'] = task_date(now + datetime.timedelta(days=generator.randint(-10, 30)))
+        state = generator.random()
+        if state < 0.2:
+            task['status'] = 'completed'
+            task['end'] = task['modified']
+        elif state < 0.3:
+            task['start'] = task['modified']
+        elif lists_names and state < 0.5:
+            task['trellolistname'] = generator.choice(lists_names)
+        tasks.append(task)
+    return tasks
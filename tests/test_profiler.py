@@ -0,0 +1,66 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2015-2020 Óscar García Amor <ogarcia@connectical.com>
+#
+# Distributed under terms of the GNU GPLv3 license.
+
+from trellowarrior.clients.trelloengine import TrelloEngine
+from trellowarrior.profiler import CpuProfile
+
+import os
+import pstats
+import shutil
+import tempfile
+import threading
+import unittest
+
+# Seconds to wait for a profiled sync before taking it as hung
+PROFILED_RUN_TIMEOUT = 30
+
+def add_card(number):
+    return sum(range(1000)) + number
+
+class TestCpuProfile(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def run_profiled_engine(self, profile):
+        """
+        Run Trello operations in the engine worker threads under the profile,
+        in another thread so a hang fails the test instead of blocking it
+        """
+        results = []
+        def run():
+            profile.start()
+            try:
+                engine = TrelloEngine(concurrency=4)
+                for number in range(8):
+                    engine.submit(number, add_card, number, callback=results.append)
+                engine.run()
+            finally:
+                profile.stop()
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        thread.join(PROFILED_RUN_TIMEOUT)
+        self.assertFalse(thread.is_alive(), 'profiled engine run did not end')
+        self.assertEqual(sorted(results), [499500 + number for number in range(8)])
+        path = os.path.join(self.directory, 'trellowarrior-test.pstats')
+        report = profile.write(path)
+        functions = {function_name for (file_name, line, function_name) in pstats.Stats(path).stats}
+        return report, functions
+
+    def test_profile_worker_threads(self):
+        report, functions = self.run_profiled_engine(CpuProfile())
+        self.assertIn('add_card', functions)
+        self.assertIn('Profile of', report)
+
+    def test_per_thread_profiles_never_kill_threads(self):
+        # Since Python 3.12 thread profiles cannot be enabled, but the run must end
+        self.run_profiled_engine(CpuProfile(per_thread=True))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2015-2020 Óscar García Amor <ogarcia@connectical.com>
+#
+# Distributed under terms of the GNU GPLv3 license.
+
+from trellowarrior.clients.taskfiles import COMPLETED_FILE, PENDING_FILE, REPLICA_FILE
+from trellowarrior.clients.taskfiles import TaskDataReader, compare_tasks, decode_value, parse_line
+
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+# Sample Taskwarrior data and the task export of every sample
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'taskfiles')
+# UDAs of the sample tasks as they are in taskrc
+UDA_CONFIG = {
+        'uda.trelloid.type': 'string',
+        'uda.trellolistname.type': 'string',
+        'uda.estimate.type': 'numeric',
+        'uda.reviewed.type': 'date'}
+
+class Backend:
+    """
+    Stand-in of tasklib backend, the reader only needs its config
+    """
+
+    def __init__(self, config):
+        self.config = config
+
+class ExportedTask(dict):
+    """
+    Stand-in of tasklib task, compare_tasks only needs export_data
+    """
+
+    def export_data(self):
+        return json.dumps(self)
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as fixture_file:
+        return json.load(fixture_file)
+
+def comparable(tasks):
+    """
+    Index tasks by UUID without the fields calculated by Taskwarrior and with
+    sorted lists, the order that task export gives to them is not kept
+    """
+    indexed = {}
+    for task in tasks:
+        task = dict(task)
+        task.pop('urgency', None)
+        for field in ['tags', 'depends']:
+            if field in task:
+                task[field] = sorted(task[field])
+        indexed[task['uuid']] = task
+    return indexed
+
+class TestDataFileValues(unittest.TestCase):
+
+    def test_decode_plain_value(self):
+        self.assertEqual(decode_value('Buy milk'), 'Buy milk')
+
+    def test_decode_entities(self):
+        self.assertEqual(decode_value('&open;Bob&close; said &dquot;hi&dquot;'), '[Bob] said "hi"')
+
+    def test_decode_escapes(self):
+        self.assertEqual(decode_value('about \\"the car\\"'), 'about "the car"')
+        self.assertEqual(decode_value('first\\nsecond'), 'first\nsecond')
+
+    def test_parse_line(self):
+        line = '[description:"Call &open;Bob&close; about \\"the car\\"" project:"home.car" status:"pending"]\n'
+        self.assertEqual(parse_line(line), {
+            'description': 'Call [Bob] about "the car"',
+            'project': 'home.car',
+            'status': 'pending'})
+
+    def test_parse_empty_line(self):
+        self.assertEqual(parse_line('\n'), {})
+
+class TaskDataReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.data_location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_location)
+        self.reader = TaskDataReader(self.data_location, Backend(UDA_CONFIG))
+
+class TestDataFiles(TaskDataReaderTest):
+    """
+    Taskwarrior 2 pending.data and completed.data
+    """
+
+    def setUp(self):
+        super().setUp()
+        for data_file in [PENDING_FILE, COMPLETED_FILE]:
+            shutil.copy(os.path.join(FIXTURES, data_file), self.data_location)
+        self.export = load_fixture('export.json')
+
+    def test_tasks_as_exported(self):
+        self.assertEqual(comparable(self.reader.tasks()), comparable(self.export))
+
+    def test_ids_of_working_tasks(self):
+        ids = {task['uuid']: task['id'] for task in self.reader.tasks()}
+        self.assertEqual(ids, {task['uuid']: task['id'] for task in self.export})
+
+    def test_compare_with_export(self):
+        read_tasks = [ExportedTask(task) for task in self.reader.tasks()]
+        exported_tasks = [ExportedTask(task) for task in self.export]
+        self.assertTrue(compare_tasks('all tasks', read_tasks, exported_tasks))
+
+    def test_compare_finds_differences(self):
+        read_tasks = [ExportedTask(task) for task in self.reader.tasks()]
+        exported_tasks = [ExportedTask(task) for task in self.export[1:]]
+        exported_tasks[0]['description'] = 'Call Bob'
+        with self.assertLogs('trellowarrior.clients.taskfiles', level='WARNING') as logs:
+            self.assertFalse(compare_tasks('all tasks', read_tasks, exported_tasks))
+        self.assertEqual(len(logs.records), 2)
+
+    def test_parse_again_when_changed(self):
+        self.assertEqual(len(self.reader.tasks()), 6)
+        with open(os.path.join(self.data_location, PENDING_FILE), 'a', encoding='utf-8') as pending_file:
+            pending_file.write('[description:"New task" entry:"1600000700" modified:"1600000700" status:"pending" '
+                    'uuid:"aaaaaaaa-aaaa-4aaa-8aaa-aaaaaaaaaaaa"]\n')
+        tasks = {task['uuid']: task for task in self.reader.tasks()}
+        self.assertEqual(len(tasks), 7)
+        self.assertEqual(tasks['aaaaaaaa-aaaa-4aaa-8aaa-aaaaaaaaaaaa']['id'], 4)
+
+    def test_no_data(self):
+        reader = TaskDataReader(tempfile.mkdtemp(), Backend(UDA_CONFIG))
+        self.addCleanup(shutil.rmtree, reader.data_location)
+        self.assertEqual(reader.tasks(), [])
+
+class TestReplica(TaskDataReaderTest):
+    """
+    Taskwarrior 3 taskchampion.sqlite3
+    """
+
+    def setUp(self):
+        super().setUp()
+        replica = load_fixture('replica.json')
+        connection = sqlite3.connect(os.path.join(self.data_location, REPLICA_FILE))
+        with connection:
+            connection.execute('CREATE TABLE tasks (uuid STRING PRIMARY KEY, data STRING)')
+            connection.execute('CREATE TABLE working_set (id INTEGER PRIMARY KEY, uuid STRING)')
+            connection.executemany('INSERT INTO tasks VALUES (?, ?)', [(uuid, json.dumps(data)) for uuid, data in replica['tasks']])
+            connection.executemany('INSERT INTO working_set VALUES (?, ?)', replica['working_set'])
+        connection.close()
+        self.export = load_fixture('replica-export.json')
+
+    def test_tasks_as_exported(self):
+        self.assertEqual(comparable(self.reader.tasks()), comparable(self.export))
+
+    def test_replica_before_data_files(self):
+        shutil.copy(os.path.join(FIXTURES, PENDING_FILE), self.data_location)
+        self.assertEqual(sorted(task['uuid'] for task in self.reader.tasks()), sorted(task['uuid'] for task in self.export))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2015-2020 Óscar García Amor <ogarcia@connectical.com>
+#
+# Distributed under terms of the GNU GPLv3 license.
+
+from trellowarrior.taskqueue import SKIP_HOOKS_VARIABLE, TaskQueue
+
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import unittest
+
+def task_data(uuid, project):
+    return {'uuid': uuid, 'description': 'Task', 'project': project, 'status': 'pending'}
+
+class TestTaskQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.queue = TaskQueue(os.path.join(self.directory, 'cache', 'taskqueue'))
+        self.on_add, self.on_modify = self.queue.install_hooks(os.path.join(self.directory, 'hooks'), ['home', 'work'])
+        self.environ = {name: value for name, value in os.environ.items() if name != SKIP_HOOKS_VARIABLE}
+
+    def start_hook(self, hook, *tasks, environ=None):
+        process = subprocess.Popen([hook], stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=environ or self.environ)
+        process.stdin.write(''.join('{}\n'.format(json.dumps(task)) for task in tasks).encode('utf-8'))
+        process.stdin.close()
+        return process
+
+    def run_hook(self, hook, *tasks, environ=None):
+        process = self.start_hook(hook, *tasks, environ=environ)
+        output = process.stdout.read()
+        process.stdout.close()
+        self.assertEqual(process.wait(), 0)
+        return json.loads(output.decode('utf-8'))
+
+    def test_queue_tasks_of_projects(self):
+        self.assertEqual(self.run_hook(self.on_add, task_data('a', 'home.car'))['uuid'], 'a')
+        self.run_hook(self.on_modify, task_data('b', 'other'), task_data('b', 'work'))
+        self.run_hook(self.on_add, task_data('c', 'other'))
+        self.assertEqual(self.queue.drain(), {'home': {'a'}, 'work': {'b'}})
+        self.assertEqual(self.queue.drain(), {})
+
+    def test_skip_changes_of_sync(self):
+        self.run_hook(self.on_add, task_data('a', 'home'), environ=dict(self.environ, **{SKIP_HOOKS_VARIABLE: '1'}))
+        self.assertEqual(self.queue.drain(), {})
+
+    def test_put_back(self):
+        self.run_hook(self.on_add, task_data('a', 'home'))
+        queued = self.queue.drain()
+        self.queue.put_back(queued)
+        self.assertEqual(self.queue.drain(), {'home': {'a'}})
+
+    def test_hook_waits_while_draining(self):
+        self.run_hook(self.on_add, task_data('a', 'home'))
+        with self.queue._locked(os.O_RDWR) as queue_file:
+            process = self.start_hook(self.on_add, task_data('b', 'home'))
+            time.sleep(0.5)
+            self.assertIsNone(process.poll())
+            queue_file.truncate(0)
+        process.stdout.read()
+        process.stdout.close()
+        self.assertEqual(process.wait(), 0)
+        self.assertEqual(self.queue.drain(), {'home': {'b'}})
+
+if __name__ == '__main__':
+    unittest.main()
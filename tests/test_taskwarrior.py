@@ -0,0 +1,239 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2015-2020 Óscar García Amor <ogarcia@connectical.com>
+#
+# Distributed under terms of the GNU GPLv3 license.
+
+from trellowarrior.clients.taskwarrior import SerializedClient, TaskSnapshot, TaskwarriorClient, merge_changes
+from trellowarrior.stats import SyncStats
+from trellowarrior.taskqueue import SKIP_HOOKS_VARIABLE
+from tasklib.task import Task
+from unittest import mock
+
+import copy
+import json
+import os
+import shutil
+import stat
+import subprocess
+import tempfile
+import unittest
+
+def write_command(directory, script):
+    """
+    Write an executable stand-in of task command
+    """
+    path = os.path.join(directory, 'task')
+    with open(path, 'w') as command_file:
+        command_file.write('#!/bin/sh\n{}\n'.format(script))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR)
+    return path
+
+class TestSerializedClient(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.environ = os.environ.pop(SKIP_HOOKS_VARIABLE, None)
+        self.addCleanup(self.restore_environ)
+
+    def restore_environ(self):
+        os.environ.pop(SKIP_HOOKS_VARIABLE, None)
+        if self.environ is not None:
+            os.environ[SKIP_HOOKS_VARIABLE] = self.environ
+
+    def client(self, script):
+        return SerializedClient(data_location=os.path.join(self.directory, 'data'), version_override='2.6.2',
+                task_command=write_command(self.directory, script))
+
+    def test_skip_hooks_only_in_task_environment(self):
+        client = self.client('echo "${}"'.format(SKIP_HOOKS_VARIABLE))
+        self.assertEqual(client.execute_command(['export']), ['1'])
+        self.assertNotIn(SKIP_HOOKS_VARIABLE, os.environ)
+        output = subprocess.run(['sh', '-c', 'echo "${}"'.format(SKIP_HOOKS_VARIABLE)], stdout=subprocess.PIPE)
+        self.assertEqual(output.stdout, b'\n')
+
+    def test_failed_command(self):
+        client = self.client('echo "No matches." >&2; exit 1')
+        with self.assertRaisesRegex(Exception, 'No matches.'):
+            client.execute_command(['export'])
+        self.assertEqual(client.execute_command(['export'], allow_failure=False), [''])
+
+class TaskDatabase:
+    """
+    Stand-in of task export by UUID and task import over tasks in memory
+    """
+
+    def __init__(self, tasks_data):
+        self.tasks = {task_data['uuid']: task_data for task_data in tasks_data}
+        self.commands = []
+
+    def execute_command(self, args, **kwargs):
+        self.commands.append(args[0] if args[0] == 'import' else args[-1])
+        if args[0] == 'import':
+            with open(args[1]) as import_file:
+                for task_data in json.load(import_file):
+                    self.tasks[task_data['uuid']] = task_data
+            return ['']
+        return [json.dumps(self.tasks[task_uuid]) for task_uuid in args[:-1] if task_uuid in self.tasks]
+
+# Task as sync reads it
+TASK_DATA = {
+        'uuid': '11111111-1111-4111-8111-111111111111',
+        'description': 'Buy milk',
+        'entry': '20200913T122640Z',
+        'modified': '20200913T122820Z',
+        'project': 'home',
+        'status': 'pending',
+        'tags': ['shop'],
+        'annotations': [{'entry': '20200913T122730Z', 'description': 'first'}],
+        'trelloid': '5f5e0a0000000000000000a1'}
+
+class TestFlush(unittest.TestCase):
+
+    def setUp(self):
+        with mock.patch.object(SerializedClient, '_get_version', return_value='2.6.2'):
+            self.client = TaskwarriorClient('/nonexistent', tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.client.taskwarrior_client.overrides['data.location'])
+        self.database = TaskDatabase([copy.deepcopy(TASK_DATA)])
+        self.client.taskwarrior_client.execute_command = self.database.execute_command
+        self.task = Task(self.client.taskwarrior_client)
+        self.task._load_data(copy.deepcopy(TASK_DATA))
+
+    def edit_in_taskwarrior(self, **fields):
+        self.database.tasks[TASK_DATA['uuid']].update(fields, modified='20200913T123000Z')
+
+    def test_keep_changes_made_since_read(self):
+        self.edit_in_taskwarrior(priority='H', tags=['shop', 'urgent'],
+                annotations=TASK_DATA['annotations'] + [{'entry': '20200913T122900Z', 'description': 'second'}])
+        self.task['description'] = 'Buy oat milk'
+        self.client.add_annotation(self.task, 'third')
+        self.client.save_task(self.task)
+        self.client.flush()
+        self.assertEqual(self.database.commands, ['export', 'import'])
+        task_data = self.database.tasks[TASK_DATA['uuid']]
+        self.assertEqual(task_data['description'], 'Buy oat milk')
+        self.assertEqual(task_data['priority'], 'H')
+        self.assertEqual(task_data['tags'], ['shop', 'urgent'])
+        self.assertEqual([annotation['description'] for annotation in task_data['annotations']], ['first', 'second', 'third'])
+        self.assertEqual(self.task['priority'], 'H')
+
+    def test_removed_fields(self):
+        self.edit_in_taskwarrior(priority='H')
+        self.task['tags'] = set()
+        self.client.remove_annotation(self.task, self.task['annotations'][0])
+        self.client.complete_task(self.task)
+        self.client.flush()
+        task_data = self.database.tasks[TASK_DATA['uuid']]
+        self.assertEqual(task_data['status'], 'completed')
+        self.assertIn('end', task_data)
+        self.assertEqual(task_data['priority'], 'H')
+        self.assertNotIn('tags', task_data)
+        self.assertNotIn('annotations', task_data)
+
+    def test_new_task(self):
+        task = self.client.new_task()
+        task['description'] = 'New card'
+        task['project'] = 'home'
+        self.client.save_task(task)
+        self.client.flush()
+        task_data = self.database.tasks[task['uuid']]
+        self.assertEqual((task_data['description'], task_data['status']), ('New card', 'pending'))
+
+class TestStats(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        with mock.patch.object(SerializedClient, '_get_version', return_value='2.6.2'):
+            self.client = TaskwarriorClient('/nonexistent', self.directory)
+        self.client.taskwarrior_client.task_command = write_command(self.directory, 'echo')
+        self.stats = SyncStats('home')
+        self.client.stats = self.stats
+        self.addCleanup(setattr, self.client, 'stats', None)
+
+    def test_count_commands(self):
+        self.client.taskwarrior_client.execute_command(['export'])
+        self.assertEqual(self.stats.counters['taskwarrior_commands'], 1)
+        self.client.stats = None
+        self.client.taskwarrior_client.execute_command(['export'])
+        self.assertEqual(self.stats.counters['taskwarrior_commands'], 1)
+
+    def test_copy_task(self):
+        task = Task(self.client.taskwarrior_client)
+        task._load_data(copy.deepcopy(TASK_DATA))
+        task_copy = copy.deepcopy(task)
+        self.assertEqual(task_copy['description'], TASK_DATA['description'])
+        self.assertIs(self.client.stats, self.stats)
+
+class TestMergeChanges(unittest.TestCase):
+
+    def test_unchanged_task(self):
+        with mock.patch.object(SerializedClient, '_get_version', return_value='2.6.2'):
+            backend = SerializedClient(data_location=tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, backend.overrides['data.location'])
+        task = Task(backend)
+        task._load_data(copy.deepcopy(TASK_DATA))
+        current_data = dict(TASK_DATA, id=1, urgency=4.2, priority='L')
+        self.assertEqual(merge_changes(task, current_data), dict(TASK_DATA, priority='L'))
+
+class TestTaskSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.data_location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_location)
+        self.write_data('first')
+        self.tasks = {task_uuid: {'uuid': task_uuid, 'status': 'pending', 'project': project_name, 'description': 'Task'}
+                for task_uuid, project_name in [('a', 'home'), ('b', 'home.car'), ('c', 'work')]}
+        self.exports = []
+        self.snapshot = TaskSnapshot(['home', 'work'], self.data_location)
+
+    def write_data(self, line):
+        # Stand-in of Taskwarrior writing its data file
+        with open(os.path.join(self.data_location, 'pending.data'), 'a') as data_file:
+            data_file.write('{}\n'.format(line))
+
+    def export(self, args):
+        self.exports.append('snapshot' if args[0] == '(' else sorted(args))
+        return [dict(task_data) for task_uuid, task_data in self.tasks.items() if args[0] == '(' or task_uuid in args]
+
+    def project_uuids(self, project_name):
+        return sorted(task_data['uuid'] for task_data in self.snapshot.tasks(self.export, project_name))
+
+    def test_partitions(self):
+        self.assertEqual(self.project_uuids('home'), ['a', 'b'])
+        self.assertEqual(self.project_uuids('work'), ['c'])
+        self.assertEqual(self.exports, ['snapshot'])
+
+    def test_export_own_writes_again(self):
+        self.project_uuids('home')
+        self.snapshot.check_data()
+        self.tasks['c']['project'] = 'home'
+        self.write_data('own')
+        self.snapshot.invalidate(['c'])
+        self.assertEqual(self.project_uuids('home'), ['a', 'b', 'c'])
+        self.assertEqual(self.project_uuids('work'), [])
+        self.assertEqual(self.exports, ['snapshot', ['c']])
+
+    def test_take_again_when_data_changes(self):
+        self.project_uuids('home')
+        self.tasks['d'] = {'uuid': 'd', 'status': 'pending', 'project': 'work', 'description': 'Added with task'}
+        self.write_data('other')
+        self.assertEqual(self.project_uuids('work'), ['c', 'd'])
+        self.assertEqual(self.exports, ['snapshot', 'snapshot'])
+
+    def test_take_again_when_data_changes_before_own_writes(self):
+        self.project_uuids('home')
+        self.tasks['a']['description'] = 'Changed with task'
+        self.write_data('other')
+        self.snapshot.check_data()
+        self.write_data('own')
+        self.snapshot.invalidate(['b'])
+        descriptions = [task_data['description'] for task_data in self.snapshot.tasks(self.export, 'home') if task_data['uuid'] == 'a']
+        self.assertEqual(descriptions, ['Changed with task'])
+        self.assertEqual(self.exports, ['snapshot', 'snapshot'])
+
+if __name__ == '__main__':
+    unittest.main()
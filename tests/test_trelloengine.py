@@ -0,0 +1,76 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2015-2020 Óscar García Amor <ogarcia@connectical.com>
+#
+# Distributed under terms of the GNU GPLv3 license.
+
+from trellowarrior.clients.trelloengine import TrelloEngine
+
+import threading
+import time
+import unittest
+
+class TestTrelloEngine(unittest.TestCase):
+
+    def test_calls_with_same_key_in_order(self):
+        engine = TrelloEngine(concurrency=4)
+        calls = []
+        for number in range(5):
+            engine.submit('card', lambda number: calls.append(number) or number, number)
+        engine.run()
+        self.assertEqual(calls, [0, 1, 2, 3, 4])
+
+    def test_concurrency_limit(self):
+        engine = TrelloEngine(concurrency=3)
+        lock = threading.Lock()
+        running = []
+        maximum = []
+        def call():
+            with lock:
+                running.append(1)
+                maximum.append(len(running))
+            time.sleep(0.01)
+            with lock:
+                running.pop()
+        for number in range(12):
+            engine.submit(number, call)
+        engine.run()
+        self.assertEqual(len(maximum), 12)
+        self.assertLessEqual(max(maximum), 3)
+        self.assertGreater(max(maximum), 1)
+
+    def test_callbacks_in_submission_order(self):
+        engine = TrelloEngine()
+        results = []
+        for number in range(6):
+            engine.submit(number % 2, lambda number: time.sleep(0.001 * (6 - number)) or number, number,
+                    callback=results.append)
+        engine.run()
+        self.assertEqual(results, [0, 1, 2, 3, 4, 5])
+
+    def test_failed_call_skips_rest_of_key(self):
+        engine = TrelloEngine()
+        results = []
+        def fail():
+            raise ValueError('Trello said no')
+        engine.submit('a', lambda: 'a1', callback=results.append)
+        engine.submit('a', fail, callback=results.append)
+        skipped = engine.submit('a', lambda: 'a3', callback=results.append)
+        engine.submit('b', lambda: 'b1', callback=results.append)
+        with self.assertRaises(ValueError):
+            engine.run()
+        self.assertEqual(results, ['a1', 'b1'])
+        self.assertFalse(skipped.done)
+
+    def test_discard(self):
+        engine = TrelloEngine()
+        calls = []
+        engine.submit('card', calls.append, 1)
+        engine.discard()
+        engine.run()
+        self.assertEqual(calls, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2015-2020 Óscar García Amor <ogarcia@connectical.com>
+#
+# Distributed under terms of the GNU GPLv3 license.
+
+from trellowarrior.trellowarriorproject import TrelloWarriorProject
+from trellowarrior.webhook import WebhookApplication, webhook_signature
+
+import io
+import json
+import unittest
+
+API_SECRET = 'secret'
+CALLBACK_URL = 'https://example.com/trellowarrior'
+BOARD_ID = '5f5e0a0000000000000000f1'
+
+class TrelloClient:
+    """
+    Stand-in of Trello client, the application only needs board IDs
+    """
+
+    board_id = BOARD_ID
+
+    def project(self, project):
+        pass
+
+class TrelloWarriorClient:
+    """
+    Stand-in of TrelloWarrior client that records the syncs
+    """
+
+    def __init__(self):
+        self.trello_client = TrelloClient()
+        self.synced_cards = []
+
+    def sync_card(self, project, trello_card_id):
+        self.synced_cards.append((project.name, trello_card_id))
+
+class TestWebhookApplication(unittest.TestCase):
+
+    def setUp(self):
+        self.client = TrelloWarriorClient()
+        project = TrelloWarriorProject('work', 'work', 'Work')
+        self.application = WebhookApplication(self.client, [project], API_SECRET, CALLBACK_URL)
+
+    def post(self, payload, signature=None):
+        body = json.dumps(payload).encode('utf-8')
+        environ = {'REQUEST_METHOD': 'POST', 'PATH_INFO': '/', 'CONTENT_LENGTH': str(len(body)), 'wsgi.input': io.BytesIO(body)}
+        if signature is not None:
+            environ['HTTP_X_TRELLO_WEBHOOK'] = signature
+        statuses = []
+        self.application(environ, lambda status, headers: statuses.append(status))
+        return statuses[0]
+
+    def payload(self):
+        return {'model': {'id': BOARD_ID}, 'action': {'type': 'updateCard', 'data': {'card': {'id': 'card'}}}}
+
+    def run_worker(self):
+        self.application.start()
+        self.application.stop()
+
+    def test_signed_request(self):
+        body = json.dumps(self.payload()).encode('utf-8')
+        self.assertEqual(self.post(self.payload(), webhook_signature(API_SECRET, body, CALLBACK_URL)), '200 OK')
+        self.run_worker()
+        self.assertEqual(self.client.synced_cards, [('work', 'card')])
+
+    def test_reject_unsigned_request(self):
+        self.assertEqual(self.post(self.payload()), '401 Unauthorized')
+        self.run_worker()
+        self.assertEqual(self.client.synced_cards, [])
+
+    def test_reject_wrong_signature(self):
+        body = json.dumps(self.payload()).encode('utf-8')
+        signature = webhook_signature(API_SECRET, body, 'https://example.com/other')
+        self.assertEqual(self.post(self.payload(), signature), '401 Unauthorized')
+        self.run_worker()
+        self.assertEqual(self.client.synced_cards, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2015-2020 Óscar García Amor <ogarcia@connectical.com>
+#
+# Distributed under terms of the GNU GPLv3 license.
+
+from contextlib import contextmanager
+
+import copy
+import fcntl
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+class Cache:
+    """
+    Persistent key/value store in a JSON file, used to remember data between
+    runs (like Trello IDs) that is expensive to look up again
+
+    Several processes (like a listening webhook and a sync run by cron) can
+    share the file, it is read again when other process changes it and every
+    change is applied over the file as it is on disk, holding a file lock
+    """
+
+    def __init__(self, cache_file):
+        self.cache_file = cache_file
+        self._data = None
+        self._signature = None # Modification signature of the loaded file
+        self._lock = threading.RLock()
+
+    def _file_signature(self):
+        try:
+            file_stat = os.stat(self.cache_file)
+        except OSError:
+            return None
+        return file_stat.st_ino, file_stat.st_mtime_ns, file_stat.st_size
+
+    def _load(self):
+        signature = self._file_signature()
+        if self._data is None or signature != self._signature:
+            try:
+                with open(self.cache_file) as cache_file:
+                    self._data = json.load(cache_file)
+                logger.debug('Cache loaded from {}'.format(self.cache_file))
+            except FileNotFoundError:
+                self._data = {}
+            except ValueError:
+                logger.warning('Ignoring corrupted cache file {}'.format(self.cache_file))
+                self._data = {}
+            self._signature = signature
+        return self._data
+
+    @contextmanager
+    def _file_lock(self):
+        """
+        Hold the lock of cache file against other processes
+        """
+        os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+        with open('{}.lock'.format(self.cache_file), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX) # Released when file is closed
+            yield
+
+    def get(self, key, default=None):
+        """
+        Get a value from cache
+
+        :param key: key of value
+        :param default: value to return if key is not cached (None by default)
+        :return: a copy of the cached value, so other threads can change the cache meanwhile
+        """
+        with self._lock:
+            return copy.deepcopy(self._load().get(key, default))
+
+    def change(self, change):
+        """
+        Apply a change to the cache as it is on disk and save it, so changes
+        made meanwhile by other processes are kept
+
+        :param change: function that changes the cache data dict in place
+        """
+        with self._lock, self._file_lock():
+            data = copy.deepcopy(self._load()) # Cache is left as it was if change fails
+            change(data)
+            self._data = data
+            self.save()
+
+    def set(self, key, value):
+        """
+        Set a value in cache and save it to disk
+
+        :param key: key of value
+        :param value: a JSON serializable value
+        """
+        self.change(lambda data: data.__setitem__(key, value))
+
+    def update(self, key, values):
+        """
+        Update a dict value in cache with the given items and save it to disk,
+        safe to use from several threads and processes sharing the cache
+
+        :param key: key of dict value
+        :param values: dict with the items to add or replace
+        """
+        self.change(lambda data: data.setdefault(key, {}).update(values))
+
+    def save(self):
+        """
+        Save cache to disk, writing a new file to avoid corruption if fails
+        (use it through change to not overwrite changes of other processes)
+        """
+        with self._lock:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            temporary_cache_file = '{}.tmp'.format(self.cache_file)
+            with open(temporary_cache_file, 'w') as cache_file:
+                json.dump(self._load(), cache_file)
+            os.replace(temporary_cache_file, self.cache_file)
+            self._signature = self._file_signature()
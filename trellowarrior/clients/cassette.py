@@ -0,0 +1,184 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2015-2020 Óscar García Amor <ogarcia@connectical.com>
+#
+# Distributed under terms of the GNU GPLv3 license.
+
+from urllib.parse import parse_qsl, urlsplit
+
+import gzip
+import json
+import logging
+import os
+import requests
+import shutil
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Query parameters with credentials, never stored
+SECRET_PARAMS = ['key', 'token']
+# Placeholder of scrubbed credentials
+SCRUBBED = 'SCRUBBED'
+
+def cassette_cache_location(cassette_file):
+    """
+    Get where the cache used by a recorded sync is stored
+
+    :param cassette_file: cassette path
+    :return: cache directory path
+    :rtype: string
+    """
+    return '{}.cache'.format(cassette_file)
+
+class Cassette:
+    """
+    Trello requests and responses of a sync stored in a gzipped JSON lines
+    file, without credentials, to replay the sync later without network
+
+    Recording and replaying replace the HTTP session of request schedulers,
+    so rate limits and retries work as usual
+    """
+
+    def __init__(self, cassette_file, secrets=None):
+        self.cassette_file = cassette_file
+        self.secrets = [secret for secret in secrets or [] if secret]
+        self._lock = threading.Lock()
+
+    def scrub(self, text):
+        """
+        Replace credentials in a text
+
+        :param text: any text
+        :return: text without credentials
+        :rtype: string
+        """
+        for secret in self.secrets:
+            text = text.replace(secret, SCRUBBED)
+        return text
+
+    def request_key(self, method, url, params=None, data=None):
+        """
+        Get the key that identifies a request, the same in record and replay
+        whatever the Trello API URL
+
+        :return: request key
+        :rtype: string
+        """
+        url = urlsplit(url)
+        query = parse_qsl(url.query) + list((params or {}).items())
+        query = sorted((name, str(value)) for name, value in query if name not in SECRET_PARAMS)
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        return self.scrub(json.dumps([method, url.path.split('/1/', 1)[-1], query, data]))
+
+class CassetteRecorder(Cassette):
+    """
+    Record the requests sent through real HTTP sessions
+    """
+
+    def __init__(self, cassette_file, secrets=None, cache_location=None):
+        super().__init__(cassette_file, secrets)
+        if cache_location is not None:
+            # Keep the cache as it was before sync, it decides which requests are made
+            shutil.rmtree(cassette_cache_location(cassette_file), ignore_errors=True)
+            if os.path.isdir(cache_location):
+                shutil.copytree(cache_location, cassette_cache_location(cassette_file))
+        self._file = gzip.open(cassette_file, 'wt', encoding='utf-8')
+        self.interactions = 0
+
+    def install(self, scheduler):
+        """
+        Record the requests of a request scheduler
+
+        :param scheduler: RequestScheduler object
+        """
+        scheduler.http_service = RecordingSession(self, scheduler.http_service)
+
+    def record(self, method, url, params, data, response, seconds):
+        interaction = {
+                'request': self.request_key(method, url, params, data),
+                'status': response.status_code,
+                'content_type': response.headers.get('Content-Type'),
+                'content': self.scrub(response.content.decode('utf-8', errors='replace')),
+                'seconds': round(seconds, 3)}
+        with self._lock:
+            self._file.write('{}\n'.format(json.dumps(interaction)))
+            self.interactions += 1
+
+    def close(self):
+        self._file.close()
+        logger.info('Recorded {} Trello requests in {}'.format(self.interactions, self.cassette_file))
+
+class RecordingSession:
+    """
+    HTTP session that records every answered request
+    """
+
+    def __init__(self, recorder, http_service):
+        self.recorder = recorder
+        self.http_service = http_service
+
+    def request(self, method, url, params=None, data=None, **kwargs):
+        start = time.perf_counter()
+        response = self.http_service.request(method, url, params=params, data=data, **kwargs)
+        self.recorder.record(method, url, params, data, response, time.perf_counter() - start)
+        return response
+
+class CassettePlayer(Cassette):
+    """
+    Answer requests with the responses of a cassette, in recording order for
+    requests made several times (repeating the last answer if there are more
+    requests than recorded)
+    """
+
+    def __init__(self, cassette_file, secrets=None, latency=0):
+        super().__init__(cassette_file, secrets)
+        self.latency = latency
+        self._interactions = {}
+        with gzip.open(cassette_file, 'rt', encoding='utf-8') as cassette:
+            for line in cassette:
+                interaction = json.loads(line)
+                self._interactions.setdefault(interaction['request'], []).append(interaction)
+        self.missed = 0
+
+    def install(self, scheduler):
+        """
+        Answer the requests of a request scheduler from the cassette
+
+        :param scheduler: RequestScheduler object
+        """
+        scheduler.http_service = self
+
+    def request(self, method, url, params=None, data=None, **kwargs):
+        key = self.request_key(method, url, params, data)
+        with self._lock:
+            interactions = self._interactions.get(key)
+            if interactions:
+                interaction = interactions.pop(0) if len(interactions) > 1 else interactions[0]
+            else:
+                interaction = None
+                self.missed += 1
+        if self.latency:
+            time.sleep(self.latency)
+        response = requests.Response()
+        response.url = url
+        response.request = requests.Request(method, url, params=params, data=data).prepare()
+        response.encoding = 'utf-8'
+        if interaction is None:
+            logger.warning('Trello request {} {} not found in cassette'.format(method, response.request.path_url.split('?')[0]))
+            response.status_code = 404
+            response._content = b'Request not recorded in cassette'
+            return response
+        response.status_code = interaction['status']
+        response._content = interaction['content'].encode('utf-8')
+        if interaction['content_type'] is not None:
+            response.headers['Content-Type'] = interaction['content_type']
+        return response
+
+    def close(self):
+        if self.missed:
+            logger.warning('{} Trello requests were not found in cassette {}, sync was not the recorded one'.format(self.missed, self.cassette_file))
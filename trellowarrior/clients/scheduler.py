@@ -0,0 +1,198 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2015-2020 Óscar García Amor <ogarcia@connectical.com>
+#
+# Distributed under terms of the GNU GPLv3 license.
+
+from trellowarrior.stats import endpoint
+
+import hashlib
+import logging
+import random
+import requests
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Base URL of all requests made by py-trello
+TRELLO_API_URL = 'https://api.trello.com/1/'
+# Default number of connections kept open with Trello
+TRELLO_POOL_SIZE = 10
+# Trello allows 300 requests per 10 seconds for each API key
+API_KEY_LIMIT = (300, 10)
+# Trello allows 100 requests per 10 seconds for each token
+TOKEN_LIMIT = (100, 10)
+# Methods that can be sent again safely if the request fails
+IDEMPOTENT_METHODS = ['GET', 'HEAD', 'PUT', 'DELETE']
+# Server errors that are worth a retry
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+# Maximum number of retries for a single request
+MAX_RETRIES = 5
+# Backoff delay for first retry (doubled on every retry) and maximum delay
+BACKOFF_BASE = 1
+BACKOFF_MAX = 60
+
+class TokenBucket:
+    """
+    Thread safe token bucket that allows bursts of up to capacity requests
+    and refills at capacity/period requests per second
+    """
+
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """
+        Take a token from the bucket, waiting until there is one available
+
+        :return: seconds waited
+        :rtype: float
+        """
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def pause(self, seconds):
+        """
+        Empty the bucket so nobody can take a token in the next seconds
+
+        :param seconds: seconds to wait
+        """
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+# Buckets are shared by all schedulers of the process since limits are per key and per token
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+def get_bucket(name, limit):
+    """
+    Get the shared bucket for a given name creating it if needed
+
+    :param name: bucket name
+    :param limit: tuple with number of requests and period in seconds
+    :return: token bucket
+    :rtype: TokenBucket
+    """
+    with _buckets_lock:
+        if name not in _buckets:
+            _buckets[name] = TokenBucket(*limit)
+        return _buckets[name]
+
+def retry_after(response):
+    """
+    Get the seconds to wait from the Retry-After header of a response
+
+    :param response: HTTP response
+    :return: seconds to wait or None if response does not say it
+    :rtype: float
+    """
+    try:
+        return max(0, float(response.headers.get('Retry-After')))
+    except (TypeError, ValueError):
+        return None
+
+class RequestScheduler:
+    """
+    HTTP service for py-trello that sends every request through the Trello
+    rate limits of its API key and token, and retries failed requests with
+    jittered exponential backoff
+
+    Requests share a session that keeps connections (and their TLS
+    sessions) alive and accepts compressed answers
+    """
+
+    def __init__(self, api_key, token, api_url=TRELLO_API_URL, pool_size=TRELLO_POOL_SIZE):
+        self.api_url = api_url if api_url.endswith('/') else '{}/'.format(api_url)
+        self.http_service = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.http_service.mount('https://', adapter)
+        self.http_service.mount('http://', adapter)
+        self.http_service.headers['Accept-Encoding'] = 'gzip, deflate'
+        self._buckets = [
+                get_bucket('key:{}'.format(hashlib.sha1(str(api_key).encode('utf-8')).hexdigest()), API_KEY_LIMIT),
+                get_bucket('token:{}'.format(hashlib.sha1(str(token).encode('utf-8')).hexdigest()), TOKEN_LIMIT)]
+        self._counters_lock = threading.Lock()
+        self.counters = {'requests': 0, 'retries': 0, 'throttled_seconds': 0.0}
+        self.stats = None # Stats of running sync, if any
+
+    def _count(self, counter, value=1):
+        with self._counters_lock:
+            self.counters[counter] += value
+        stats = self.stats
+        if stats is not None:
+            stats.count('trello_{}'.format(counter), value)
+
+    def _throttle(self):
+        for bucket in self._buckets:
+            self._count('throttled_seconds', bucket.acquire())
+
+    def _backoff(self, attempt, seconds=None):
+        if seconds is None:
+            seconds = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.5)
+        self._count('retries')
+        self._count('throttled_seconds', seconds)
+        time.sleep(seconds)
+
+    def request(self, method, url, **kwargs):
+        """
+        Send a request when the rate limits allow it, retrying it if fails
+
+        :param method: HTTP method
+        :param url: request URL
+        :param kwargs: rest of arguments for requests
+        :return: HTTP response
+        """
+        request_endpoint = endpoint(method, url, TRELLO_API_URL)
+        if self.api_url != TRELLO_API_URL and url.startswith(TRELLO_API_URL):
+            # Send requests to another Trello API compatible server
+            url = '{}{}'.format(self.api_url, url[len(TRELLO_API_URL):])
+        attempt = 0
+        while True:
+            self._throttle()
+            self._count('requests')
+            request_start = time.perf_counter()
+            try:
+                response = self.http_service.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if method not in IDEMPOTENT_METHODS or attempt >= MAX_RETRIES:
+                    raise
+                logger.debug('Trello request {} {} failed ({}), retrying'.format(method, url, e))
+                self._backoff(attempt)
+                attempt += 1
+                continue
+            stats = self.stats
+            if stats is not None:
+                stats.trello_response(request_endpoint, response, time.perf_counter() - request_start)
+            # Trello does not process rate limited requests so those can be retried with any method
+            if response.status_code not in RETRY_STATUS_CODES or attempt >= MAX_RETRIES or \
+                    (response.status_code != 429 and method not in IDEMPOTENT_METHODS):
+                return response
+            seconds = retry_after(response)
+            if response.status_code == 429:
+                logger.warning('Trello rate limit exceeded, waiting to retry')
+                if seconds is not None:
+                    # Stop all requests that share the limits, not only this one
+                    for bucket in self._buckets:
+                        bucket.pause(seconds)
+                    seconds = 0
+            logger.debug('Trello request {} {} returned {}, retrying'.format(method, url, response.status_code))
+            self._backoff(attempt, seconds)
+            attempt += 1
@@ -0,0 +1,237 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2015-2020 Óscar García Amor <ogarcia@connectical.com>
+#
+# Distributed under terms of the GNU GPLv3 license.
+
+import datetime
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Ways of reading Taskwarrior tasks: task export, data files or both comparing them
+TASKWARRIOR_READERS = ['task', 'direct', 'verify']
+# Data files of Taskwarrior 2 (one task per line) and replica of Taskwarrior 3
+PENDING_FILE = 'pending.data'
+COMPLETED_FILE = 'completed.data'
+REPLICA_FILE = 'taskchampion.sqlite3'
+# Taskwarrior attributes stored as epoch and exported as dates
+DATE_ATTRIBUTES = ['entry', 'start', 'end', 'due', 'until', 'wait', 'scheduled', 'modified']
+# Taskwarrior attributes stored as text and exported as numbers
+NUMERIC_ATTRIBUTES = ['imask']
+# Statuses of tasks that have an ID
+WORKING_STATUSES = ['pending', 'waiting', 'recurring']
+# Attributes of a line of Taskwarrior 2 data files like [description:"Buy milk" status:"pending"]
+ATTRIBUTE_REGEX = re.compile(r'([^\s:\[\]"]+):"((?:[^"\\]|\\.)*)"')
+# Entities of characters that Taskwarrior 2 cannot store as they are
+ENTITIES = {'&open;': '[', '&close;': ']', '&dquot;': '"'}
+
+def data_signature(data_location):
+    """
+    Get a signature of Taskwarrior data that changes when any task changes
+
+    :param data_location: Taskwarrior data directory
+    :return: inode, modification time and size of every data file that exists
+    :rtype: list
+    """
+    signature = []
+    for file_name in [PENDING_FILE, COMPLETED_FILE, REPLICA_FILE, '{}-wal'.format(REPLICA_FILE)]:
+        try:
+            file_stat = os.stat(os.path.join(os.path.expanduser(data_location), file_name))
+        except OSError:
+            continue
+        signature.append((file_name, file_stat.st_ino, file_stat.st_mtime_ns, file_stat.st_size))
+    return signature
+
+def epoch_date(epoch):
+    return datetime.datetime.fromtimestamp(int(epoch), datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+def decode_value(raw_value):
+    """
+    Decode a value of a Taskwarrior 2 data file
+
+    :param raw_value: value as stored between quotes
+    :return: decoded value
+    :rtype: string
+    """
+    if '\\' in raw_value:
+        try:
+            raw_value = json.loads('"{}"'.format(raw_value))
+        except ValueError:
+            pass
+    if '&' in raw_value:
+        for entity, character in ENTITIES.items():
+            raw_value = raw_value.replace(entity, character)
+    return raw_value
+
+def parse_line(line):
+    """
+    Parse a line of a Taskwarrior 2 data file
+
+    :param line: file line
+    :return: task attributes as stored
+    :rtype: dict
+    """
+    return {name: decode_value(value) for name, value in ATTRIBUTE_REGEX.findall(line)}
+
+class TaskDataReader:
+    """
+    Read only access to Taskwarrior data without running task, loading all
+    tasks in memory in the same format that task export has
+
+    Files are parsed again only when they change
+    """
+
+    def __init__(self, data_location, backend):
+        self.data_location = os.path.expanduser(data_location)
+        self.backend = backend # To get the UDAs types from Taskwarrior config
+        self._uda_types = None
+        self._files = {} # Path to modification signature and tasks data
+        self._lock = threading.Lock()
+
+    def uda_types(self):
+        if self._uda_types is None:
+            self._uda_types = {key[4:-5]: value for key, value in self.backend.config.items()
+                    if key.startswith('uda.') and key.endswith('.type')}
+        return self._uda_types
+
+    def export_data(self, attributes, task_id=0):
+        """
+        Convert the attributes of a task as stored to task export format
+
+        :param attributes: task attributes as stored
+        :param task_id: task ID (0 if task has no ID)
+        :return: task data
+        :rtype: dict
+        """
+        uda_types = self.uda_types()
+        data = {'id': task_id}
+        tags, annotations, depends = [], [], []
+        for name, value in attributes.items():
+            if name.startswith('tag_'):
+                tags.append(name[4:])
+            elif name.startswith('annotation_'):
+                annotations.append({'entry': epoch_date(name[11:]), 'description': value})
+            elif name.startswith('dep_'):
+                depends.append(name[4:])
+            elif value == '':
+                continue
+            elif name == 'tags':
+                tags.extend(value.split(','))
+            elif name == 'depends':
+                depends.extend(value.split(','))
+            elif name in DATE_ATTRIBUTES or uda_types.get(name) == 'date':
+                data[name] = epoch_date(value)
+            elif name in NUMERIC_ATTRIBUTES or uda_types.get(name) == 'numeric':
+                number = float(value)
+                data[name] = int(number) if number.is_integer() else number
+            else:
+                data[name] = value
+        if tags:
+            data['tags'] = tags
+        if annotations:
+            data['annotations'] = sorted(annotations, key=lambda annotation: annotation['entry'])
+        if depends:
+            data['depends'] = depends
+        return data
+
+    def _load(self, path, parse):
+        """
+        Get the tasks of a file, parsing it if changed since last load
+        """
+        try:
+            signature = [(os.stat(file_path).st_mtime_ns, os.stat(file_path).st_size)
+                    for file_path in [path, '{}-wal'.format(path)] if os.path.exists(file_path)]
+        except OSError:
+            signature = []
+        if not signature:
+            return []
+        loaded = self._files.get(path)
+        if loaded is None or loaded[0] != signature:
+            loaded = (signature, parse(path))
+            self._files[path] = loaded
+        return loaded[1]
+
+    def _parse_data_file(self, path):
+        tasks = []
+        working_id = 0
+        with open(path, encoding='utf-8') as data_file:
+            for line in data_file:
+                attributes = parse_line(line)
+                if not attributes:
+                    continue
+                task_id = 0
+                if path.endswith(PENDING_FILE) and attributes.get('status') in WORKING_STATUSES:
+                    working_id += 1
+                    task_id = working_id
+                tasks.append(self.export_data(attributes, task_id))
+        return tasks
+
+    def _parse_replica(self, path):
+        connection = sqlite3.connect('file:{}?mode=ro'.format(path), uri=True)
+        try:
+            working_set = {uuid: task_id for task_id, uuid in connection.execute('SELECT id, uuid FROM working_set WHERE uuid IS NOT NULL')}
+            tasks = []
+            for uuid, attributes in connection.execute('SELECT uuid, data FROM tasks'):
+                attributes = dict(json.loads(attributes), uuid=uuid)
+                tasks.append(self.export_data(attributes, working_set.get(uuid, 0)))
+            return tasks
+        finally:
+            connection.close()
+
+    def tasks(self):
+        """
+        Get all Taskwarrior tasks
+
+        :return: a list of tasks data like task export gives
+        :rtype: list
+        """
+        with self._lock:
+            replica = os.path.join(self.data_location, REPLICA_FILE)
+            if os.path.exists(replica):
+                return self._load(replica, self._parse_replica)
+            return self._load(os.path.join(self.data_location, PENDING_FILE), self._parse_data_file) + \
+                    self._load(os.path.join(self.data_location, COMPLETED_FILE), self._parse_data_file)
+
+def compare_tasks(query, read_tasks, exported_tasks):
+    """
+    Compare the tasks read from data files with the exported ones, logging the
+    differences
+
+    :param query: description of the query that got the tasks
+    :param read_tasks: list of Taskwarrior tasks objects read from data files
+    :param exported_tasks: list of Taskwarrior tasks objects exported by task
+    :return: True if both have the same tasks with the same data
+    :rtype: boolean
+    """
+    def comparable(task):
+        data = json.loads(task.export_data())
+        for field in ['id', 'urgency']: # Calculated by Taskwarrior
+            data.pop(field, None)
+        for field in ['tags', 'depends']:
+            if field in data:
+                data[field] = sorted(data[field].split(',') if isinstance(data[field], str) else data[field])
+        return data
+    read_tasks = {task['uuid']: comparable(task) for task in read_tasks}
+    exported_tasks = {task['uuid']: comparable(task) for task in exported_tasks}
+    equal = True
+    for uuid in read_tasks.keys() - exported_tasks.keys():
+        logger.warning('Taskwarrior reader verification: {} got task {} that task export does not'.format(query, uuid))
+        equal = False
+    for uuid in exported_tasks.keys() - read_tasks.keys():
+        logger.warning('Taskwarrior reader verification: {} missed task {}'.format(query, uuid))
+        equal = False
+    for uuid in read_tasks.keys() & exported_tasks.keys():
+        if read_tasks[uuid] != exported_tasks[uuid]:
+            fields = sorted(field for field in read_tasks[uuid].keys() | exported_tasks[uuid].keys()
+                    if read_tasks[uuid].get(field) != exported_tasks[uuid].get(field))
+            logger.warning('Taskwarrior reader verification: {} read task {} with different {}'.format(query, uuid, ', '.join(fields)))
+            equal = False
+    return equal
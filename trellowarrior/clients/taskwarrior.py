@@ -6,14 +6,306 @@
 #
 # Distributed under terms of the GNU GPLv3 license.
 
+from trellowarrior.clients.taskfiles import TaskDataReader, compare_tasks, data_signature
 from trellowarrior.exceptions import ClientError
-from tasklib.backends import TaskWarrior as Client
-from tasklib.task import Task
+from trellowarrior.stats import instrument
+from trellowarrior.taskqueue import SKIP_HOOKS_VARIABLE
+from tasklib.backends import TaskWarrior as Client, TaskWarriorException
+from tasklib.task import Task, TaskAnnotation
 
+import datetime
+import json
+import logging
+import os
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Taskwarrior commands of all clients (one per sync thread) run one by one,
+# a client can hold it to run some commands without others in between
+taskwarrior_lock = threading.RLock()
+# Stats of the sync running in every thread, if any, where the task commands
+# that the thread runs are recorded (backends are copied with every task
+# copy, so they cannot keep them)
+running_stats = threading.local()
+# Maximum number of changed tasks exported again by UUID, with more the whole snapshot is taken again
+SNAPSHOT_MAX_STALE = 200
+# Task fields holding lists, merged item by item when writing sync changes
+LIST_FIELDS = ['tags', 'depends', 'annotations']
+
+def import_data(task, data):
+    """
+    Serialize task data (current or original data of a task object) as task
+    import expects it
+
+    :param task: Taskwarrior task object
+    :param data: task data to serialize
+    :return: task data without empty fields and with lists instead of comma separated values
+    :rtype: dict
+    """
+    serialized = {}
+    for field, value in data.items():
+        value = task._serialize(field, value)
+        if value in ['', None, []]:
+            continue
+        if field in ['tags', 'depends'] and isinstance(value, str):
+            value = value.split(',')
+        serialized[field] = value
+    return serialized
+
+def merge_changes(task, current_data):
+    """
+    Apply the changes that sync made in a task over the data of the task as
+    it is now in Taskwarrior, so changes made by others since the task was
+    read are kept. Lists (tags, dependencies and annotations) are merged
+    adding and removing only the items that sync added or removed
+
+    :param task: Taskwarrior task object changed by sync
+    :param current_data: task data as task export gives it now
+    :return: task data to import
+    :rtype: dict
+    """
+    original = import_data(task, task._original_data)
+    changed = import_data(task, task._data)
+    merged = {field: value for field, value in current_data.items() if field not in ['id', 'urgency']}
+    for field in changed.keys() | original.keys():
+        if changed.get(field) == original.get(field):
+            continue
+        if field in LIST_FIELDS:
+            added = [item for item in changed.get(field, []) if item not in original.get(field, [])]
+            removed = [item for item in original.get(field, []) if item not in changed.get(field, [])]
+            items = [item for item in merged.get(field, []) if item not in removed]
+            items.extend(item for item in added if item not in items)
+            if items:
+                merged[field] = items
+            else:
+                merged.pop(field, None)
+        elif field in changed:
+            merged[field] = changed[field]
+        else:
+            merged.pop(field, None)
+    return merged
+
+class SerializedClient(Client):
+    """
+    Taskwarrior backend that never runs two task commands at the same time
+    to avoid contention over the Taskwarrior data lock
+    """
+
+    def execute_command(self, *args, **kwargs):
+        with taskwarrior_lock:
+            stats = getattr(running_stats, 'stats', None)
+            if stats is None:
+                return self._run_command(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return self._run_command(*args, **kwargs)
+            finally:
+                stats.count('taskwarrior_commands')
+                stats.count('taskwarrior_seconds', time.perf_counter() - start)
+
+    def _run_command(self, args, config_override=None, allow_failure=True, return_all=False):
+        """
+        Run a task command like tasklib does, but marking its environment so
+        TrelloWarrior hooks do not queue the changes of sync. Only the task
+        process gets the variable, the environment of TrelloWarrior and of
+        other processes that it runs is not changed
+        """
+        command_args = self._get_command_args(args, config_override=config_override)
+        logger.debug(' '.join(command_args))
+        env = dict(os.environ, **{SKIP_HOOKS_VARIABLE: '1'})
+        if self.taskrc_location:
+            env['TASKRC'] = self.taskrc_location
+        process = subprocess.Popen(command_args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+        stdout, stderr = [output.decode('utf-8') for output in process.communicate()]
+        if process.returncode and allow_failure:
+            error_message = stderr.strip() if stderr.strip() else stdout.strip()
+            raise TaskWarriorException('{}\nCommand used: {}'.format(error_message, ' '.join(command_args)))
+        if return_all:
+            return stdout.rstrip().split('\n'), stderr.rstrip().split('\n'), process.returncode
+        return stdout.rstrip().split('\n')
+
+class TaskSnapshot:
+    """
+    Tasks of all synchronized projects (and every task with a Trello ID)
+    exported once per run and shared by the clients of all projects, with
+    the tasks of every project partitioned by Taskwarrior project name
+
+    Clients mark the tasks that they write, only those are exported again
+    on next read. Any other change of Taskwarrior data (made with task, by
+    hooks or by other TrelloWarrior processes) is seen in the data files and
+    takes the whole snapshot again
+    """
+
+    def __init__(self, projects_names, data_location):
+        self.projects_names = projects_names
+        self.data_location = data_location
+        self._tasks = None # Tasks data by UUID
+        self._partitions = {project_name: set() for project_name in projects_names} # Tasks UUIDs by project
+        self._stale = set()
+        self._data_signature = None # Data files signature when snapshot was up to date
+        self._lock = threading.Lock()
+
+    def filter_args(self):
+        args = ['(']
+        for project_name in self.projects_names:
+            args.extend(['project:\'{}\''.format(project_name), 'or'])
+        # Deleted tasks matter only while they have a Trello ID
+        return args + ['trelloid.any:', ')', '(', 'status.not:deleted', 'or', 'trelloid.any:', ')']
+
+    def _store(self, task_data):
+        if task_data['status'] == 'deleted' and not task_data.get('trelloid'):
+            self._remove(task_data['uuid'])
+            return
+        self._tasks[task_data['uuid']] = task_data
+        for project_name, uuids in self._partitions.items():
+            # Taskwarrior matches projects from the left, so parent projects include their subprojects
+            if task_data.get('project', '').startswith(project_name):
+                uuids.add(task_data['uuid'])
+            else:
+                uuids.discard(task_data['uuid'])
+
+    def _remove(self, uuid):
+        self._tasks.pop(uuid, None)
+        for uuids in self._partitions.values():
+            uuids.discard(uuid)
+
+    def check_data(self):
+        """
+        Drop the snapshot if Taskwarrior data changed since it was taken,
+        must be called before writing tasks with the Taskwarrior commands
+        lock held, so the writes of a client are not taken as other changes
+        """
+        with self._lock:
+            self._check_data()
+
+    def _check_data(self):
+        if self._tasks is not None and data_signature(self.data_location) != self._data_signature:
+            logger.debug('Taskwarrior data changed, taking snapshot again')
+            self._tasks = None
+            for uuids in self._partitions.values():
+                uuids.clear()
+
+    def invalidate(self, uuids):
+        """
+        Mark some tasks as written, to export them again on next read, must be
+        called after writing them with the Taskwarrior commands lock held
+
+        :param uuids: tasks UUIDs
+        """
+        with self._lock:
+            self._stale.update(uuids)
+            self._data_signature = data_signature(self.data_location)
+
+    def tasks(self, export, project_name=None):
+        """
+        Get the tasks of a project, or all tasks, exporting them first if
+        needed
+
+        :param export: function that exports tasks data given a filter
+        :param project_name: Taskwarrior project name (None for all tasks)
+        :return: a list of tasks data like task export gives
+        :rtype: list
+        """
+        # Same locks order than clients writing tasks
+        with taskwarrior_lock, self._lock:
+            self._check_data()
+            if self._tasks is not None and len(self._stale) > SNAPSHOT_MAX_STALE:
+                # A single export with the snapshot filter is cheaper than filtering by so many UUIDs
+                logger.debug('{} Taskwarrior tasks changed, taking snapshot again'.format(len(self._stale)))
+                self._tasks = None
+                for uuids in self._partitions.values():
+                    uuids.clear()
+            if self._tasks is None:
+                self._tasks = {}
+                for task_data in export(self.filter_args()):
+                    self._store(task_data)
+                # Taken after export, that can write data files itself (like garbage collection)
+                self._data_signature = data_signature(self.data_location)
+                self._stale = set()
+                logger.debug('Taskwarrior snapshot of {} tasks taken'.format(len(self._tasks)))
+            elif self._stale:
+                exported_tasks = {task_data['uuid']: task_data for task_data in export(sorted(self._stale))}
+                for uuid in self._stale:
+                    if uuid in exported_tasks:
+                        self._store(exported_tasks[uuid])
+                    else:
+                        self._remove(uuid)
+                self._stale = set()
+                self._data_signature = data_signature(self.data_location)
+            if project_name is None:
+                return list(self._tasks.values())
+            return [self._tasks[uuid] for uuid in self._partitions[project_name]]
+
+class ProjectView:
+    """
+    All tasks of a Taskwarrior project (of any status, but deleted ones only
+    while they have a Trello ID) loaded with a single query, with the fields
+    that sync compares at hand and Taskwarrior task objects created only for
+    the tasks that are used
+    """
+
+    def __init__(self, backend, tasks_data):
+        self.backend = backend
+        self.tasks_data = tasks_data
+
+    def trello_ids(self, statuses=None):
+        """
+        Get the Trello IDs of the tasks with some statuses
+
+        :param statuses: tasks statuses (None by default, pending and completed)
+        :return: a set of Trello IDs (with None if some task has no Trello ID)
+        :rtype: set
+        """
+        if statuses is None:
+            statuses = ['pending', 'completed']
+        return set(task_data.get('trelloid') for task_data in self.tasks_data if task_data['status'] in statuses)
+
+    def tasks(self, status, trelloid=None):
+        """
+        Get the tasks with a status and a Trello ID
+
+        :param status: task status
+        :param trelloid: Trello ID (None by default, tasks never uploaded to Trello)
+        :return: a list of Taskwarrior tasks objects
+        :rtype: list
+        """
+        tasks = []
+        for task_data in self.tasks_data:
+            if task_data['status'] == status and task_data.get('trelloid') == trelloid:
+                task = Task(self.backend)
+                task._load_data(task_data)
+                tasks.append(task)
+        return tasks
+
+@instrument
 class TaskwarriorClient:
-    def __init__(self, taskrc_location, data_location):
-        self.taskwarrior_client = Client(taskrc_location=taskrc_location, data_location=data_location)
+    def __init__(self, taskrc_location, data_location, reader='task'):
+        self.taskwarrior_client = SerializedClient(taskrc_location=taskrc_location, data_location=data_location)
+        # Read tasks from data files instead of exporting them (and compare both in verify mode)
+        self.reader = TaskDataReader(data_location, self.taskwarrior_client) if reader in ['direct', 'verify'] else None
+        self.verify_reader = reader == 'verify'
+        self.snapshot = None # Tasks shared with clients of other projects, if any
+        self._project_view = None
         self._project = None
+        self._tasks_by_trello_id = None
+        self._duplicated_trello_ids = None
+        self._tasks_to_import = {}
+        self._stats = None # Stats of running sync, if any
+
+    @property
+    def stats(self):
+        return self._stats
+
+    @stats.setter
+    def stats(self, stats):
+        # Task commands of the thread that attaches the stats (the one running the sync) are recorded too
+        self._stats = stats
+        running_stats.stats = stats
 
     def project(self, project):
         """
@@ -22,6 +314,8 @@ class TaskwarriorClient:
         :param project: TelloWarrior project object
         """
         self._project = project.taskwarrior_project_name
+        self._tasks_by_trello_id = None # Index must be reloaded for new project
+        self._project_view = None
 
     def new_task(self):
         """
@@ -32,6 +326,201 @@ class TaskwarriorClient:
         """
         return Task(self.taskwarrior_client)
 
+    def save_task(self, task):
+        """
+        Queue a task to be written in Taskwarrior on next flush
+        New tasks get their UUID here so they can be imported
+
+        :param task: Taskwarrior task object
+        """
+        if task['uuid'] is None:
+            # UUID and entry are read only fields, set them in raw data
+            task._data['uuid'] = str(uuid.uuid4())
+            task._data['entry'] = self._now()
+        if task['status'] is None:
+            task['status'] = 'pending'
+        self._tasks_to_import[task['uuid']] = task
+
+    def start_task(self, task):
+        """
+        Start a task (queued until next flush)
+
+        :param task: Taskwarrior task object
+        """
+        task['start'] = self._now()
+        self.save_task(task)
+
+    def stop_task(self, task):
+        """
+        Stop a task (queued until next flush)
+
+        :param task: Taskwarrior task object
+        """
+        task['start'] = None
+        self.save_task(task)
+
+    def complete_task(self, task):
+        """
+        Mark a task as done (queued until next flush)
+
+        :param task: Taskwarrior task object
+        """
+        task['status'] = 'completed'
+        task['start'] = None
+        task['end'] = self._now()
+        self.save_task(task)
+
+    def delete_task(self, task):
+        """
+        Delete a task (queued until next flush)
+
+        :param task: Taskwarrior task object
+        """
+        task['status'] = 'deleted'
+        task['start'] = None
+        task['end'] = self._now()
+        self.save_task(task)
+
+    def add_annotation(self, task, description):
+        """
+        Add an annotation to a task (queued until next flush)
+
+        :param task: Taskwarrior task object
+        :param description: annotation text
+        """
+        # Taskwarrior stores annotations by entry time, two annotations
+        # cannot share the same second
+        entry = self._now()
+        annotations_entries = [annotation['entry'] for annotation in task['annotations']]
+        while entry in annotations_entries:
+            entry += datetime.timedelta(seconds=1)
+        task['annotations'].append(TaskAnnotation(task, {'entry': task.timestamp_serializer(entry), 'description': description}))
+        self.save_task(task)
+
+    def remove_annotation(self, task, annotation):
+        """
+        Remove an annotation from a task (queued until next flush)
+
+        :param task: Taskwarrior task object
+        :param annotation: Taskwarrior annotation object
+        """
+        task['annotations'] = [task_annotation for task_annotation in task['annotations'] if task_annotation is not annotation]
+        self.save_task(task)
+
+    def flush(self):
+        """
+        Write all queued tasks in Taskwarrior with a single import
+
+        Import replaces whole tasks, so tasks are exported again right before
+        it and only the fields changed by sync are written over them, keeping
+        the changes made in Taskwarrior since they were read
+        """
+        if not self._tasks_to_import:
+            return
+        modified = self._now()
+        for task in self._tasks_to_import.values():
+            task._data['modified'] = modified
+        with taskwarrior_lock:
+            current_tasks = {task_data['uuid']: task_data for task_data in self._export_data(sorted(self._tasks_to_import.keys()))}
+            tasks_data = []
+            for task_uuid, task in self._tasks_to_import.items():
+                if task_uuid in current_tasks:
+                    tasks_data.append(merge_changes(task, current_tasks[task_uuid]))
+                else:
+                    tasks_data.append(import_data(task, task._data)) # New task
+            logger.debug('Importing {} modified tasks in Taskwarrior'.format(len(tasks_data)))
+            if self.snapshot is not None:
+                self.snapshot.check_data()
+            with tempfile.NamedTemporaryFile(mode='w', suffix='.json') as import_file:
+                json.dump(tasks_data, import_file)
+                import_file.flush()
+                self.taskwarrior_client.execute_command(['import', import_file.name])
+            if self.snapshot is not None:
+                self.snapshot.invalidate(self._tasks_to_import.keys())
+        for task, task_data in zip(self._tasks_to_import.values(), tasks_data):
+            task._load_data(task_data)
+        self._project_view = None # Next phase sees the changes
+        self._tasks_to_import = {}
+
+    def discard(self):
+        """
+        Forget all queued tasks without writing them
+        """
+        self._tasks_to_import = {}
+
+    def _export_data(self, args):
+        """
+        Export tasks without converting them to Taskwarrior task objects
+
+        :param args: filter arguments
+        :return: a list of tasks data
+        :rtype: list
+        """
+        return [json.loads(line.strip(',')) for line in self.taskwarrior_client.execute_command(args + ['export'])
+                if line.strip(',') not in ['', '[', ']']]
+
+    def _load_tasks(self, tasks_data):
+        """
+        Create Taskwarrior task objects from tasks data
+
+        :param tasks_data: list of tasks data like task export gives
+        :return: a list of Taskwarrior tasks objects
+        :rtype: list
+        """
+        tasks = []
+        for task_data in tasks_data:
+            task = Task(self.taskwarrior_client)
+            task._load_data(task_data)
+            tasks.append(task)
+        return tasks
+
+    def _select(self, query, export, match, in_project=True):
+        """
+        Get the tasks that match a filter from the shared snapshot, reading
+        them from Taskwarrior data files if the direct reader is enabled, or
+        with task export
+
+        :param query: description of the query
+        :param export: function that exports the tasks with task
+        :param match: function that checks the filter in task export data
+        :param in_project: if only tasks of working project can match (True by default)
+        :return: a list of Taskwarrior tasks objects
+        :rtype: list
+        """
+        if self.snapshot is not None:
+            tasks_data = self.snapshot.tasks(self._export_data, self._project if in_project else None)
+        elif self.reader is not None:
+            tasks_data = self.reader.tasks()
+        else:
+            return export()
+        read_tasks = self._load_tasks([task_data for task_data in tasks_data if match(task_data)])
+        if self.verify_reader:
+            exported_tasks = list(export())
+            compare_tasks(query, read_tasks, exported_tasks)
+            return exported_tasks
+        return read_tasks
+
+    def _in_project(self, task_data):
+        # Taskwarrior matches projects from the left, so parent projects include their subprojects
+        return task_data.get('project', '').startswith(self._project)
+
+    def in_project(self, task):
+        """
+        Check if a task is in the working project or in one of its
+        subprojects, as Taskwarrior project filter matches them
+
+        :param task: Taskwarrior task object
+        :return: True if task is in working project
+        :rtype: boolean
+        """
+        if self._project == None:
+            raise ClientError('in_project')
+        return (task['project'] or '').startswith(self._project)
+
+    def _now(self):
+        # Taskwarrior timestamps have one second resolution
+        return datetime.datetime.now().astimezone().replace(microsecond=0)
+
     def get_tasks_ids_set(self):
         """
         Get a IDs set of pending and completed tasks
@@ -41,9 +530,33 @@ class TaskwarriorClient:
         """
         if self._project == None:
             raise ClientError('get_tasks_ids_set')
-        pending_tasks_ids = set((task['trelloid'] for task in self.taskwarrior_client.tasks.pending().filter(project=self._project)))
-        completed_tasks_ids = set((task['trelloid'] for task in self.taskwarrior_client.tasks.completed().filter(project=self._project)))
-        return pending_tasks_ids | completed_tasks_ids
+        return self.get_project_view().trello_ids()
+
+    def get_project_view(self):
+        """
+        Get all tasks of the Taskwarrior project, loading them if they were
+        not loaded since last flush
+
+        :return: project view
+        :rtype: ProjectView
+        """
+        if self._project == None:
+            raise ClientError('get_project_view')
+        if self._project_view is None:
+            project_args = ['project:\'{}\''.format(self._project), '(', 'status.not:deleted', 'or', 'trelloid.any:', ')']
+            if self.snapshot is not None:
+                tasks_data = self.snapshot.tasks(self._export_data, self._project)
+            elif self.reader is not None:
+                tasks_data = [task_data for task_data in self.reader.tasks() if self._in_project(task_data) and
+                        (task_data['status'] != 'deleted' or task_data.get('trelloid'))]
+                if self.verify_reader:
+                    exported_data = self._export_data(project_args)
+                    compare_tasks('project tasks', self._load_tasks(tasks_data), self._load_tasks(exported_data))
+                    tasks_data = exported_data
+            else:
+                tasks_data = self._export_data(project_args)
+            self._project_view = ProjectView(self.taskwarrior_client, tasks_data)
+        return self._project_view
 
     def get_pending_tasks(self, trelloid=None):
         """
@@ -55,7 +568,9 @@ class TaskwarriorClient:
         """
         if self._project == None:
             raise ClientError('get_pending_tasks')
-        return self.taskwarrior_client.tasks.pending().filter(project=self._project, trelloid=trelloid)
+        return self._select('pending tasks',
+                lambda: self.taskwarrior_client.tasks.pending().filter(project=self._project, trelloid=trelloid),
+                lambda task_data: task_data['status'] == 'pending' and self._in_project(task_data) and task_data.get('trelloid') == trelloid)
 
     def get_completed_tasks(self, trelloid=None):
         """
@@ -67,18 +582,73 @@ class TaskwarriorClient:
         """
         if self._project == None:
             raise ClientError('get_completed_tasks')
-        return self.taskwarrior_client.tasks.completed().filter(project=self._project, trelloid=trelloid)
+        return self._select('completed tasks',
+                lambda: self.taskwarrior_client.tasks.completed().filter(project=self._project, trelloid=trelloid),
+                lambda task_data: task_data['status'] == 'completed' and self._in_project(task_data) and task_data.get('trelloid') == trelloid)
 
-    def get_deleted_tasks(self):
+    def get_deleted_tasks(self, since=None):
         """
-        Get a list of deleted tasks in a Taskwarrior project
+        Get a list of deleted tasks in a Taskwarrior project that still have
+        a Trello ID
 
+        :param since: only tasks modified after this datetime (None by default, all tasks)
         :return: a list of Taskwarrior tasks objects
         :rtype: list
         """
         if self._project == None:
-            raise ClientError('get_completed_tasks')
-        return self.taskwarrior_client.tasks.filter(project=self._project, status='deleted')
+            raise ClientError('get_deleted_tasks')
+        filters = {'project': self._project, 'status': 'deleted'}
+        since_date = ''
+        if since is not None:
+            filters['modified__after'] = since
+            since_date = since.astimezone(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        return self._select('deleted tasks',
+                lambda: self.taskwarrior_client.tasks.filter('trelloid.any:', **filters),
+                lambda task_data: task_data['status'] == 'deleted' and self._in_project(task_data) and task_data.get('trelloid') and
+                    task_data.get('modified', task_data['entry']) > since_date)
+
+    def load_tasks_index(self):
+        """
+        Export in one go all tasks that have a Trello ID and index them by it
+        Must be called again to see changes made outside this client
+        """
+        self._tasks_by_trello_id = {}
+        self._duplicated_trello_ids = set()
+        for task in self._select('tasks with Trello ID', lambda: self.taskwarrior_client.tasks.filter('trelloid.any:'),
+                lambda task_data: task_data.get('trelloid'), in_project=False):
+            if task['trelloid'] in self._tasks_by_trello_id:
+                self._duplicated_trello_ids.add(task['trelloid'])
+            self._tasks_by_trello_id[task['trelloid']] = task
+        logger.debug('Indexed {} Taskwarrior tasks by Trello ID'.format(len(self._tasks_by_trello_id)))
+
+    def get_modified_tasks(self, since):
+        """
+        Get a list of tasks in a Taskwarrior project modified after a date
+
+        :param since: a datetime object
+        :return: a list of Taskwarrior tasks objects
+        :rtype: list
+        """
+        if self._project == None:
+            raise ClientError('get_modified_tasks')
+        since_date = since.astimezone(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        return self._select('modified tasks',
+                lambda: self.taskwarrior_client.tasks.filter(project=self._project, modified__after=since),
+                lambda task_data: self._in_project(task_data) and task_data.get('modified', task_data['entry']) > since_date)
+
+    def get_tasks_by_uuids(self, uuids):
+        """
+        Get some tasks (of any project and status) by UUID in a single export
+
+        :param uuids: list of tasks UUIDs
+        :return: a list of Taskwarrior tasks objects
+        :rtype: list
+        """
+        if not uuids:
+            return []
+        uuids_set = set(uuids)
+        return self._select('tasks by UUID', lambda: self.taskwarrior_client.tasks.filter(*uuids),
+                lambda task_data: task_data['uuid'] in uuids_set, in_project=False)
 
     def get_task_by_trello_id(self, trello_id):
         """
@@ -89,11 +659,8 @@ class TaskwarriorClient:
         :return: a Taskwarrior task or None if task not Found
         :rtype: Taskwarrior task object
         """
-        tasks = self.taskwarrior_client.tasks.filter(trelloid=trello_id)
-        tasks_count = len(tasks)
-        if tasks_count == 0:
-            return None
-        elif tasks_count == 1:
-            return tasks[0]
-        else:
+        if self._tasks_by_trello_id is None:
+            self.load_tasks_index()
+        if trello_id in self._duplicated_trello_ids:
             raise ValueError('Duplicated Trello ID {} in Taskwarrior tasks. Trello IDs must be unique, please fix it before sync'.format(trello_id))
+        return self._tasks_by_trello_id.get(trello_id)
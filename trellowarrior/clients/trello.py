@@ -6,17 +6,41 @@
 #
 # Distributed under terms of the GNU GPLv3 license.
 
+from trellowarrior.clients.scheduler import RequestScheduler, TRELLO_API_URL, TRELLO_POOL_SIZE
 from trellowarrior.exceptions import ClientError
+from trellowarrior.stats import instrument
+from trellowarrior.syncplan import TRELLO
 from trello import TrelloClient as Client
+from trello.board import Board
+from trello.card import Card
 from trello.exceptions import ResourceUnavailable
+from trello.label import Label
+from trello.trellolist import List
+from dateutil import parser as dateparser
 
+import hashlib
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Card fields used by sync, requested in bulk instead of fetching every card
+CARD_FIELDS = 'name,desc,due,labels,idList,idMembers,dateLastActivity,shortUrl'
+# Maximum number of cards that Trello returns in a single page
+CARDS_PAGE_LIMIT = 1000
+# Maximum number of actions that Trello returns in a single page
+ACTIONS_PAGE_LIMIT = 1000
+# Maximum number of cards got one by one, more cards are got with the whole board in less requests
+CARDS_BY_ID_LIMIT = 20
+# ID of the board that a dry run would create, never sent to Trello
+DRY_RUN_BOARD_ID = 'dry-run-board'
+
+@instrument
 class TrelloClient:
-    def __init__(self, api_key, api_secret, token, token_secret):
-        self.trello_client = Client(api_key=api_key, api_secret=api_secret, token=token, token_secret=token_secret)
+    def __init__(self, api_key, api_secret, token, token_secret, cache=None, api_url=TRELLO_API_URL, pool_size=TRELLO_POOL_SIZE):
+        self.scheduler = RequestScheduler(api_key, token, api_url=api_url, pool_size=pool_size) # Rate limits and retries for every request
+        self.trello_client = Client(api_key=api_key, api_secret=api_secret, token=token, token_secret=token_secret, http_service=self.scheduler)
+        self._cache = cache
+        self._token_hash = hashlib.sha1(str(token).encode('utf-8')).hexdigest()[:16]
         self._uid = None
         self._project = None
         self._board = None
@@ -24,6 +48,8 @@ class TrelloClient:
         self._board_labels = None
         self._lists_filter = None
         self._only_my_cards = False
+        self.plan = None # Sync plan where record new lists and labels
+        self.stats = None # Stats of running sync, if any
 
     @property
     def whoami(self):
@@ -33,10 +59,27 @@ class TrelloClient:
         :return: my Trello UID
         :rtype: string
         """
+        if self._uid is None and self._cache is not None:
+            self._uid = self._cache.get('members', {}).get(self._token_hash)
         if self._uid is None:
-            self._uid = self.trello_client.get_member('me').id
+            self._uid = self.trello_client.fetch_json('/members/me', query_params={'fields': 'id'})['id']
+            if self._cache is not None:
+                # UID is tied to token, cache it by token hash
+                self._cache.update('members', {self._token_hash: self._uid})
         return self._uid
 
+    @property
+    def board_id(self):
+        """
+        Get the ID of working project board
+
+        :return: the board ID
+        :rtype: string
+        """
+        if self._board is None:
+            raise ClientError('board_id')
+        return self._board.id
+
     def project(self, project):
         """
         Set the class working project
@@ -44,11 +87,60 @@ class TrelloClient:
         :param project: TelloWarrior project object
         """
         if self._project == None or self._project.name != project.name:
-            self._board = self.get_board(project.trello_board_name)
-            self._lists = self.get_lists()
-            self._board_labels = self.get_board_labels()
+            if not self.load_cached_board(project.trello_board_name):
+                self._board = self.get_board(project.trello_board_name)
+                if self._board.id == DRY_RUN_BOARD_ID:
+                    # Board not created, so it has no lists nor labels yet
+                    self._lists = []
+                    self._board_labels = []
+                else:
+                    self._lists = self.get_lists()
+                    self._board_labels = self.get_board_labels()
+                    if self._cache is not None:
+                        self._cache.update('boards', {project.trello_board_name: self._board.id})
             self._lists_filter = project.trello_lists_filter
             self._only_my_cards = project.only_my_cards
+            self._project = project
+
+    def reset(self):
+        """
+        Forget the working project, so its board is loaded again in next use
+        """
+        self._project = None
+
+    def load_cached_board(self, board_name):
+        """
+        Load a board, its open lists and its labels in a single request using
+        the board ID stored in cache, checking that it is still valid
+
+        :param board_name: the board name
+        :return: True if board was loaded from cache or False if it must be looked up
+        :rtype: boolean
+        """
+        if self._cache is None:
+            return False
+        board_id = self._cache.get('boards', {}).get(board_name)
+        if board_id is None:
+            return False
+        try:
+            board_json = self.trello_client.fetch_json('/boards/{}'.format(board_id), query_params={
+                'fields': 'name,closed',
+                'lists': 'open',
+                'list_fields': 'name,closed,pos',
+                'labels': 'all',
+                'label_fields': 'name,color',
+                'labels_limit': 1000})
+        except ResourceUnavailable:
+            logger.debug('Cached Trello board {} with ID {} not found'.format(board_name, board_id))
+            return False
+        if board_json['closed'] or board_json['name'] != board_name:
+            logger.debug('Cached Trello board {} with ID {} is closed or renamed'.format(board_name, board_id))
+            return False
+        logger.debug('Trello board {} loaded from cached ID {}'.format(board_name, board_id))
+        self._board = Board(self.trello_client, board_id=board_id, name=board_json['name'])
+        self._lists = [List.from_json(self._board, list_json) for list_json in board_json['lists']]
+        self._board_labels = Label.from_json_list(self._board, board_json['labels'])
+        return True
 
     def get_board(self, board_name):
         """
@@ -63,6 +155,10 @@ class TrelloClient:
                 logger.debug('Trello board {} found'.format(board_name))
                 return trello_board
         logger.debug('Creating Trello board {}'.format(board_name))
+        if self.plan is not None:
+            self.plan.add(TRELLO, 'create board', '\'{}\''.format(board_name))
+        if self.plan is not None and self.plan.dry_run:
+            return Board(self.trello_client, board_id=DRY_RUN_BOARD_ID, name=board_name) # Never sent to Trello
         return self.trello_client.add_board(board_name)
 
     def get_lists(self):
@@ -89,7 +185,12 @@ class TrelloClient:
                 logger.debug('Trello list {} found'.format(list_name))
                 return trello_list
         logger.debug('Creating Trello list {}'.format(list_name))
-        trello_list = self._board.add_list(list_name)
+        if self.plan is not None:
+            self.plan.add(TRELLO, 'create list', '\'{}\''.format(list_name))
+        if self.plan is not None and self.plan.dry_run:
+            trello_list = List(self._board, 'dry-run-list-{}'.format(len(self._lists)), name=list_name) # Never sent to Trello
+        else:
+            trello_list = self._board.add_list(list_name)
         self._lists.append(trello_list) # Update _lists with new list
         return trello_list
 
@@ -118,34 +219,220 @@ class TrelloClient:
                 logger.debug('Trello board label {} found'.format(label_name))
                 return board_label
         logger.debug('Creating Trello board label {}'.format(label_name))
-        board_label = self._board.add_label(label_name, 'black')
+        if self.plan is not None:
+            self.plan.add(TRELLO, 'create label', '\'{}\''.format(label_name))
+        if self.plan is not None and self.plan.dry_run:
+            board_label = Label(self.trello_client, 'dry-run-label-{}'.format(len(self._board_labels)), label_name, 'black') # Never sent to Trello
+        else:
+            board_label = self._board.add_label(label_name, 'black')
         self._board_labels.append(board_label) # Update _board_labels with new label
         return board_label
 
-    def get_cards_dict(self):
+    def get_paged_cards_json(self, path, query_params):
+        """
+        Get the JSON of the cards of a Trello endpoint, paging by card ID
+
+        :param path: endpoint path
+        :param query_params: query parameters without limit and before
+        :return: a list of cards JSON without repeated cards and False if
+            Trello ignored the paging (so some cards could be missing)
+        :rtype: tuple
+        """
+        cards_json = []
+        cards_ids = set()
+        query_params = dict(query_params, limit=CARDS_PAGE_LIMIT)
+        while True:
+            logger.debug('Getting Trello cards of board {} ({} already fetched)'.format(self._board.name, len(cards_json)))
+            cards_page = self.trello_client.fetch_json(path, query_params=query_params)
+            new_cards = [card_json for card_json in cards_page if card_json['id'] not in cards_ids]
+            if cards_page and not new_cards:
+                return cards_json, False # Trello answered the same page again
+            cards_json.extend(new_cards)
+            cards_ids.update(card_json['id'] for card_json in new_cards)
+            if len(cards_page) < CARDS_PAGE_LIMIT:
+                return cards_json, True
+            # Trello returns newest cards first, next page starts before the oldest one
+            query_params['before'] = min(cards_page, key=lambda card_json: int(card_json['id'], 16))['id']
+
+    def get_board_cards_json(self):
+        """
+        Get the JSON of all open cards of the board (only the ones assigned
+        to me if project syncs only my cards) with only the fields needed to
+        sync, paging by card ID if board is too big
+
+        :return: a list of cards JSON
+        :rtype: list
+        """
+        if self._board is None:
+            raise ClientError('get_board_cards_json')
+        if self._board.id == DRY_RUN_BOARD_ID:
+            return [] # Board not created yet
+        if self._only_my_cards:
+            # Trello filters the cards, so only my cards are downloaded
+            cards_json, complete = self.get_paged_cards_json('/boards/{}/members/{}/cards'.format(self._board.id, self.whoami),
+                    {'fields': '{},closed'.format(CARD_FIELDS), 'filter': 'open'})
+            if complete:
+                return [card_json for card_json in cards_json if not card_json.get('closed', False)]
+            # Cards of other members are filtered out when building the cards dict
+            logger.warning('Trello does not page my cards of board {}, getting all cards of board instead'.format(self._board.name))
+        cards_json, complete = self.get_paged_cards_json('/boards/{}/cards/open'.format(self._board.id), {'fields': CARD_FIELDS})
+        if not complete:
+            logger.warning('Trello does not page the cards of board {}, only {} cards got'.format(self._board.name, len(cards_json)))
+        return cards_json
+
+    def get_cards_json(self, trello_cards_ids):
+        """
+        Get the JSON of some open cards of the board with only the fields
+        needed to sync, cards that are closed, deleted or moved to other
+        board are ignored
+
+        :param trello_cards_ids: iterable of Trello cards IDs
+        :return: a list of cards JSON
+        :rtype: list
+        """
+        if self._board is None:
+            raise ClientError('get_cards_json')
+        trello_cards_ids = set(trello_cards_ids)
+        if len(trello_cards_ids) > CARDS_BY_ID_LIMIT:
+            logger.debug('Getting {} Trello cards with all cards of board {}'.format(len(trello_cards_ids), self._board.name))
+            return [card_json for card_json in self.get_board_cards_json() if card_json['id'] in trello_cards_ids]
+        cards_json = []
+        for trello_card_id in trello_cards_ids:
+            try:
+                card_json = self.trello_client.fetch_json('/cards/{}'.format(trello_card_id), query_params={'fields': '{},closed,idBoard'.format(CARD_FIELDS)})
+            except ResourceUnavailable:
+                logger.debug('Trello card with ID {} not found'.format(trello_card_id))
+                continue
+            if not card_json['closed'] and card_json['idBoard'] == self._board.id:
+                cards_json.append(card_json)
+        return cards_json
+
+    def get_board_actions(self, since):
+        """
+        Get the actions done in the board since a date
+
+        :param since: a datetime object
+        :return: a list of actions JSON, newest first, or None if there are
+                 too many actions to get them in a single request
+        :rtype: list
+        """
+        if self._board is None:
+            raise ClientError('get_board_actions')
+        actions_json = self.trello_client.fetch_json('/boards/{}/actions'.format(self._board.id), query_params={
+            'filter': 'all',
+            'fields': 'type,data,date,idMemberCreator',
+            'since': since.isoformat(),
+            'limit': ACTIONS_PAGE_LIMIT})
+        if len(actions_json) >= ACTIONS_PAGE_LIMIT:
+            return None
+        return actions_json
+
+    def card_from_json(self, trello_list, card_json):
+        """
+        Build a Trello card object from the JSON of a bulk fetch
+
+        :param trello_list: Trello list object where the card is stored
+        :param card_json: card JSON with CARD_FIELDS
+        :return: a Trello card
+        :rtype: Trello card object
+        """
+        trello_card = Card(trello_list, card_json['id'], name=card_json['name'])
+        trello_card.desc = card_json.get('desc', '')
+        trello_card.due = card_json.get('due') or ''
+        trello_card.idList = card_json['idList']
+        trello_card.idMembers = trello_card.member_ids = card_json['idMembers']
+        trello_card.shortUrl = card_json['shortUrl']
+        trello_card._labels = Label.from_json_list(self._board, card_json['labels'])
+        trello_card.dateLastActivity = dateparser.parse(card_json['dateLastActivity'])
+        return trello_card
+
+    def get_cards_dict(self, trello_cards_ids=None):
         """
         Get all cards of a list of Trello lists in a dictionary
 
+        :param trello_cards_ids: get only the cards with these IDs (None by default to get all)
         :return: a dict with Cards
         :rtype: dict
         """
-        trello_cards_dict = {}
+        if self._lists == None:
+            raise ClientError('get_cards_dict')
+        trello_lists = self._lists
         if self._lists_filter is not None:
-            trello_lists = filter(lambda trello_list: trello_list.name not in self._lists_filter, self._lists)
-        for trello_list in trello_lists:
-            logger.debug('Getting Trello cards of list {}'.format(trello_list.name))
-            trello_cards_dict[trello_list.name] = trello_list.list_cards()
-            if self._only_my_cards:
-                trello_cards_dict[trello_list.name] = filter(lambda trello_card: self.whoami in trello_card.member_ids, trello_cards_dict[trello_list.name])
+            trello_lists = filter(lambda trello_list: trello_list.name not in self._lists_filter, trello_lists)
+        trello_lists = {trello_list.id: trello_list for trello_list in trello_lists}
+        trello_cards_dict = {trello_list.name: [] for trello_list in trello_lists.values()}
+        if trello_cards_ids is None:
+            cards_json = self.get_board_cards_json()
+        else:
+            cards_json = self.get_cards_json(trello_cards_ids)
+        for card_json in cards_json:
+            trello_list = trello_lists.get(card_json['idList'])
+            if trello_list is None:
+                continue # Card is in a filtered list
+            if self._only_my_cards and self.whoami not in card_json['idMembers']:
+                continue # Cards got by ID or from the whole board can be of other members
+            trello_cards_dict[trello_list.name].append(self.card_from_json(trello_list, card_json))
         return trello_cards_dict
 
+    def add_card(self, trello_list, name, due=None, labels_names=None, assign=False):
+        """
+        Create a new card with all its data in a single request
+        Labels that not exist in board are created before
+
+        :param trello_list: Trello list object where store the card
+        :param name: the card name
+        :param due: due date of card (None by default)
+        :param labels_names: list of labels names to add to card (None by default, no labels)
+        :param assign: assign the card to me (False by default)
+        :return: the new Trello card
+        :rtype: Trello card object
+        """
+        if labels_names is None:
+            labels_names = []
+        post_args = {
+            'name': name,
+            'idList': trello_list.id,
+            'due': due.isoformat() if due else None,
+            'idLabels': ','.join([self.get_board_label(label_name).id for label_name in labels_names]),
+            'idMembers': self.whoami if assign else '',
+            'pos': 'bottom'
+        }
+        card_json = self.trello_client.fetch_json('/cards', http_method='POST', post_args=post_args)
+        return self.card_from_json(trello_list, card_json)
+
+    def register_webhook(self, callback_url):
+        """
+        Register a Trello webhook for the board, if it is not registered yet
+
+        :param callback_url: URL where Trello sends the board changes
+        :return: True if a new webhook was registered
+        :rtype: boolean
+        """
+        if self._board is None:
+            raise ClientError('register_webhook')
+        token = self.trello_client.resource_owner_key
+        for webhook in self.trello_client.fetch_json('/tokens/{}/webhooks'.format(token)):
+            if webhook['idModel'] == self._board.id and webhook['callbackURL'] == callback_url:
+                logger.debug('Trello webhook for board {} already registered'.format(self._board.name))
+                return False
+        self.trello_client.fetch_json('/webhooks', http_method='POST', post_args={
+            'callbackURL': callback_url,
+            'idModel': self._board.id,
+            'description': 'TrelloWarrior {}'.format(self._board.name)})
+        logger.info('Trello webhook for board {} registered'.format(self._board.name))
+        return True
+
     def delete_card(self, trello_card_id):
         """
         Delete (forever) a Trello card by ID
 
         :param trello_card_id: ID of Trello card
+        :return: True if deleted, False if card did not exist
+        :rtype: boolean
         """
         try:
-            self.trello_client.get_card(trello_card_id).delete()
+            self.trello_client.fetch_json('/cards/{}'.format(trello_card_id), http_method='DELETE')
+            return True
         except ResourceUnavailable:
             logger.warning('Cannot find Trello card with ID {} deleted in Task Warrior. Maybe you also deleted it in Trello?'.format(trello_card_id))
+            return False
@@ -0,0 +1,106 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2015-2020 Óscar García Amor <ogarcia@connectical.com>
+#
+# Distributed under terms of the GNU GPLv3 license.
+
+from concurrent.futures import ThreadPoolExecutor
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Default maximum number of Trello requests running at the same time
+TRELLO_CONCURRENCY = 10
+
+class TrelloOperation:
+    """
+    A queued Trello call, its callback and its outcome
+    """
+
+    def __init__(self, key, function, args, kwargs, callback):
+        self.key = key
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.callback = callback
+        self.done = False
+        self.result = None
+        self.error = None
+
+class TrelloEngine:
+    """
+    Run queued Trello calls concurrently in a pool of threads, up to a
+    maximum of concurrent calls. Calls with the same key (usually a card ID)
+    run one after the other in submission order, and callbacks are applied
+    once all calls ended, in submission order too, so local changes are
+    deterministic
+    """
+
+    def __init__(self, concurrency=TRELLO_CONCURRENCY):
+        self.concurrency = max(1, concurrency)
+        self._operations = []
+
+    def submit(self, key, function, *args, callback=None, **kwargs):
+        """
+        Queue a Trello call until next run
+
+        :param key: calls with the same key are run in order
+        :param function: function to call
+        :param args: function arguments
+        :param callback: function called with the result of call (None by default)
+        :param kwargs: function keyword arguments
+        :return: the queued operation, with its outcome once run
+        :rtype: TrelloOperation
+        """
+        operation = TrelloOperation(key, function, args, kwargs, callback)
+        self._operations.append(operation)
+        return operation
+
+    def discard(self):
+        """
+        Forget all queued calls
+        """
+        self._operations = []
+
+    def run(self):
+        """
+        Run all queued calls and apply their callbacks, if any call fails the
+        following calls with the same key are skipped and, after applying the
+        callbacks of successful calls, the first error is raised
+        """
+        operations, self._operations = self._operations, []
+        if not operations:
+            return
+        chains = {}
+        for operation in operations:
+            chains.setdefault(operation.key, []).append(operation)
+        logger.debug('Running {} Trello operations over {} cards'.format(len(operations), len(chains)))
+        # Every chain runs in one worker, so the pool size is the maximum of
+        # concurrent calls. Name workers after current thread to keep log
+        # messages readable
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=threading.current_thread().name) as executor:
+            for future in [executor.submit(self._run_chain, chain) for chain in chains.values()]:
+                future.result()
+        error = None
+        for operation in operations:
+            if operation.done:
+                if operation.callback is not None:
+                    operation.callback(operation.result)
+            elif error is None:
+                error = operation.error
+        if error is not None:
+            raise error
+
+    def _run_chain(self, chain):
+        for operation in chain:
+            try:
+                operation.result = operation.function(*operation.args, **operation.kwargs)
+                operation.done = True
+            except Exception as e:
+                operation.error = e
+                logger.debug('Trello operation over {} failed, skipping the rest'.format(operation.key))
+                return
@@ -6,39 +6,154 @@
 #
 # Distributed under terms of the GNU GPLv3 license.
 
+from trellowarrior.cache import Cache
 from trellowarrior.clients.taskwarrior import TaskwarriorClient
 from trellowarrior.clients.trello import TrelloClient
+from trellowarrior.clients.trelloengine import TrelloEngine
 from trellowarrior.config import config
+from trellowarrior.metrics import SyncMetrics
+from trellowarrior.stats import SyncStats
+from trellowarrior.syncplan import SyncPlan
+from trellowarrior.syncstate import SyncState, snapshot_hash
 
+from dateutil import parser as dateparser
+
+import datetime
 import logging
+import os
+import random
 
 logger = logging.getLogger(__name__)
 
+# Incremental sync falls back to full sync if last full sync is older than this
+INCREMENTAL_SYNC_MAX_AGE = datetime.timedelta(days=1)
+# Margin applied to last sync date to avoid missing changes by clock skew
+INCREMENTAL_SYNC_MARGIN = datetime.timedelta(minutes=1)
+# Trello actions that can change cards without being related to one card
+BOARD_WIDE_ACTIONS = ['updateList', 'moveListFromBoard', 'moveListToBoard', 'updateLabel', 'deleteLabel']
+# Maximum fraction of sync interval that a project can be synchronized in advance, to spread syncs over time
+SYNC_INTERVAL_JITTER = 0.1
+
+def written_cards(watermark):
+    """
+    Get the cards written by syncs since the date of a sync watermark
+
+    :param watermark: sync watermark of a project
+    :return: dict of Trello cards IDs and date when their sync ended (in ISO format)
+    :rtype: dict
+    """
+    written_cards = watermark.get('written_cards', {})
+    if isinstance(written_cards, list):
+        # Watermarks of older versions have one date for all cards
+        return dict.fromkeys(written_cards, watermark['written_until'])
+    return dict(written_cards)
+
 class TrelloWarriorClient:
-    def __init__(self, config):
-        self.taskwarrior_client = TaskwarriorClient(config.taskwarrior_taskrc_location, config.taskwarrior_data_location)
-        self.trello_client = TrelloClient(config.trello_api_key, config.trello_api_secret, config.trello_token, config.trello_token_secret)
+    def __init__(self, config, cache=None):
+        self.taskwarrior_client = TaskwarriorClient(config.taskwarrior_taskrc_location, config.taskwarrior_data_location,
+                reader=config.taskwarrior_reader)
+        # Cache can be shared between clients (it is thread safe), sync state can not
+        self.cache = cache if cache is not None else Cache(os.path.join(config.cache_location, 'metadata.json'))
+        self.sync_state = SyncState(os.path.join(config.cache_location, 'syncstate.sqlite'))
+        self.metrics = SyncMetrics(self.cache) # Accumulated in cache, so shared too
+        self.trello_client = TrelloClient(config.trello_api_key, config.trello_api_secret, config.trello_token, config.trello_token_secret, cache=self.cache,
+                api_url=config.trello_api_url, pool_size=config.trello_pool_size)
+        self.trello_engine = TrelloEngine(config.trello_concurrency)
+        self.plan = None
 
     def upload_taskwarrior_task(self, project, taskwarrior_task, trello_list):
         """
         Upload all contents of Taskwarrior task to a Trello list creating a new card and storing cardid and url
+        The card is created when sync plan is executed
 
         :param project: TrelloWarrior project object
         :param taskwarrior_task: Taskwarrior task object
         :param trello_list: Trello list object
         """
-        new_trello_card = trello_list.add_card(taskwarrior_task['description'])
-        if taskwarrior_task['due']:
-            new_trello_card.set_due(taskwarrior_task['due'])
         for tag in taskwarrior_task['tags']:
-            trello_label = self.trello_client.get_board_label(tag)
-            new_trello_card.add_label(trello_label)
-        if project.only_my_cards:
-            new_trello_card.assign(self.trello_client.whoami)
-        taskwarrior_task['trelloid'] = new_trello_card.id
-        taskwarrior_task.save()
-        taskwarrior_task.add_annotation('[Trello URL] {}'.format(new_trello_card.short_url))
-        logger.info('Taskwarrior task with ID {} saved as new card in Trello with ID {}'.format(taskwarrior_task['id'], new_trello_card.id))
+            self.trello_client.get_board_label(tag) # Create missing labels now to avoid creating them twice
+        def save_trello_card(new_trello_card):
+            taskwarrior_task['trelloid'] = new_trello_card.id
+            self.taskwarrior_client.add_annotation(taskwarrior_task, '[Trello URL] {}'.format(new_trello_card.short_url))
+            self.sync_state.set(project, new_trello_card.id, taskwarrior_task['uuid'], self.trello_card_snapshot(trello_list.name, new_trello_card))
+            logger.info('Taskwarrior task with ID {} saved as new card in Trello with ID {}'.format(taskwarrior_task['id'], new_trello_card.id))
+        self.plan.trello('create card', '\'{}\''.format(taskwarrior_task['description']), taskwarrior_task['uuid'],
+                self.trello_client.add_card, trello_list, taskwarrior_task['description'],
+                detail='in list \'{}\''.format(trello_list.name),
+                due=taskwarrior_task['due'],
+                labels_names=taskwarrior_task['tags'],
+                assign=project.only_my_cards,
+                callback=save_trello_card)
+
+    def upload_new_task(self, project, taskwarrior_task):
+        """
+        Upload a pending or completed Taskwarrior task never uploaded before
+        to the Trello list that corresponds to its status
+
+        :param project: TrelloWarrior project object
+        :param taskwarrior_task: Taskwarrior task object
+        """
+        if taskwarrior_task.completed:
+            logger.info('Uploading new completed Taskwarrior task to Trello')
+            self.upload_taskwarrior_task(project, taskwarrior_task, self.trello_client.get_list(project.trello_done_list))
+            taskwarrior_task['trellolistname'] = project.trello_done_list
+            self.taskwarrior_client.save_task(taskwarrior_task)
+            return
+        logger.info('Uploading new pending Taskwarrior task with ID {} to Trello'.format(taskwarrior_task['id']))
+        if taskwarrior_task.active:
+            # Upload new pending active task to doing list
+            self.upload_taskwarrior_task(project, taskwarrior_task, self.trello_client.get_list(project.trello_doing_list))
+            taskwarrior_task['trellolistname'] = project.trello_doing_list
+            self.taskwarrior_client.save_task(taskwarrior_task)
+        else:
+            if taskwarrior_task['trellolistname']:
+                # Upload new pending task to user provided list
+                self.upload_taskwarrior_task(project, taskwarrior_task, self.trello_client.get_list(taskwarrior_task['trellolistname']))
+            else:
+                # Upload new pending task to default todo list
+                self.upload_taskwarrior_task(project, taskwarrior_task, self.trello_client.get_list(project.trello_todo_list))
+                taskwarrior_task['trellolistname'] = project.trello_todo_list
+                self.taskwarrior_client.save_task(taskwarrior_task)
+
+    def delete_trello_card(self, taskwarrior_deleted_task):
+        """
+        Delete the Trello card of a deleted Taskwarrior task, forgetting its
+        Trello ID once the card is deleted
+
+        :param taskwarrior_deleted_task: Taskwarrior task object
+        :return: the planned deletion
+        :rtype: SyncOperation
+        """
+        logger.info('Deleting previously deleted Taskwarrior task with ID {} from Trello'.format(taskwarrior_deleted_task['trelloid']))
+        def unlink_deleted_task(result):
+            self.sync_state.delete(taskwarrior_deleted_task['trelloid'])
+            taskwarrior_deleted_task['trelloid'] = None
+            self.taskwarrior_client.save_task(taskwarrior_deleted_task)
+        return self.plan.trello('delete card', taskwarrior_deleted_task['trelloid'], taskwarrior_deleted_task['trelloid'],
+                self.trello_client.delete_card, taskwarrior_deleted_task['trelloid'],
+                detail='task \'{}\' deleted'.format(taskwarrior_deleted_task['description']),
+                callback=unlink_deleted_task)
+
+    def report_card_deletions(self, project, deletions):
+        """
+        Log the result of every Trello card deletion of a sync step
+
+        :param project: TrelloWarrior project object
+        :param deletions: list of executed deletions (SyncOperation objects)
+        """
+        if not deletions or self.plan.dry_run:
+            return
+        deleted, missing, failed = 0, 0, 0
+        for deletion in deletions:
+            if deletion.failed() is not None:
+                failed += 1
+                logger.error('Cannot delete Trello card with ID {}: {}'.format(deletion.target, deletion.failed()))
+            elif deletion.trello_operation.done:
+                if deletion.trello_operation.result:
+                    deleted += 1
+                else:
+                    missing += 1
+        logger.info('Project {}: {} Trello cards deleted, {} already deleted in Trello, {} failed'.format(project.name, deleted, missing, failed))
 
     def fetch_trello_card(self, project, list_name, trello_card):
         """
@@ -47,7 +162,10 @@ class TrelloWarriorClient:
         :param project: TrelloWarrior project object
         :list_name: name of the Trello list where the card is stored
         :param trello_card: Trello card object
+        :return: the new task
+        :rtype: Taskwarrior task object
         """
+        self.plan.taskwarrior('create task', '\'{}\''.format(trello_card.name), 'from list \'{}\''.format(list_name))
         new_taskwarrior_task = self.taskwarrior_client.new_task()
         new_taskwarrior_task['project'] = project.taskwarrior_project_name
         new_taskwarrior_task['description'] = trello_card.name
@@ -58,231 +176,592 @@ class TrelloWarriorClient:
                 new_taskwarrior_task['tags'].add(label.name)
         new_taskwarrior_task['trelloid'] = trello_card.id
         new_taskwarrior_task['trellolistname'] = list_name
-        new_taskwarrior_task.save()
-        new_taskwarrior_task.add_annotation('[Trello URL] {}'.format(trello_card.short_url))
+        self.taskwarrior_client.add_annotation(new_taskwarrior_task, '[Trello URL] {}'.format(trello_card.short_url))
         if trello_card.description:
-            new_taskwarrior_task.add_annotation('[Trello Description] {}'.format(trello_card.description))
-        logger.info('Trello card with ID {} saved as new task in Taskwarrior with ID {}'.format(trello_card.id, new_taskwarrior_task['id']))
+            self.taskwarrior_client.add_annotation(new_taskwarrior_task, '[Trello Description] {}'.format(trello_card.description))
+        logger.info('Trello card with ID {} saved as new task in Taskwarrior with UUID {}'.format(trello_card.id, new_taskwarrior_task['uuid']))
         if list_name == project.trello_doing_list:
-            new_taskwarrior_task.start()
-            logger.info('New task {} kicked to doing list'.format(new_taskwarrior_task['id']))
+            self.taskwarrior_client.start_task(new_taskwarrior_task)
+            logger.info('New task {} kicked to doing list'.format(new_taskwarrior_task['uuid']))
         if list_name == project.trello_done_list:
-            new_taskwarrior_task.done()
-            logger.info('New task {} kicked to done list'.format(new_taskwarrior_task['id']))
+            self.taskwarrior_client.complete_task(new_taskwarrior_task)
+            logger.info('New task {} kicked to done list'.format(new_taskwarrior_task['uuid']))
+        return new_taskwarrior_task
+
+    def get_trello_annotations(self, taskwarrior_task):
+        """
+        Get the annotations of a Taskwarrior task that store Trello data
+
+        :param taskwarrior_task: Taskwarrior task object
+        :return: a tuple with the Trello URL annotation (or None) and a list
+                 with the Trello description annotation (or None) and its text
+        :rtype: tuple
+        """
+        taskwarrior_task_annotation_trello_url = None
+        taskwarrior_task_annotation_trello_description = [None, '']
+        if taskwarrior_task['annotations']:
+            for annotation in taskwarrior_task['annotations']:
+                # Look for Trello url
+                if annotation['description'][0:13].lower() == '[trello url] ':
+                    taskwarrior_task_annotation_trello_url = annotation
+                # Look for Trello description
+                if annotation['description'][0:21].lower() == '[trello description] ':
+                    taskwarrior_task_annotation_trello_description = [annotation, annotation['description'][21:]]
+        return taskwarrior_task_annotation_trello_url, taskwarrior_task_annotation_trello_description
+
+    def trello_card_snapshot(self, list_name, trello_card):
+        """
+        Get the synchronized fields of a Trello card
 
-    def sync_task_card(self, project, list_name, trello_card, taskwarrior_task):
+        :param list_name: name of the Trello list where the card is stored
+        :param trello_card: Trello card object
+        :return: a snapshot dict
+        :rtype: dict
+        """
+        return {
+            'name': trello_card.name,
+            'due': int(trello_card.due_date.timestamp()) if trello_card.due_date else None,
+            'tags': sorted([label.name for label in trello_card.labels]),
+            'list': list_name,
+            'url': trello_card.short_url,
+            'description': trello_card.description
+        }
+
+    def taskwarrior_task_snapshot(self, project, taskwarrior_task):
+        """
+        Get the synchronized fields of a Taskwarrior task, with the list
+        where the card should be according to task status
+
+        :param project: TrelloWarrior project object
+        :param taskwarrior_task: Taskwarrior task object
+        :return: a snapshot dict
+        :rtype: dict
+        """
+        list_name = taskwarrior_task['trellolistname']
+        if taskwarrior_task.completed:
+            list_name = project.trello_done_list
+        elif taskwarrior_task.active:
+            list_name = project.trello_doing_list
+        elif list_name in [project.trello_doing_list, project.trello_done_list]:
+            list_name = project.trello_todo_list
+        taskwarrior_task_annotation_trello_url, taskwarrior_task_annotation_trello_description = self.get_trello_annotations(taskwarrior_task)
+        return {
+            'name': taskwarrior_task['description'],
+            'due': int(taskwarrior_task['due'].timestamp()) if taskwarrior_task['due'] else None,
+            'tags': sorted(taskwarrior_task['tags']),
+            'list': list_name,
+            'url': taskwarrior_task_annotation_trello_url['description'][13:] if taskwarrior_task_annotation_trello_url else None,
+            'description': taskwarrior_task_annotation_trello_description[1]
+        }
+
+    def sync_task_card(self, project, list_name, trello_card, taskwarrior_task, base_snapshot=None):
         """
         Sync an existing Taskwarrior task with an existing Trello card
+        With a base snapshot (last synchronized data) the side that changed a
+        field wins, if both sides changed it (or no base) the newest one wins
 
         :param project: TrelloWarrior project object
         :param list_name: name of the Trello list where the card is stored
         :param trello_card: Trello card object
         :param taskwarrior_task: Taskwarrior task object
+        :param base_snapshot: snapshot of last sync (None by default)
         """
         taskwarrior_task_modified = False # Change to true to save modification
+        trello_snapshot = self.trello_card_snapshot(list_name, trello_card)
+        taskwarrior_snapshot = self.taskwarrior_task_snapshot(project, taskwarrior_task)
+        # Decide if Taskwarrior wins the sync of a field
+        def taskwarrior_newer(field):
+            if base_snapshot is not None:
+                trello_changed = trello_snapshot[field] != base_snapshot[field]
+                taskwarrior_changed = taskwarrior_snapshot[field] != base_snapshot[field]
+                if trello_changed != taskwarrior_changed:
+                    # Only one side changed, it wins
+                    return taskwarrior_changed
+            return taskwarrior_task['modified'] > trello_card.date_last_activity
         # Task description <> Trello card name
         if taskwarrior_task['description'] != trello_card.name:
-            if taskwarrior_task['modified'] > trello_card.date_last_activity:
+            if taskwarrior_newer('name'):
                 # Taskwarrior data is newer
-                trello_card.set_name(taskwarrior_task['description'])
+                self.plan.trello('rename card', '\'{}\''.format(trello_card.name), trello_card.id, trello_card.set_name, taskwarrior_task['description'],
+                        detail='to \'{}\''.format(taskwarrior_task['description']))
             else:
                 # Trello data is newer
+                self.plan.taskwarrior('rename task', '\'{}\''.format(taskwarrior_task['description']), 'to \'{}\''.format(trello_card.name))
                 taskwarrior_task['description'] = trello_card.name
                 taskwarrior_task_modified = True
             logger.info('Name of task {} synchronized'.format(taskwarrior_task['id']))
         # Task due <> Trello due
-        if taskwarrior_task['due']:
-            if not trello_card.due_date or taskwarrior_task['modified'] > trello_card.date_last_activity:
-                # No due data in Trello or Taskwarrior data is newer
-                trello_card.set_due(taskwarrior_task['due'])
+        if taskwarrior_snapshot['due'] != trello_snapshot['due']:
+            if base_snapshot is None and not (taskwarrior_task['due'] and trello_card.due_date):
+                # Never synchronized, the side without due date gets it
+                taskwarrior_wins = bool(taskwarrior_task['due'])
+            else:
+                # Clearing the due date is a change too
+                taskwarrior_wins = taskwarrior_newer('due')
+            if taskwarrior_wins and taskwarrior_task['due']:
+                # Taskwarrior data is newer
+                self.plan.trello('set due of card', '\'{}\''.format(trello_card.name), trello_card.id, trello_card.set_due, taskwarrior_task['due'],
+                        detail='to {}'.format(taskwarrior_task['due']))
+            elif taskwarrior_wins:
+                # Due date removed in Taskwarrior
+                self.plan.trello('remove due of card', '\'{}\''.format(trello_card.name), trello_card.id, trello_card.remove_due)
             else:
                 # Trello data is newer
-                taskwarrior_task['due'] = trello_card.due_date
+                self.plan.taskwarrior('set due of task', '\'{}\''.format(taskwarrior_task['description']), 'to {}'.format(trello_card.due_date or 'none'))
+                taskwarrior_task['due'] = trello_card.due_date or None
                 taskwarrior_task_modified = True
             logger.info('Due date of task {} synchronized'.format(taskwarrior_task['id']))
-        elif trello_card.due_date:
-            # No due data in Taskwarrior
-            taskwarrior_task['due'] = trello_card.due_date
-            taskwarrior_task_modified = True
-            logger.info('Due date of task {} synchronized'.format(taskwarrior_task['id']))
         # Task tags <> Trello labels
         trello_card_labels_set = set(trello_card.labels) if trello_card.labels else set()
         trello_card_labels_name_set = set([label.name for label in trello_card_labels_set])
         if taskwarrior_task['tags'] != trello_card_labels_name_set:
-            if taskwarrior_task['modified'] > trello_card.date_last_activity:
+            if taskwarrior_newer('tags'):
                 # Taskwarrior data is newer
                 for tag in taskwarrior_task['tags']:
                     # Get or create label in board
                     trello_label = self.trello_client.get_board_label(tag)
                     if not trello_label in trello_card_labels_set:
-                        trello_card.add_label(trello_label) # Assign label to card
+                        # Assign label to card
+                        self.plan.trello('add label to card', '\'{}\''.format(trello_card.name), trello_card.id, trello_card.add_label, trello_label,
+                                detail='\'{}\''.format(tag))
                 for label in trello_card_labels_set:
                     if not label.name in taskwarrior_task['tags']:
-                        trello_card.remove_label(label) # Remove labels that are not present in tag list
+                        # Remove labels that are not present in tag list
+                        self.plan.trello('remove label from card', '\'{}\''.format(trello_card.name), trello_card.id, trello_card.remove_label, label,
+                                detail='\'{}\''.format(label.name))
             else:
                 # Trello data is newer
+                self.plan.taskwarrior('set tags of task', '\'{}\''.format(taskwarrior_task['description']), ', '.join(sorted(trello_card_labels_name_set)) or 'none')
                 taskwarrior_task['tags'] = trello_card_labels_name_set # Copy tags from Trello labels
                 taskwarrior_task_modified = True
             logger.info('Tags of task {} synchronized'.format(taskwarrior_task['id']))
         # Task list name and status <> Trello list name
-        if taskwarrior_task.pending and not taskwarrior_task.active and taskwarrior_task['trellolistname'] in [project.trello_doing_list, project.trello_done_list] and taskwarrior_task['modified'] > trello_card.date_last_activity:
+        if taskwarrior_task.pending and not taskwarrior_task.active and taskwarrior_task['trellolistname'] in [project.trello_doing_list, project.trello_done_list] and taskwarrior_newer('list'):
             # Task kicked to To Do in Taskwarrior and not synchronized
-            trello_card.change_list(self.trello_client.get_list(project.trello_todo_list).id)
+            self.plan.trello('move card', '\'{}\''.format(trello_card.name), trello_card.id, trello_card.change_list, self.trello_client.get_list(project.trello_todo_list).id,
+                    detail='to list \'{}\''.format(project.trello_todo_list))
             taskwarrior_task['trellolistname'] = list_name = project.trello_todo_list
             taskwarrior_task_modified = True
             logger.info('Task {} kicked to todo list in Trello'.format(taskwarrior_task['id']))
-        if taskwarrior_task.active and taskwarrior_task['trellolistname'] != project.trello_doing_list and taskwarrior_task['modified'] > trello_card.date_last_activity:
+        if taskwarrior_task.active and taskwarrior_task['trellolistname'] != project.trello_doing_list and taskwarrior_newer('list'):
             # Task kicked to doing in Taskwarrior and not synchronized
-            trello_card.change_list(self.trello_client.get_list(project.trello_doing_list).id)
+            self.plan.trello('move card', '\'{}\''.format(trello_card.name), trello_card.id, trello_card.change_list, self.trello_client.get_list(project.trello_doing_list).id,
+                    detail='to list \'{}\''.format(project.trello_doing_list))
             taskwarrior_task['trellolistname'] = list_name = project.trello_doing_list
             taskwarrior_task_modified = True
             logger.info('Task {} kicked to doing list in Trello'.format(taskwarrior_task['id']))
-        if taskwarrior_task.completed and taskwarrior_task['trellolistname'] != project.trello_done_list and taskwarrior_task['modified'] > trello_card.date_last_activity:
+        if taskwarrior_task.completed and taskwarrior_task['trellolistname'] != project.trello_done_list and taskwarrior_newer('list'):
             # Task kicked to doing in Taskwarrior and not synchronized
-            trello_card.change_list(self.trello_client.get_list(project.trello_done_list).id)
+            self.plan.trello('move card', '\'{}\''.format(trello_card.name), trello_card.id, trello_card.change_list, self.trello_client.get_list(project.trello_done_list).id,
+                    detail='to list \'{}\''.format(project.trello_done_list))
             taskwarrior_task['trellolistname'] = list_name = project.trello_done_list
             taskwarrior_task_modified = True
             logger.info('Task {} kicked to done list in Trello'.format(taskwarrior_task['id']))
         if taskwarrior_task['trellolistname'] != list_name:
-            if taskwarrior_task['modified'] > trello_card.date_last_activity:
+            if taskwarrior_newer('list'):
                 # Taskwarrior data is newer
-                trello_card.change_list(self.trello_client.get_list(taskwarrior_task['trellolistname']).id)
+                self.plan.trello('move card', '\'{}\''.format(trello_card.name), trello_card.id, trello_card.change_list, self.trello_client.get_list(taskwarrior_task['trellolistname']).id,
+                        detail='to list \'{}\''.format(taskwarrior_task['trellolistname']))
                 logger.info('Task {} kicked to {} list in Trello'.format(taskwarrior_task['id'], taskwarrior_task['trellolistname']))
             else:
                 # Trello data is newer
+                completing = list_name == project.trello_done_list and not taskwarrior_task.completed
+                self.plan.taskwarrior('complete task' if completing else 'move task', '\'{}\''.format(taskwarrior_task['description']),
+                        'to list \'{}\''.format(list_name))
                 taskwarrior_task['trellolistname'] = list_name
-                if list_name == project.trello_done_list and not taskwarrior_task.completed:
-                    taskwarrior_task.save() # Must save before a status change to avoid data loss
-                    taskwarrior_task.done()
+                if completing:
+                    self.taskwarrior_client.complete_task(taskwarrior_task)
                     logger.info('Task {} kicked to done list in Taskwarrior'.format(taskwarrior_task['id']))
                 elif list_name == project.trello_doing_list:
                     if taskwarrior_task.completed:
                         taskwarrior_task['status'] = 'pending'
-                        taskwarrior_task.save()
-                        taskwarrior_task.start()
+                        taskwarrior_task['end'] = None
+                        self.taskwarrior_client.start_task(taskwarrior_task)
                     elif not taskwarrior_task.active:
-                        taskwarrior_task.save()
-                        taskwarrior_task.start()
+                        self.taskwarrior_client.start_task(taskwarrior_task)
                     else:
-                        taskwarrior_task.save()
+                        self.taskwarrior_client.save_task(taskwarrior_task)
                     logger.info('Task {} kicked to doing list in Taskwarrior'.format(taskwarrior_task['id']))
                 else:
                     if taskwarrior_task.completed:
                         taskwarrior_task['status'] = 'pending'
-                        taskwarrior_task.save()
+                        taskwarrior_task['end'] = None
+                        self.taskwarrior_client.save_task(taskwarrior_task)
                     elif taskwarrior_task.active:
-                        taskwarrior_task.save()
-                        taskwarrior_task.stop()
+                        self.taskwarrior_client.stop_task(taskwarrior_task)
                     else:
-                        taskwarrior_task.save()
+                        self.taskwarrior_client.save_task(taskwarrior_task)
                     logger.info('Task {} kicked to {} list in Taskwarrior'.format(taskwarrior_task['id'], taskwarrior_task['trellolistname']))
                 taskwarrior_task_modified = False # Avoid save again
                 logger.info('All changes in Taskwarrior task {} saved'.format(taskwarrior_task['id']))
         # Save Taskwarrior changes (if any)
         if taskwarrior_task_modified:
-            taskwarrior_task.save()
+            self.taskwarrior_client.save_task(taskwarrior_task)
             logger.info('All changes in Taskwarrior task {} saved'.format(taskwarrior_task['id']))
         # Task annotations <> Trello url and description
-        # WARNING: The task must be saved before play with annotations https://tasklib.readthedocs.io/en/latest/#working-with-annotations
-        taskwarrior_task_annotation_trello_url = None
-        taskwarrior_task_annotation_trello_description = [None, '']
-        if taskwarrior_task['annotations']:
-            for annotation in taskwarrior_task['annotations']:
-                # Look for Trello url
-                if annotation['description'][0:13].lower() == '[trello url] ':
-                    taskwarrior_task_annotation_trello_url = annotation
-                # Look for Trello description
-                if annotation['description'][0:21].lower() == '[trello description] ':
-                    taskwarrior_task_annotation_trello_description = [annotation, annotation['description'][21:]]
+        taskwarrior_task_annotation_trello_url, taskwarrior_task_annotation_trello_description = self.get_trello_annotations(taskwarrior_task)
         if taskwarrior_task_annotation_trello_url is None:
             # No previous url annotated
-            taskwarrior_task.add_annotation('[Trello URL] {}'.format(trello_card.short_url))
+            self.plan.taskwarrior('annotate task', '\'{}\''.format(taskwarrior_task['description']), 'Trello URL')
+            self.taskwarrior_client.add_annotation(taskwarrior_task, '[Trello URL] {}'.format(trello_card.short_url))
             logger.info('URL of task {} added'.format(taskwarrior_task['id']))
         elif taskwarrior_task_annotation_trello_url['description'][13:] != trello_card.short_url:
             # Cannot update annotations (see https://github.com/robgolding/tasklib/issues/91)
             # Delete old URL an add the new one
-            taskwarrior_task_annotation_trello_url.remove()
-            taskwarrior_task.add_annotation('[Trello URL] {}'.format(trello_card.short_url))
+            self.plan.taskwarrior('annotate task', '\'{}\''.format(taskwarrior_task['description']), 'Trello URL')
+            self.taskwarrior_client.remove_annotation(taskwarrior_task, taskwarrior_task_annotation_trello_url)
+            self.taskwarrior_client.add_annotation(taskwarrior_task, '[Trello URL] {}'.format(trello_card.short_url))
             logger.info('URL of task {} synchronized'.format(taskwarrior_task['id']))
         if taskwarrior_task_annotation_trello_description[1] != trello_card.description:
-            if taskwarrior_task['modified'] > trello_card.date_last_activity:
+            if taskwarrior_newer('description'):
                 # Taskwarrior data is newer
-                trello_card.set_description(taskwarrior_task_annotation_trello_description[1])
+                self.plan.trello('set description of card', '\'{}\''.format(trello_card.name), trello_card.id, trello_card.set_description, taskwarrior_task_annotation_trello_description[1])
             else:
                 # Trello data is newer (delete old description and add new one)
+                self.plan.taskwarrior('annotate task', '\'{}\''.format(taskwarrior_task['description']), 'Trello description')
                 if taskwarrior_task_annotation_trello_description[0] is not None:
-                    taskwarrior_task_annotation_trello_description[0].remove()
+                    self.taskwarrior_client.remove_annotation(taskwarrior_task, taskwarrior_task_annotation_trello_description[0])
                 if trello_card.description != '':
-                    taskwarrior_task.add_annotation('[Trello Description] {}'.format(trello_card.description))
+                    self.taskwarrior_client.add_annotation(taskwarrior_task, '[Trello Description] {}'.format(trello_card.description))
             logger.info('Description of task {} synchronized'.format(taskwarrior_task['id']))
 
-    def sync_project(self, project):
+    def sync_trello_card(self, project, list_name, trello_card):
+        """
+        Sync a Trello card with its Taskwarrior task, downloading it as a new
+        task if it is not in Taskwarrior yet
+
+        :param project: TrelloWarrior project object
+        :param list_name: name of the Trello list where the card is stored
+        :param trello_card: Trello card object
+        """
+        taskwarrior_task = self.taskwarrior_client.get_task_by_trello_id(trello_card.id)
+        if taskwarrior_task is None:
+            # Download new Trello card that not present in Taskwarrior
+            logger.info('Downloading Trello card with ID {} as new task in Taskwarrior'.format(trello_card.id))
+            taskwarrior_task = self.fetch_trello_card(project, list_name, trello_card)
+        else:
+            sync_state = self.sync_state.get(trello_card.id)
+            if (sync_state is not None and
+                    snapshot_hash(self.trello_card_snapshot(list_name, trello_card)) == sync_state[2] and
+                    snapshot_hash(self.taskwarrior_task_snapshot(project, taskwarrior_task)) == sync_state[2]):
+                # Nothing changed in any side since last sync
+                logger.debug('Task {} unchanged since last sync'.format(taskwarrior_task['id']))
+                return
+            # Sync Taskwarrior task with Trello card
+            self.sync_task_card(project, list_name, trello_card, taskwarrior_task, sync_state[1] if sync_state else None)
+        self.sync_state.set(project, trello_card.id, taskwarrior_task['uuid'], self.taskwarrior_task_snapshot(project, taskwarrior_task))
+
+    def sync_trello_cards(self, project, trello_cards_ids):
+        """
+        Sync some Trello cards with their Taskwarrior tasks, deleting the
+        tasks whose card is no longer in the synchronized lists
+
+        :param project: TrelloWarrior project object
+        :param trello_cards_ids: list of Trello cards IDs
+        """
+        self.taskwarrior_client.load_tasks_index()
+        trello_cards_dict = self.trello_client.get_cards_dict(trello_cards_ids)
+        trello_cards_found = set()
+        for trello_list_name in trello_cards_dict:
+            for trello_card in trello_cards_dict[trello_list_name]:
+                trello_cards_found.add(trello_card.id)
+                self.sync_trello_card(project, trello_list_name, trello_card)
+        for trello_card_id in set(trello_cards_ids) - trello_cards_found:
+            taskwarrior_task = self.taskwarrior_client.get_task_by_trello_id(trello_card_id)
+            if taskwarrior_task is not None and self.taskwarrior_client.in_project(taskwarrior_task) and not taskwarrior_task.deleted:
+                # Card was deleted, archived or moved out of synchronized lists
+                self.plan.taskwarrior('delete task', '\'{}\''.format(taskwarrior_task['description']), 'card deleted')
+                taskwarrior_task['trelloid'] = None
+                self.taskwarrior_client.delete_task(taskwarrior_task)
+                self.sync_state.delete(trello_card_id)
+                logger.info('Deleting previously deleted Trello task with ID {} from Taskwarrior'.format(trello_card_id))
+
+    def start_partial_sync(self, project):
+        """
+        Prepare clients to sync only some cards or tasks of a project
+
+        :param project: TrelloWarrior project object
+        """
+        self.plan = SyncPlan(project, self.trello_engine, self.taskwarrior_client)
+        self.taskwarrior_client.project(project)
+        self.trello_client.plan = self.plan
+        self.trello_client.reset() # Reload lists and labels, they may have changed since last partial sync
+        self.trello_client.project(project)
+
+    def end_partial_sync(self):
+        """
+        Apply the changes of a partial sync
+        """
+        self.plan.execute()
+        self.trello_client.plan = None
+        self.record_written_cards(self.plan.project, self.plan.trello_cards_ids())
+        self.sync_state.commit()
+
+    def record_written_cards(self, project, trello_cards_ids):
+        """
+        Add cards written by a partial sync to the sync watermark of project,
+        so next incremental sync does not take their changes as made in Trello
+
+        :param project: TrelloWarrior project object
+        :param trello_cards_ids: set of Trello cards IDs
+        """
+        if not trello_cards_ids:
+            return
+        written_until = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        def add_written_cards(data):
+            watermark = data.get('sync_watermarks', {}).get(project.name)
+            if watermark is None or watermark['board_id'] != self.trello_client.board_id:
+                return # Next sync of project is a full sync anyway
+            watermark['written_cards'] = written_cards(watermark)
+            watermark['written_cards'].update(dict.fromkeys(trello_cards_ids, written_until))
+        self.cache.change(add_written_cards)
+
+    def sync_card(self, project, trello_card_id):
+        """
+        Sync only one Trello card with its Taskwarrior task
+
+        :param project: TrelloWarrior project object
+        :param trello_card_id: Trello card ID
+        """
+        try:
+            self.start_partial_sync(project)
+            self.sync_trello_cards(project, [trello_card_id])
+            self.end_partial_sync()
+        except Exception:
+            self.discard_changes()
+            raise
+        logger.info('Trello card with ID {} of project {} synchronized'.format(trello_card_id, project.name))
+
+    def push_tasks(self, project, uuids):
+        """
+        Sync only some Taskwarrior tasks with Trello, uploading the new ones
+        and deleting the cards of deleted ones
+
+        :param project: TrelloWarrior project object
+        :param uuids: list of Taskwarrior tasks UUIDs
+        """
+        try:
+            self.start_partial_sync(project)
+            trello_cards_ids = []
+            for taskwarrior_task in self.taskwarrior_client.get_tasks_by_uuids(uuids):
+                if not self.taskwarrior_client.in_project(taskwarrior_task):
+                    continue # Moved out of project (or its subprojects), like in a full sync
+                if taskwarrior_task.deleted:
+                    if taskwarrior_task['trelloid']:
+                        self.delete_trello_card(taskwarrior_task)
+                elif taskwarrior_task['trelloid']:
+                    trello_cards_ids.append(taskwarrior_task['trelloid'])
+                elif taskwarrior_task.pending or taskwarrior_task.completed:
+                    self.upload_new_task(project, taskwarrior_task)
+            self.sync_trello_cards(project, trello_cards_ids)
+            self.end_partial_sync()
+        except Exception:
+            self.discard_changes()
+            raise
+        logger.info('{} Taskwarrior tasks of project {} pushed'.format(len(uuids), project.name))
+
+    def get_changed_cards_ids(self, project):
+        """
+        Get the IDs of Trello cards changed in Trello or in Taskwarrior since
+        last sync of project
+
+        :param project: TrelloWarrior project object
+        :return: a set of Trello cards IDs or None if a full sync is needed
+        :rtype: set
+        """
+        watermark = self.cache.get('sync_watermarks', {}).get(project.name)
+        if watermark is None or watermark['board_id'] != self.trello_client.board_id:
+            logger.info('No previous sync of project {}, doing full sync'.format(project.name))
+            return None
+        last_sync = dateparser.parse(watermark['date'])
+        # Incremental syncs can miss some changes (like the ones that Trello does not report as actions), a
+        # full sync now and then fixes the drift even if incremental syncs run often
+        if 'full_date' not in watermark or datetime.datetime.now(datetime.timezone.utc) - dateparser.parse(watermark['full_date']) > INCREMENTAL_SYNC_MAX_AGE:
+            logger.info('Last full sync of project {} is too old, doing full sync'.format(project.name))
+            return None
+        trello_actions = self.trello_client.get_board_actions(last_sync)
+        if trello_actions is None:
+            logger.info('Too many changes in Trello board of project {}, doing full sync'.format(project.name))
+            return None
+        # Cards changed by syncs themselves, by me and before they ended, are not changes to sync back
+        written_until = {trello_card_id: dateparser.parse(date) for trello_card_id, date in written_cards(watermark).items()}
+        changed_cards_ids = set()
+        for trello_action in trello_actions:
+            if trello_action['type'] in BOARD_WIDE_ACTIONS:
+                logger.info('Trello board of project {} has changes that affect several cards, doing full sync'.format(project.name))
+                return None
+            if 'card' in trello_action['data']:
+                trello_card_id = trello_action['data']['card']['id']
+                if (trello_card_id in written_until and dateparser.parse(trello_action['date']) <= written_until[trello_card_id] and
+                        trello_action.get('idMemberCreator') == self.trello_client.whoami):
+                    continue
+                changed_cards_ids.add(trello_card_id)
+        for taskwarrior_task in self.taskwarrior_client.get_modified_tasks(last_sync):
+            if not taskwarrior_task['trelloid']:
+                continue
+            # Tasks modified by last sync itself are as they were synchronized
+            sync_state = self.sync_state.get(taskwarrior_task['trelloid'])
+            if sync_state is not None and snapshot_hash(self.taskwarrior_task_snapshot(project, taskwarrior_task)) == sync_state[2]:
+                continue
+            changed_cards_ids.add(taskwarrior_task['trelloid'])
+        logger.info('Found {} changed cards in project {} since last sync'.format(len(changed_cards_ids), project.name))
+        return changed_cards_ids
+
+    def sync_due(self, project):
+        """
+        Check if the sync interval of a project has elapsed since its last
+        sync, with a random jitter
+
+        :param project: TrelloWarrior project object
+        :return: True if project must be synchronized
+        :rtype: boolean
+        """
+        last_sync = self.cache.get('last_syncs', {}).get(project.name)
+        if project.sync_interval <= 0 or last_sync is None:
+            return True
+        elapsed = datetime.datetime.now(datetime.timezone.utc) - dateparser.parse(last_sync)
+        interval = datetime.timedelta(minutes=project.sync_interval) * (1 - random.uniform(0, SYNC_INTERVAL_JITTER))
+        return elapsed >= interval
+
+    def attach_stats(self, stats):
+        """
+        Record in some stats the work done by clients, or stop recording
+
+        :param stats: SyncStats object or None
+        """
+        self.trello_client.stats = stats
+        self.trello_client.scheduler.stats = stats
+        self.taskwarrior_client.stats = stats
+
+    def sync_project(self, project, full_sync=False, dry_run=False):
         """
         Sync a Taskwarrior project with a Trello board
+        Every step plans its changes and executes them before next step
 
         :param project: TrelloWarrior project object
+        :param full_sync: force full sync in incremental sync projects (False by default)
+        :param dry_run: only plan the changes without applying them (False by default)
+        :return: the sync plan with all changes and its stats
+        :rtype: SyncPlan
         """
+        stats = SyncStats(project.name)
+        self.attach_stats(stats)
+        try:
+            plan = self._sync_project(project, full_sync, dry_run, stats)
+            if not dry_run:
+                self.metrics.record(project.name, stats, plan)
+            return plan
+        except Exception:
+            self.discard_changes()
+            if not dry_run:
+                self.metrics.record(project.name, stats)
+            raise
+        finally:
+            stats.stop()
+            self.attach_stats(None)
+
+    def discard_changes(self):
+        """
+        Forget the changes queued by a failed sync, so the next sync made with
+        this client does not apply them
+        """
+        self.trello_engine.discard()
+        self.taskwarrior_client.discard()
+        self.sync_state.rollback()
+        self.trello_client.plan = None
+        self.trello_client.reset() # Lists and labels may not be the ones in Trello
+
+    def _sync_project(self, project, full_sync, dry_run, stats):
+        sync_start = datetime.datetime.now(datetime.timezone.utc)
+        sync_date = sync_start - INCREMENTAL_SYNC_MARGIN
+        stats.phase('prepare')
+        self.plan = SyncPlan(project, self.trello_engine, self.taskwarrior_client, dry_run=dry_run)
+        self.plan.stats = stats
         # Initialize clients
         self.taskwarrior_client.project(project)
+        self.trello_client.plan = self.plan
         self.trello_client.project(project)
-        # Get all Taskwarrior deleted tasks and seek for ones that have trelloid (deleted in Taskwarrior)
+        # Get changes since last sync if possible (None means sync all cards)
+        changed_cards_ids = None
+        if project.incremental_sync and not full_sync:
+            changed_cards_ids = self.get_changed_cards_ids(project)
+        # Get Taskwarrior deleted tasks that still have trelloid (deleted in Taskwarrior but not in Trello yet)
         logger.info('Syncing project {} step 1: delete Trello cards that already deleted in Taskwarrior'.format(project.name))
-        taskwarrior_deleted_tasks = self.taskwarrior_client.get_deleted_tasks()
-        for taskwarrior_deleted_task in taskwarrior_deleted_tasks:
+        stats.phase('delete cards')
+        # Tasks deleted before last completed step 1 were already processed (full sync checks all again)
+        deleted_since = None
+        deleted_watermark = self.cache.get('deleted_watermarks', {}).get(project.name)
+        if not full_sync and deleted_watermark is not None and deleted_watermark['board_id'] == self.trello_client.board_id:
+            deleted_since = dateparser.parse(deleted_watermark['date'])
+        deleted_date = datetime.datetime.now(datetime.timezone.utc) - INCREMENTAL_SYNC_MARGIN
+        deleted_trello_cards_ids = set()
+        deletions = []
+        for taskwarrior_deleted_task in self.taskwarrior_client.get_deleted_tasks(since=deleted_since):
             if taskwarrior_deleted_task['trelloid']:
-                logger.info('Deleting previously deleted Taskwarrior task with ID {} from Trello'.format(taskwarrior_deleted_task['trelloid']))
-                self.trello_client.delete_card(taskwarrior_deleted_task['trelloid'])
-                taskwarrior_deleted_task['trelloid'] = None
-                taskwarrior_deleted_task.save()
+                deleted_trello_cards_ids.add(taskwarrior_deleted_task['trelloid'])
+                deletions.append(self.delete_trello_card(taskwarrior_deleted_task))
+        try:
+            self.plan.execute()
+        finally:
+            self.report_card_deletions(project, deletions)
+        if not dry_run:
+            self.cache.update('deleted_watermarks', {project.name: {'board_id': self.trello_client.board_id, 'date': deleted_date.isoformat()}})
         # Compare and sync Taskwarrior with Trello
         logger.info('Syncing project {} step 2: syncing changes between Taskwarrior and Trello'.format(project.name))
-        trello_cards_dict = self.trello_client.get_cards_dict()
+        stats.phase('sync cards')
+        self.taskwarrior_client.load_tasks_index() # Index after step 1 changes to avoid one export per card
+        trello_cards_dict = self.trello_client.get_cards_dict(changed_cards_ids)
         trello_cards_ids = [] # List to store cards IDs to compare later with local trelloid
         for trello_list_name in trello_cards_dict:
             for trello_card in trello_cards_dict[trello_list_name]:
-                # Fech all data from card
-                trello_card.fetch(False) # Pass False to fetch to avoid download attachments
+                if trello_card.id in deleted_trello_cards_ids:
+                    continue # Only in dry run, deleted cards are still in Trello
                 trello_cards_ids.append(trello_card.id)
-                taskwarrior_task = self.taskwarrior_client.get_task_by_trello_id(trello_card.id)
-                if taskwarrior_task is None:
-                    # Download new Trello card that not present in Taskwarrior
-                    logger.info('Downloading Trello card with ID {} as new task in Taskwarrior'.format(trello_card.id))
-                    self.fetch_trello_card(project, trello_list_name, trello_card)
-                else:
-                    # Sync Taskwarrior task with Trello card
-                    self.sync_task_card(project, trello_list_name, trello_card, taskwarrior_task)
+                self.sync_trello_card(project, trello_list_name, trello_card)
+        self.plan.execute()
         # Compare Trello and Taskwarrior tasks for remove deleted Trello tasks in Taskwarrior
         logger.info('Syncing project {} step 3: delete Takswarrior tasks that already deleted in Trello'.format(project.name))
+        stats.phase('delete tasks')
         taskwarrior_tasks_ids = self.taskwarrior_client.get_tasks_ids_set()
         taskwarrior_tasks_ids.discard(None) # Remove None element if present (new tasks created with Taskwarrior)
         trello_cards_ids = set(trello_cards_ids) # Convert trello_cards_ids list in a set
+        if changed_cards_ids is not None:
+            taskwarrior_tasks_ids &= changed_cards_ids # Only changed cards can be deleted in incremental sync
         for deleted_trello_task_id in taskwarrior_tasks_ids - trello_cards_ids:
             taskwarrior_task_to_delete = self.taskwarrior_client.get_task_by_trello_id(deleted_trello_task_id)
+            self.plan.taskwarrior('delete task', '\'{}\''.format(taskwarrior_task_to_delete['description']), 'card deleted')
             taskwarrior_task_to_delete['trelloid'] = None
-            taskwarrior_task_to_delete.save()
-            taskwarrior_task_to_delete.delete()
+            self.taskwarrior_client.delete_task(taskwarrior_task_to_delete)
+            self.sync_state.delete(deleted_trello_task_id)
             logger.info('Deleting previously deleted Trello task with ID {} from Taskwarrior'.format(deleted_trello_task_id))
+        self.plan.execute()
         # Upload new Taskwarrior tasks that never uploaded before
         logger.info('Syncing project {} step 4: upload new Takswarrior tasks'.format(project.name))
-        for taskwarrior_pending_task in self.taskwarrior_client.get_pending_tasks():
-            logger.info('Uploading new pending Taskwarrior task with ID {} to Trello'.format(taskwarrior_pending_task['id']))
-            if taskwarrior_pending_task.active:
-                # Upload new pending active task to doing list
-                self.upload_taskwarrior_task(project, taskwarrior_pending_task, self.trello_client.get_list(project.trello_doing_list))
-                taskwarrior_pending_task['trellolistname'] = project.trello_doing_list
-                taskwarrior_pending_task.save()
-            else:
-                if taskwarrior_pending_task['trellolistname']:
-                    # Upload new pending task to user provided list
-                    self.upload_taskwarrior_task(project, taskwarrior_pending_task, self.trello_client.get_list(taskwarrior_pending_task['trellolistname']))
-                else:
-                    # Upload new pending task to default todo list
-                    self.upload_taskwarrior_task(project, taskwarrior_pending_task, self.trello_client.get_list(project.trello_todo_list))
-                    taskwarrior_pending_task['trellolistname'] = project.trello_todo_list
-                    taskwarrior_pending_task.save()
-        for taskwarrior_completed_task in self.taskwarrior_client.get_completed_tasks():
-            logger.info('Uploading new completed Taskwarrior task to Trello')
-            self.upload_taskwarrior_task(project, taskwarrior_completed_task, self.trello_client.get_list(project.trello_done_list))
-            taskwarrior_completed_task['trellolistname'] = project.trello_done_list
-            taskwarrior_completed_task.save()
+        stats.phase('upload tasks')
+        taskwarrior_project_view = self.taskwarrior_client.get_project_view()
+        for taskwarrior_pending_task in taskwarrior_project_view.tasks('pending'):
+            self.upload_new_task(project, taskwarrior_pending_task)
+        for taskwarrior_completed_task in taskwarrior_project_view.tasks('completed'):
+            self.upload_new_task(project, taskwarrior_completed_task)
+        self.plan.execute() # Stores the Trello IDs of uploaded cards even if some upload fails
+        self.trello_client.plan = None
+        stats.phase('save')
+        self.plan.trello_reads = stats.counters['trello_requests'] - (0 if dry_run else self.plan.trello_writes())
+        if dry_run:
+            self.trello_client.reset() # Drop lists and labels that were not created
+            self.sync_state.rollback()
+            logger.info('Project {} sync planned'.format(project.name))
+            return self.plan
+        # Store sync date for next incremental sync and for sync interval
+        written_until = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        full_date = sync_date.isoformat()
+        if changed_cards_ids is not None:
+            full_date = self.cache.get('sync_watermarks', {}).get(project.name, {}).get('full_date', full_date)
+        self.cache.update('sync_watermarks', {project.name: {'board_id': self.trello_client.board_id, 'date': sync_date.isoformat(),
+            'full_date': full_date, 'written_cards': dict.fromkeys(sorted(self.plan.trello_cards_ids()), written_until)}})
+        self.cache.update('last_syncs', {project.name: sync_start.isoformat()})
+        self.sync_state.commit()
+        logger.debug('Project {} Trello requests: {}, retries: {}, throttled: {:.1f}s'.format(project.name,
+            *[stats.counters[counter] for counter in ['trello_requests', 'trello_retries', 'trello_throttled_seconds']]))
         logger.info('Project {} synchronized'.format(project.name))
+        return self.plan
@@ -54,6 +54,10 @@ def config_project_add(args):
         config_editor.write(args.name, 'trello_lists_filter', args.filter)
     if args.only_my_cards:
         config_editor.write(args.name, 'only_my_cards', True)
+    if args.incremental_sync:
+        config_editor.write(args.name, 'incremental_sync', True)
+    if args.sync_interval:
+        config_editor.write(args.name, 'sync_interval', args.sync_interval)
 
     if not args.disabled:
         # Add project to enabled projects
@@ -64,7 +68,7 @@ def config_project_add(args):
 
 def config_project_modify(args):
     # Check if user provides any option
-    if not any([args.taskwarrior, args.trello, args.todo, args.doing, args.done, args.filter, args.only_my_cards]):
+    if not any([args.taskwarrior, args.trello, args.todo, args.doing, args.done, args.filter, args.only_my_cards, args.incremental_sync, args.sync_interval is not None]):
         sys.stderr.write('Must provide an option to modify\n')
         sys.exit(1)
 
@@ -90,6 +94,10 @@ def config_project_modify(args):
         config_editor.write(args.name, 'trello_lists_filter', args.filter)
     if args.only_my_cards is not None:
         config_editor.write(args.name, 'only_my_cards', True if args.only_my_cards == 'yes' else False)
+    if args.incremental_sync is not None:
+        config_editor.write(args.name, 'incremental_sync', True if args.incremental_sync == 'yes' else False)
+    if args.sync_interval is not None:
+        config_editor.write(args.name, 'sync_interval', args.sync_interval)
 
     config_editor.save()
     logger.info('Project \'{}\' modified'.format(args.name))
@@ -124,6 +132,15 @@ def config_project_show(args):
         sys.stdout.write('Sync only my cards: {}\n'.format(config_editor.readboolean(args.name, 'only_my_cards')))
     except ValueError:
         sys.stdout.write('Warning: misconfigured only_my_cards option\n')
+    try:
+        sys.stdout.write('Incremental sync: {}\n'.format(config_editor.readboolean(args.name, 'incremental_sync')))
+    except ValueError:
+        sys.stdout.write('Warning: misconfigured incremental_sync option\n')
+    try:
+        sync_interval = int(config_editor.read(args.name, 'sync_interval', '0'))
+        sys.stdout.write('Sync interval: {}\n'.format('{} minutes'.format(sync_interval) if sync_interval > 0 else 'every sync'))
+    except ValueError:
+        sys.stdout.write('Warning: misconfigured sync_interval option\n')
 
 def config_project_enable(args):
     # Open config
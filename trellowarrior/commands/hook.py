@@ -0,0 +1,32 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2015-2020 Óscar García Amor <ogarcia@connectical.com>
+#
+# Distributed under terms of the GNU GPLv3 license.
+
+from trellowarrior.config import config
+from trellowarrior.taskqueue import TaskQueue
+
+import logging
+import os
+import sys
+
+logger = logging.getLogger(__name__)
+
+def hooks_location():
+    return os.path.join(os.path.expanduser(config.taskwarrior_data_location), 'hooks')
+
+def hook_install(args):
+    taskwarrior_projects_names = [project.taskwarrior_project_name for project in config.sync_projects]
+    for hook in TaskQueue(config.task_queue_location).install_hooks(hooks_location(), taskwarrior_projects_names):
+        sys.stdout.write('Installed Taskwarrior hook {}\n'.format(hook))
+
+def hook_remove(args):
+    hooks = TaskQueue(config.task_queue_location).remove_hooks(hooks_location())
+    if hooks == []:
+        sys.stderr.write('No TrelloWarrior hooks installed in {}\n'.format(hooks_location()))
+        sys.exit(1)
+    for hook in hooks:
+        sys.stdout.write('Removed Taskwarrior hook {}\n'.format(hook))
@@ -0,0 +1,43 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2015-2020 Óscar García Amor <ogarcia@connectical.com>
+#
+# Distributed under terms of the GNU GPLv3 license.
+
+from trellowarrior.clients.trellowarrior import TrelloWarriorClient
+from trellowarrior.config import config
+from trellowarrior.taskqueue import TaskQueue
+
+import logging
+import sys
+
+logger = logging.getLogger(__name__)
+
+def push(args):
+    task_queue = TaskQueue(config.task_queue_location)
+    queued = task_queue.drain()
+    failed_projects = []
+    try:
+        trellowarrior_client = None
+        for project in config.sync_projects:
+            uuids = queued.get(project.taskwarrior_project_name)
+            if not uuids:
+                continue
+            if trellowarrior_client is None:
+                trellowarrior_client = TrelloWarriorClient(config)
+            try:
+                trellowarrior_client.push_tasks(project, sorted(uuids))
+                del queued[project.taskwarrior_project_name]
+            except Exception:
+                logger.exception('Project {} failed to push'.format(project.name))
+                failed_projects.append(project.name)
+        if trellowarrior_client is None:
+            logger.info('No queued tasks to push')
+    finally:
+        # Keep failed and not synchronized projects tasks for next push or sync
+        task_queue.put_back(queued)
+    if failed_projects:
+        logger.error('Failed projects: {}'.format(', '.join(failed_projects)))
+        sys.exit(1)
@@ -6,10 +6,210 @@
 #
 # Distributed under terms of the GNU GPLv3 license.
 
+from trellowarrior.clients.cassette import CassettePlayer, CassetteRecorder, cassette_cache_location
+from trellowarrior.clients.taskwarrior import TaskSnapshot
 from trellowarrior.clients.trellowarrior import TrelloWarriorClient
 from trellowarrior.config import config
+from trellowarrior.profiler import profile_project
+from trellowarrior.stats import format_stats
+from trellowarrior.taskqueue import TaskQueue
+
+from concurrent.futures import ThreadPoolExecutor
+
+import json
+import logging
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+def print_plan(plan):
+    sys.stdout.write('Project \'{}\':\n'.format(plan.project.name))
+    if not plan.operations:
+        sys.stdout.write('  Nothing to do\n')
+    for operation in plan.operations:
+        sys.stdout.write('  {}\n'.format(operation))
+    sys.stdout.write('  {} changes in Trello and {} in Taskwarrior, about {} Trello API calls ({} reads and {} writes)\n'.format(
+        plan.trello_writes(), plan.taskwarrior_changes(), plan.trello_reads + plan.trello_writes(), plan.trello_reads, plan.trello_writes()))
+
+def write_stats(args, plans):
+    stats_list = [plan.stats for plan in plans]
+    if args.stats:
+        sys.stdout.write(format_stats(stats_list))
+    if args.stats_json:
+        with open(args.stats_json, 'w') as stats_file:
+            json.dump([stats.as_dict() for stats in stats_list], stats_file, indent=2)
+            stats_file.write('\n')
+        logger.info('Sync stats written in {}'.format(args.stats_json))
+
+def open_cassette(args):
+    """
+    Open the cassette where record Trello requests, or from where replay them
+
+    :return: CassetteRecorder or CassettePlayer object, None if not recording or replaying
+    """
+    secrets = [config.trello_api_key, config.trello_api_secret, config.trello_token, config.trello_token_secret]
+    if args.record:
+        logger.info('Recording Trello requests in {}'.format(args.record))
+        return CassetteRecorder(args.record, secrets, cache_location=config.cache_location)
+    if args.replay:
+        if not os.path.isfile(args.replay):
+            logger.error('Cassette {} does not exist'.format(args.replay))
+            sys.exit(1)
+        # Every replay starts from a copy of the cache that the recorded sync had
+        replay_cache_location = os.path.join(tempfile.mkdtemp(prefix='trellowarrior-replay-'), 'cache')
+        if os.path.isdir(cassette_cache_location(args.replay)):
+            shutil.copytree(cassette_cache_location(args.replay), replay_cache_location)
+        config.cache_location = replay_cache_location
+        config.task_queue_location = os.path.join(replay_cache_location, 'taskqueue')
+        # Replayed answers never change the real Taskwarrior data, only a copy of the given snapshot
+        if args.replay_taskdata is None:
+            logger.warning('No Taskwarrior data snapshot given with --replay-taskdata, replaying as a dry run')
+            args.dry_run = True
+        else:
+            taskdata_location = os.path.realpath(os.path.expanduser(args.replay_taskdata))
+            if taskdata_location == os.path.realpath(os.path.expanduser(config.taskwarrior_data_location)):
+                logger.error('Taskwarrior data snapshot {} is the configured Taskwarrior data, refusing to replay against it'.format(args.replay_taskdata))
+                sys.exit(1)
+            if not os.path.isdir(taskdata_location):
+                logger.error('Taskwarrior data snapshot {} does not exist'.format(args.replay_taskdata))
+                sys.exit(1)
+            config.taskwarrior_data_location = os.path.join(os.path.dirname(replay_cache_location), 'taskdata')
+            shutil.copytree(taskdata_location, config.taskwarrior_data_location)
+        logger.info('Replaying Trello requests from {}'.format(args.replay))
+        return CassettePlayer(args.replay, secrets, latency=args.replay_latency / 1000)
+    return None
+
+def close_cassette(args, cassette):
+    if cassette is None:
+        return
+    cassette.close()
+    if args.replay:
+        shutil.rmtree(os.path.dirname(config.cache_location), ignore_errors=True)
+
+def new_client(cassette, cache=None):
+    """
+    Create a TrelloWarrior client, recording or replaying its Trello requests
+    if there is a cassette
+
+    :return: TrelloWarriorClient object
+    """
+    trellowarrior_client = TrelloWarriorClient(config, cache=cache)
+    if cassette is not None:
+        cassette.install(trellowarrior_client.trello_client.scheduler)
+    return trellowarrior_client
+
+def run_project_sync(args, trellowarrior_client, project):
+    """
+    Sync a project, profiling it if asked
+
+    :return: sync plan
+    :rtype: SyncPlan
+    """
+    if args.profile is None:
+        return trellowarrior_client.sync_project(project, full_sync=args.full, dry_run=args.dry_run)
+    with profile_project(args.profile, args.profile_dir, project.name) as profile:
+        plan = trellowarrior_client.sync_project(project, full_sync=args.full, dry_run=args.dry_run)
+        profile.stats = plan.stats
+        return plan
 
 def sync(args):
-    trellowarrior_client = TrelloWarriorClient(config)
-    for project in config.sync_projects:
-        trellowarrior_client.sync_project(project)
+    cassette = open_cassette(args)
+    try:
+        trellowarrior_client = new_client(cassette)
+        # Sync takes care of the tasks queued by Taskwarrior hooks of synchronized projects
+        task_queue = TaskQueue(config.task_queue_location)
+        queued = task_queue.drain()
+        try:
+            plans, failed_projects = sync_projects(args, trellowarrior_client, cassette)
+            if not args.dry_run:
+                for plan in plans:
+                    queued.pop(plan.project.taskwarrior_project_name, None)
+        finally:
+            task_queue.put_back(queued)
+            # Replayed syncs are not real ones
+            if config.metrics_file is not None and not args.dry_run and not args.replay:
+                trellowarrior_client.metrics.write_textfile(config.metrics_file)
+    finally:
+        close_cassette(args, cassette)
+    write_stats(args, plans)
+    if failed_projects:
+        logger.error('Failed projects: {}'.format(', '.join(failed_projects)))
+        sys.exit(1)
+
+def sync_projects(args, trellowarrior_client, cassette=None):
+    """
+    Sync the configured projects
+
+    :param trellowarrior_client: TrelloWarriorClient object
+    :param cassette: cassette that records or replays Trello requests, if any
+    :return: list of sync plans of synchronized projects and list of failed projects names
+    :rtype: tuple
+    """
+    projects = config.sync_projects
+    if not args.force and not args.projects:
+        # Sync intervals only apply when synchronizing all enabled projects
+        projects = [project for project in projects if trellowarrior_client.sync_due(project)]
+        for project in config.sync_projects:
+            if project not in projects:
+                logger.info('Skipping project {}, its sync interval has not elapsed'.format(project.name))
+    # On SIGTERM (like a stopped systemd unit) finish running projects but do not start new ones
+    stopping = threading.Event()
+    def stop(signum, frame):
+        logger.warning('Stopping, projects not started yet will not be synchronized')
+        stopping.set()
+    signal.signal(signal.SIGTERM, stop)
+    # All projects read their tasks from one Taskwarrior export (the direct reader already reads files once)
+    snapshot = None
+    if config.taskwarrior_reader == 'task':
+        snapshot = TaskSnapshot([project.taskwarrior_project_name for project in projects], config.taskwarrior_data_location)
+        trellowarrior_client.taskwarrior_client.snapshot = snapshot
+    jobs = min(args.jobs, len(projects))
+    if args.profile is not None and jobs > 1:
+        # Profiles of projects synchronized at the same time would mix
+        logger.warning('Profiling, projects will be synchronized one by one')
+        jobs = 1
+    plans = []
+    failed_projects = []
+    if jobs <= 1:
+        for project in projects:
+            if stopping.is_set():
+                break
+            try:
+                plan = run_project_sync(args, trellowarrior_client, project)
+            except Exception:
+                logger.exception('Project {} failed to sync'.format(project.name))
+                failed_projects.append(project.name)
+                continue
+            plans.append(plan)
+            if args.dry_run:
+                print_plan(plan)
+        return plans, failed_projects
+    # Every worker thread needs its own client since clients keep project state
+    worker = threading.local()
+    def sync_project(project):
+        if stopping.is_set():
+            return None
+        threading.current_thread().name = project.name # Used in log messages
+        if not hasattr(worker, 'trellowarrior_client'):
+            worker.trellowarrior_client = new_client(cassette, cache=trellowarrior_client.cache)
+            worker.trellowarrior_client.taskwarrior_client.snapshot = snapshot
+        return worker.trellowarrior_client.sync_project(project, full_sync=args.full, dry_run=args.dry_run)
+    logger.info('Syncing {} projects with {} jobs'.format(len(projects), jobs))
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [(project, executor.submit(sync_project, project)) for project in projects]
+        for project, future in futures:
+            try:
+                plan = future.result()
+                if plan is not None:
+                    plans.append(plan)
+                if args.dry_run and plan is not None:
+                    print_plan(plan)
+            except Exception:
+                logger.exception('Project {} failed to sync'.format(project.name))
+                failed_projects.append(project.name)
+    return plans, failed_projects
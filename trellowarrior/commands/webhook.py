@@ -0,0 +1,44 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2015-2020 Óscar García Amor <ogarcia@connectical.com>
+#
+# Distributed under terms of the GNU GPLv3 license.
+
+from trellowarrior.clients.trellowarrior import TrelloWarriorClient
+from trellowarrior.config import config
+from trellowarrior.webhook import WebhookApplication
+
+from wsgiref.simple_server import make_server, WSGIRequestHandler
+
+import logging
+import sys
+
+logger = logging.getLogger(__name__)
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+def webhook(args):
+    if not config.trello_api_secret:
+        # Requests could not be checked and anyone reaching the listener could trigger syncs
+        sys.stderr.write('The webhook listener needs trello_api_secret to check that requests come from Trello\n')
+        sys.exit(1)
+    trellowarrior_client = TrelloWarriorClient(config)
+    application = WebhookApplication(trellowarrior_client, config.sync_projects,
+            api_secret=config.trello_api_secret, callback_url=args.callback_url, metrics_file=config.metrics_file)
+    for project in config.sync_projects:
+        trellowarrior_client.trello_client.project(project)
+        trellowarrior_client.trello_client.register_webhook(args.callback_url)
+    application.start()
+    server = make_server(args.host, args.port, application, handler_class=QuietRequestHandler)
+    logger.warning('Listening for Trello webhooks in http://{}:{}/'.format(args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        application.stop()
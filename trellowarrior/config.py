@@ -6,9 +6,13 @@
 #
 # Distributed under terms of the GNU GPLv3 license.
 
+from trellowarrior.clients.scheduler import TRELLO_API_URL, TRELLO_POOL_SIZE
+from trellowarrior.clients.taskfiles import TASKWARRIOR_READERS
+from trellowarrior.clients.trelloengine import TRELLO_CONCURRENCY
 from trellowarrior.trellowarriorproject import TrelloWarriorProject
 from configparser import RawConfigParser, NoOptionError
 
+import hashlib
 import logging
 import os
 
@@ -25,28 +29,36 @@ class Config:
     def __init__(self):
         # Configure defaults
         self.config_file = None
+        self.cache_location = None
+        self.task_queue_location = None
         self.taskwarrior_taskrc_location = None
         self.taskwarrior_data_location = None
+        self.taskwarrior_reader = 'task'
         self.trello_api_key = None
         self.trello_api_secret = None
         self.trello_token = None
         self.trello_token_secret = None
+        self.trello_api_url = TRELLO_API_URL
+        self.trello_pool_size = TRELLO_POOL_SIZE
+        self.trello_concurrency = TRELLO_CONCURRENCY
+        self.metrics_file = None
         self.sync_projects = []
 
     def configure(self, **kwargs):
         # Get config file location
         self.config_file = kwargs.get('config_file', None)
+        user_home = os.path.expanduser('~')
+        config_home = os.environ.get('XDG_CONFIG_HOME', os.path.join(user_home, '.config'))
         # No config file passed, search for it in default locations
         if self.config_file == None:
-            user_home = os.path.expanduser('~')
-            config_home = os.environ.get('XDG_CONFIG_HOME', os.path.join(user_home, '.config'))
             defaults_config_files = [ './trellowarrior.conf',
                     os.path.join(user_home, '.trellowarrior.conf'),
                     os.path.join(config_home, 'trellowarrior/trellowarrior.conf') ]
             config_files = [file for file in defaults_config_files if os.access(file, os.R_OK)]
             self.config_file = config_files[0] if config_files != [] else None
 
-        if self.config_file == None:
+        config_file_exists = self.config_file != None
+        if not config_file_exists:
             # No config file exists, use XDG_CONFIG location
             self.config_file = os.path.join(config_home, 'trellowarrior/trellowarrior.conf')
             config_directory = os.path.join(config_home, 'trellowarrior')
@@ -55,7 +67,15 @@ class Config:
                 logger.debug('Creating config directory {}'.format(config_directory))
                 os.makedirs(config_directory, exist_ok=True)
             logger.debug('No config file exists, using {} as config file'.format(self.config_file))
-        elif kwargs.get('parse_config_file', True):
+
+        # Every config file has its own cache directory
+        cache_home = os.environ.get('XDG_CACHE_HOME', os.path.join(user_home, '.cache'))
+        config_file_hash = hashlib.sha1(os.path.abspath(self.config_file).encode('utf-8')).hexdigest()[:16]
+        self.cache_location = os.path.join(cache_home, 'trellowarrior', config_file_hash)
+        logger.debug('Using {} as cache directory'.format(self.cache_location))
+        self.task_queue_location = os.path.join(self.cache_location, 'taskqueue')
+
+        if config_file_exists and kwargs.get('parse_config_file', True):
             logger.debug('Using {} as config file'.format(self.config_file))
             # Parse the config
             config_parser = RawConfigParser()
@@ -64,6 +84,11 @@ class Config:
             # Get the TaskWarrior info from config
             self.taskwarrior_taskrc_location = config_parser.get('DEFAULT', 'taskwarrior_taskrc_location', fallback='~/.taskrc')
             self.taskwarrior_data_location = config_parser.get('DEFAULT', 'taskwarrior_data_location', fallback='~/.task')
+            taskwarrior_reader = config_parser.get('DEFAULT', 'taskwarrior_reader', fallback='task')
+            if taskwarrior_reader in TASKWARRIOR_READERS:
+                self.taskwarrior_reader = taskwarrior_reader
+            else:
+                logger.warning('Option \'taskwarrior_reader\' is misconfigured, ignoring it')
 
             # Get the auth info from config
             MandatoryExit = lambda option: SystemExit('Missing mandatory entry \'{}\' in config file'.format(option))
@@ -84,6 +109,22 @@ class Config:
             except NoOptionError:
                 raise MandatoryExit('trello_token_secret')
 
+            # Get the Trello connection settings from config
+            self.trello_api_url = config_parser.get('DEFAULT', 'trello_api_url', fallback=TRELLO_API_URL)
+            try:
+                self.trello_pool_size = config_parser.getint('DEFAULT', 'trello_pool_size', fallback=TRELLO_POOL_SIZE)
+            except ValueError:
+                logger.warning('Option \'trello_pool_size\' is misconfigured, ignoring it')
+            try:
+                self.trello_concurrency = config_parser.getint('DEFAULT', 'trello_concurrency', fallback=TRELLO_CONCURRENCY)
+            except ValueError:
+                logger.warning('Option \'trello_concurrency\' is misconfigured, ignoring it')
+
+            # Get where write sync metrics (if wanted)
+            self.metrics_file = config_parser.get('DEFAULT', 'metrics_file', fallback=None)
+            if self.metrics_file is not None:
+                self.metrics_file = os.path.expanduser(self.metrics_file)
+
             # Get the projects to sync
             projects = kwargs.get('projects') if kwargs.get('projects', []) != [] else config_parser.get('DEFAULT', 'sync_projects', fallback='').split()
             for project in projects:
@@ -117,6 +158,16 @@ class Config:
                         except ValueError:
                             only_my_cards = False
                             logger.warning('Option \'only_my_cards\' is misconfigured in project \'{}\', ignoring it'.format(project))
+                        try:
+                            incremental_sync = config_parser.getboolean(project, 'incremental_sync', fallback=False)
+                        except ValueError:
+                            incremental_sync = False
+                            logger.warning('Option \'incremental_sync\' is misconfigured in project \'{}\', ignoring it'.format(project))
+                        try:
+                            sync_interval = config_parser.getint(project, 'sync_interval', fallback=0)
+                        except ValueError:
+                            sync_interval = 0
+                            logger.warning('Option \'sync_interval\' is misconfigured in project \'{}\', ignoring it'.format(project))
                         self.sync_projects.append(TrelloWarriorProject(project,
                             taskwarrior_project_name,
                             config_parser.get(project, 'trello_board_name'),
@@ -124,7 +175,9 @@ class Config:
                             trello_doing_list = doing_list,
                             trello_done_list = done_list,
                             trello_lists_filter = lists_filter,
-                            only_my_cards = only_my_cards))
+                            only_my_cards = only_my_cards,
+                            incremental_sync = incremental_sync,
+                            sync_interval = sync_interval))
                 else:
                     logger.warning('Missing config section for sync project \'{}\', ignoring it'.format(project))
             if self.sync_projects == []:
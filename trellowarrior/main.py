@@ -10,9 +10,13 @@ from trellowarrior.commands.auth import auth
 from trellowarrior.commands.configedit import config_get, config_set, config_remove
 from trellowarrior.commands.configprojectedit import config_project_list, config_project_add, config_project_modify, config_project_show
 from trellowarrior.commands.configprojectedit import config_project_enable, config_project_disable, config_project_remove
+from trellowarrior.commands.hook import hook_install, hook_remove
+from trellowarrior.commands.push import push
 from trellowarrior.commands.sync import sync
 from trellowarrior.commands.version import version
+from trellowarrior.commands.webhook import webhook
 from trellowarrior.config import config
+from trellowarrior.profiler import PROFILE_MODES
 
 import argparse
 import logging
@@ -31,13 +35,59 @@ def main():
     parser.add_argument('-v', '--verbose', action='count', default=0, help='be verbose (add more v to increase verbosity)')
     parser.set_defaults(func=sync) # Perform sync if no command given
     parser.set_defaults(projects=[]) # No forced projects by default
+    parser.set_defaults(full=False) # Incremental sync where enabled by default
+    parser.set_defaults(jobs=1) # Sync projects one by one by default
+    parser.set_defaults(dry_run=False) # Apply changes by default
+    parser.set_defaults(force=False) # Respect projects sync intervals by default
+    parser.set_defaults(stats=False) # No sync stats by default
+    parser.set_defaults(stats_json=None)
+    parser.set_defaults(record=None) # Neither record nor replay Trello requests by default
+    parser.set_defaults(replay=None)
+    parser.set_defaults(replay_latency=0)
+    parser.set_defaults(replay_taskdata=None)
+    parser.set_defaults(profile=None) # No profiling by default
+    parser.set_defaults(profile_dir='.')
     subparsers = parser.add_subparsers(dest='command')
     subparsers.required = False
 
     sync_parser = subparsers.add_parser('sync', help='synchronize Trello and Taskwarrior')
     sync_parser.add_argument('projects', nargs='*', help='list of projects to synchronize, if empty will synchronize all enabled projects')
+    sync_parser.add_argument('-f', '--full', action='store_true', help='do a full sync also in projects with incremental sync enabled')
+    sync_parser.add_argument('-F', '--force', action='store_true', help='synchronize also projects whose sync interval has not elapsed')
+    sync_parser.add_argument('-n', '--dry-run', action='store_true', help='show the changes that would be done without applying them')
+    sync_parser.add_argument('-j', '--jobs', type=int, default=1, help='number of projects to synchronize at the same time, default: %(default)s')
+    sync_parser.add_argument('-s', '--stats', action='store_true', help='show time, Trello requests and Taskwarrior commands of every project')
+    sync_parser.add_argument('--stats-json', metavar='FILE', help='write the stats of every project to a JSON file')
+    cassette_group = sync_parser.add_mutually_exclusive_group()
+    cassette_group.add_argument('--record', metavar='FILE', help='record Trello requests and responses (without credentials) in a cassette file')
+    cassette_group.add_argument('--replay', metavar='FILE', help='answer Trello requests from a cassette file instead of Trello')
+    sync_parser.add_argument('--replay-taskdata', metavar='DIR', help='copy of the Taskwarrior data as it was before the recorded sync, replays run as a dry run without it')
+    sync_parser.add_argument('--replay-latency', metavar='MS', type=float, default=0, help='milliseconds that every replayed request takes, default: %(default)s')
+    sync_parser.add_argument('--profile', choices=PROFILE_MODES, help='profile every project sync: cpu (cProfile of all threads), mem (tracemalloc) or wall (sampled timeline of all threads)')
+    sync_parser.add_argument('--profile-dir', metavar='DIR', default='.', help='directory where save profiles, default: current directory')
     sync_parser.set_defaults(func=sync)
 
+    webhook_parser = subparsers.add_parser('webhook', help='listen for Trello webhooks and synchronize changed cards')
+    webhook_parser.add_argument('projects', nargs='*', help='list of projects to synchronize, if empty will synchronize all enabled projects')
+    webhook_parser.add_argument('--host', default='127.0.0.1', help='address to listen on, default: %(default)s')
+    webhook_parser.add_argument('--port', type=int, default=8080, help='port to listen on, default: %(default)s')
+    webhook_parser.add_argument('--callback-url', required=True, help='public URL of this listener, webhooks are registered in Trello with it and requests not signed by Trello for it are rejected')
+    webhook_parser.set_defaults(func=webhook)
+
+    push_parser = subparsers.add_parser('push', help='push to Trello only the tasks queued by Taskwarrior hooks')
+    push_parser.add_argument('projects', nargs='*', help='list of projects to push, if empty will push all enabled projects')
+    push_parser.set_defaults(func=push)
+
+    hook_parser = subparsers.add_parser('hook', help='manage the Taskwarrior hooks that queue changed tasks')
+    hook_subparsers = hook_parser.add_subparsers(dest='hook_subcommand')
+    hook_subparsers.required = True
+
+    hook_install_parser = hook_subparsers.add_parser('install', help='install Taskwarrior hooks for enabled projects')
+    hook_install_parser.set_defaults(func=hook_install)
+
+    hook_remove_parser = hook_subparsers.add_parser('remove', help='remove Taskwarrior hooks')
+    hook_remove_parser.set_defaults(func=hook_remove)
+
     auth_parser = subparsers.add_parser('auth', help='setup the authentication against Trello')
     auth_parser.add_argument('--api-key', help='your API Key, can be set from TRELLO_API_KEY environment variable')
     auth_parser.add_argument('--api-key-secret', help='your API Key secret, can be set from TRELLO_API_SECRET environment variable')
@@ -78,6 +128,8 @@ def main():
     config_project_add_parser.add_argument('--done', default='Done', help='done Trello list name, default: %(default)s')
     config_project_add_parser.add_argument('--filter', help='Trello lists to filter on sync (separated by commas)')
     config_project_add_parser.add_argument('-o', '--only-my-cards', action='store_true', help='sync only cards assigned to me')
+    config_project_add_parser.add_argument('-i', '--incremental-sync', action='store_true', help='sync only changes since last sync')
+    config_project_add_parser.add_argument('--sync-interval', type=int, help='minimum minutes between syncs of project')
     config_project_add_parser.add_argument('-d', '--disabled', action='store_true', help='add project disabled')
     config_project_add_parser.set_defaults(func=config_project_add)
 
@@ -90,6 +142,8 @@ def main():
     config_project_modify_parser.add_argument('--done', help='done Trello list name')
     config_project_modify_parser.add_argument('--filter', help='Trello lists to filter on sync (separated by commas)')
     config_project_modify_parser.add_argument('--only-my-cards', choices=['yes', 'no'], help='sync only cards assigned to me')
+    config_project_modify_parser.add_argument('--incremental-sync', choices=['yes', 'no'], help='sync only changes since last sync')
+    config_project_modify_parser.add_argument('--sync-interval', type=int, help='minimum minutes between syncs of project (0 to sync always)')
     config_project_modify_parser.set_defaults(func=config_project_modify)
 
     config_project_show_parser = config_project_subparsers.add_parser('show', help='show project configuration')
@@ -118,12 +172,16 @@ def main():
 
     # Set loglevel via argument or environment (untouched warning by default)
     log_level = log_levels[args.verbose]
-    logging.basicConfig(level=log_level)
+    if args.jobs > 1:
+        # Prefix messages with project name (thread name) to keep parallel sync logs readable
+        logging.basicConfig(level=log_level, format='%(levelname)s:%(threadName)s:%(name)s:%(message)s')
+    else:
+        logging.basicConfig(level=log_level)
     logger = logging.getLogger('TrelloWarrior')
     logger.info('Setting loglevel to {}'.format(logging.getLevelName(log_level)))
 
     # Configure app
-    if args.command in ['sync', None]:
+    if args.command in ['sync', 'webhook', 'push', 'hook', None]:
         # Need full parse and check configuration for sync (or for no arguments which implies sync)
         config.configure(config_file=args.config, projects=args.projects)
     elif args.command != 'version':
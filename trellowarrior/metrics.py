@@ -0,0 +1,148 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2015-2020 Óscar García Amor <ogarcia@connectical.com>
+#
+# Distributed under terms of the GNU GPLv3 license.
+
+from trellowarrior.syncplan import TRELLO
+
+import logging
+import os
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (in seconds) of sync duration histogram buckets
+SYNC_DURATION_BUCKETS = [1, 2.5, 5, 10, 30, 60, 120, 300, 600]
+# Kind of change of every planned Trello action (the rest are updates)
+CARD_CHANGES = {'create card': 'created', 'move card': 'moved', 'delete card': 'deleted'}
+# Kind of change of every planned Taskwarrior action (the rest are updates)
+TASK_CHANGES = {'create task': 'created', 'complete task': 'completed', 'delete task': 'deleted'}
+# Sync stats counters exported as metrics
+STATS_COUNTERS = ['trello_requests', 'trello_retries', 'trello_rate_limited', 'trello_throttled_seconds', 'taskwarrior_commands']
+
+def bucket_bound(bound):
+    """
+    Format a histogram bucket upper bound
+
+    :param bound: upper bound
+    :return: bound as it is written in 'le' label
+    :rtype: string
+    """
+    return '{:.1f}'.format(bound) if bound == int(bound) else str(bound)
+
+def label(value):
+    """
+    Escape a metric label value
+
+    :param value: label value
+    :return: escaped value
+    :rtype: string
+    """
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class SyncMetrics:
+    """
+    Metrics of every project sync accumulated across runs in the cache, so
+    counters and histograms keep growing between runs as Prometheus expects
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def record(self, project_name, stats, plan=None):
+        """
+        Add a project sync to its metrics
+
+        :param project_name: project name
+        :param stats: SyncStats of the sync
+        :param plan: SyncPlan of the sync or None if sync failed
+        """
+        duration = stats.wall_seconds()
+        def add_sync(data):
+            metrics = data.setdefault('metrics', {}).setdefault(project_name, {})
+            buckets = metrics.setdefault('duration_buckets', {})
+            bound = next((bucket_bound(bound) for bound in SYNC_DURATION_BUCKETS if duration <= bound), '+Inf')
+            buckets[bound] = buckets.get(bound, 0) + 1
+            metrics['duration_sum'] = metrics.get('duration_sum', 0.0) + duration
+            metrics['duration_count'] = metrics.get('duration_count', 0) + 1
+            for counter in STATS_COUNTERS:
+                metrics[counter] = metrics.get(counter, 0) + stats.counters[counter]
+            if plan is None:
+                metrics['failures'] = metrics.get('failures', 0) + 1
+                metrics['last_failure'] = time.time()
+            else:
+                cards = metrics.setdefault('cards', {})
+                tasks = metrics.setdefault('tasks', {})
+                for operation in plan.operations:
+                    if operation.side == TRELLO:
+                        change = CARD_CHANGES.get(operation.action, 'updated')
+                        cards[change] = cards.get(change, 0) + 1
+                    else:
+                        change = TASK_CHANGES.get(operation.action, 'updated')
+                        tasks[change] = tasks.get(change, 0) + 1
+                metrics['last_success'] = time.time()
+        # Read, add and save at once, other threads and processes record their syncs too
+        self.cache.change(add_sync)
+
+    def format(self):
+        """
+        Format the metrics of all projects in Prometheus text format
+
+        :return: metrics text
+        :rtype: string
+        """
+        projects = sorted(self.cache.get('metrics', {}).items())
+        lines = []
+        def family(name, metric_type, description, samples):
+            lines.append('# HELP {} {}'.format(name, description))
+            lines.append('# TYPE {} {}'.format(name, metric_type))
+            lines.extend(samples)
+        def counter(name, description, key):
+            family(name, 'counter', description, ['{}{{project="{}"}} {}'.format(name, label(project_name), metrics.get(key, 0))
+                for project_name, metrics in projects])
+        def changes(name, description, key, kinds):
+            family(name, 'counter', description, ['{}{{project="{}",change="{}"}} {}'.format(name, label(project_name), kind, metrics.get(key, {}).get(kind, 0))
+                for project_name, metrics in projects for kind in kinds])
+        histogram = []
+        for project_name, metrics in projects:
+            buckets = metrics.get('duration_buckets', {})
+            cumulative = 0
+            for bound in [bucket_bound(bound) for bound in SYNC_DURATION_BUCKETS] + ['+Inf']:
+                cumulative += buckets.get(bound, 0)
+                histogram.append('trellowarrior_sync_duration_seconds_bucket{{project="{}",le="{}"}} {}'.format(label(project_name), bound, cumulative))
+            histogram.append('trellowarrior_sync_duration_seconds_sum{{project="{}"}} {}'.format(label(project_name), metrics.get('duration_sum', 0.0)))
+            histogram.append('trellowarrior_sync_duration_seconds_count{{project="{}"}} {}'.format(label(project_name), metrics.get('duration_count', 0)))
+        family('trellowarrior_sync_duration_seconds', 'histogram', 'Duration of project syncs.', histogram)
+        counter('trellowarrior_sync_failures_total', 'Project syncs that failed.', 'failures')
+        family('trellowarrior_last_success_timestamp_seconds', 'gauge', 'Time of last successful project sync.',
+                ['trellowarrior_last_success_timestamp_seconds{{project="{}"}} {}'.format(label(project_name), metrics['last_success'])
+                    for project_name, metrics in projects if 'last_success' in metrics])
+        family('trellowarrior_last_failure_timestamp_seconds', 'gauge', 'Time of last failed project sync.',
+                ['trellowarrior_last_failure_timestamp_seconds{{project="{}"}} {}'.format(label(project_name), metrics['last_failure'])
+                    for project_name, metrics in projects if 'last_failure' in metrics])
+        changes('trellowarrior_cards_changed_total', 'Trello cards changed by syncs.', 'cards', ['created', 'updated', 'moved', 'deleted'])
+        changes('trellowarrior_tasks_changed_total', 'Taskwarrior tasks changed by syncs.', 'tasks', ['created', 'updated', 'completed', 'deleted'])
+        counter('trellowarrior_trello_requests_total', 'Requests sent to Trello API.', 'trello_requests')
+        counter('trellowarrior_trello_retries_total', 'Trello requests retried.', 'trello_retries')
+        counter('trellowarrior_trello_rate_limited_total', 'Trello requests rejected by rate limits.', 'trello_rate_limited')
+        counter('trellowarrior_trello_throttled_seconds_total', 'Time waiting for Trello rate limits.', 'trello_throttled_seconds')
+        counter('trellowarrior_taskwarrior_commands_total', 'Taskwarrior commands run.', 'taskwarrior_commands')
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, metrics_file):
+        """
+        Write the metrics to a file atomically, so a collector never reads
+        it partially written (like node_exporter textfile collector)
+
+        :param metrics_file: path of metrics file
+        """
+        metrics_directory = os.path.dirname(os.path.abspath(metrics_file))
+        with tempfile.NamedTemporaryFile(mode='w', dir=metrics_directory, prefix='.trellowarrior', delete=False) as temporary_file:
+            temporary_file.write(self.format())
+        os.chmod(temporary_file.name, 0o644)
+        os.replace(temporary_file.name, metrics_file)
+        logger.debug('Metrics written in {}'.format(metrics_file))
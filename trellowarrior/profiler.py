@@ -0,0 +1,250 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2015-2020 Óscar García Amor <ogarcia@connectical.com>
+#
+# Distributed under terms of the GNU GPLv3 license.
+
+from contextlib import contextmanager
+
+import cProfile
+import io
+import json
+import linecache
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ['cpu', 'mem', 'wall']
+# Functions and allocation sites shown in reports
+PROFILE_TOP = 15
+# Seconds between samples of wall profiles
+WALL_SAMPLE_INTERVAL = 0.005
+
+def format_size(size):
+    for unit in ['B', 'KiB', 'MiB']:
+        if abs(size) < 1024:
+            return '{:.1f} {}'.format(size, unit)
+        size /= 1024
+    return '{:.1f} GiB'.format(size)
+
+class CpuProfile:
+    """
+    cProfile of the thread that syncs the project and of every thread started
+    meanwhile (like the ones running Trello calls), merged in a pstats file
+
+    Since Python 3.12 one profile gets the calls of all threads (and only one
+    can be enabled at once), before every thread needs its own profile
+    """
+
+    extension = 'pstats'
+
+    def __init__(self, per_thread=sys.version_info < (3, 12)):
+        self.per_thread = per_thread
+
+    def start(self):
+        self.profile = cProfile.Profile()
+        self._threads_profiles = []
+        self._lock = threading.Lock()
+        if self.per_thread:
+            threading.setprofile(self._profile_thread)
+        self.profile.enable()
+
+    def _profile_thread(self, frame, event, arg):
+        # Called in new threads until the profile of the thread replaces it
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is enabled, never kill the thread for it
+            sys.setprofile(None)
+            return
+        with self._lock:
+            self._threads_profiles.append(profile)
+
+    def stop(self):
+        self.profile.disable()
+        if self.per_thread:
+            threading.setprofile(None)
+
+    def write(self, path):
+        """
+        Save the profile and get a report of it
+
+        :param path: file path
+        :return: report of the functions with more cumulative time
+        :rtype: string
+        """
+        report = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=report)
+        with self._lock:
+            threads_profiles = list(self._threads_profiles)
+        for profile in threads_profiles:
+            try:
+                stats.add(profile)
+            except TypeError:
+                pass # Thread without calls
+        stats.dump_stats(path)
+        if self.per_thread:
+            report.write('Profile of {} threads\n'.format(len(threads_profiles) + 1))
+        else:
+            report.write('Profile of all threads\n')
+        stats.strip_dirs().sort_stats('cumulative').print_stats(PROFILE_TOP)
+        return report.getvalue().strip('\n')
+
+class MemoryProfile:
+    """
+    tracemalloc peak memory and allocation sites, saved as a text report
+    """
+
+    extension = 'mem.txt'
+
+    def start(self):
+        tracemalloc.start()
+
+    def stop(self):
+        self.peak = tracemalloc.get_traced_memory()[1]
+        self.snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap*')])
+        tracemalloc.stop()
+
+    def write(self, path):
+        """
+        Save the report of the profile
+
+        :param path: file path
+        :return: report of peak memory and allocation sites with more memory
+        :rtype: string
+        """
+        statistics = self.snapshot.statistics('lineno')
+        lines = ['Peak traced memory: {}'.format(format_size(self.peak)),
+                'Memory still allocated at project end: {}'.format(format_size(sum(stat.size for stat in statistics))),
+                '{:>12} {:>10}  {}'.format('Size', 'Blocks', 'Allocation site')]
+        for stat in statistics:
+            frame = stat.traceback[0]
+            lines.append('{:>12} {:>10}  {}:{}  {}'.format(format_size(stat.size), stat.count, frame.filename, frame.lineno,
+                linecache.getline(frame.filename, frame.lineno).strip()))
+        with open(path, 'w') as report_file:
+            report_file.write('\n'.join(lines))
+            report_file.write('\n')
+        return '\n'.join(lines[:PROFILE_TOP + 3])
+
+class WallProfile:
+    """
+    Timeline of the stacks of every thread, sampled from another thread, and
+    of the sync phases, saved in Trace Event format (for chrome://tracing,
+    Perfetto or speedscope)
+    """
+
+    extension = 'trace.json'
+
+    def __init__(self, interval=WALL_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stats = None # Sync stats with the phases timeline, if any
+        self.samples = 0
+        self._events = []
+        self._open = {} # Open events (name and start) of every thread stack
+        self._threads = {}
+
+    def start(self):
+        self._start = time.perf_counter()
+        self._stopping = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name='profiler', daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self._stopping.set()
+        self._sampler.join()
+        self._end = time.perf_counter()
+        for thread_name in list(self._open):
+            self._add_stack(thread_name, self._end, [])
+
+    def _thread_id(self, thread_name):
+        return self._threads.setdefault(thread_name, len(self._threads) + 1)
+
+    def _add_stack(self, thread_name, now, stack):
+        """
+        Close the events of the frames no longer in a thread stack and open the
+        new ones
+        """
+        open_events = self._open.setdefault(thread_name, [])
+        common = 0
+        while common < min(len(open_events), len(stack)) and open_events[common][0] == stack[common]:
+            common += 1
+        for name, start in reversed(open_events[common:]):
+            self._events.append({'name': name, 'ph': 'X', 'pid': 1, 'tid': self._thread_id(thread_name),
+                'ts': round((start - self._start) * 1000000), 'dur': round((now - start) * 1000000)})
+        del open_events[common:]
+        open_events.extend((name, now) for name in stack[common:])
+
+    def _sample(self):
+        sampler_id = threading.get_ident()
+        while not self._stopping.wait(self.interval):
+            now = time.perf_counter()
+            threads_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == sampler_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append('{} ({}:{})'.format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                    frame = frame.f_back
+                stack.reverse()
+                self._add_stack(threads_names.get(thread_id, str(thread_id)), now, stack)
+            self.samples += 1
+
+    def write(self, path):
+        """
+        Save the timeline
+
+        :param path: file path
+        :return: summary of the timeline
+        :rtype: string
+        """
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': thread_id, 'args': {'name': thread_name}}
+                for thread_name, thread_id in self._threads.items()]
+        if self.stats is not None:
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': 0, 'args': {'name': 'sync phases'}})
+            timeline = self.stats.timeline
+            for number, (name, start) in enumerate(timeline):
+                end = timeline[number + 1][1] if number + 1 < len(timeline) else self._end
+                events.append({'name': name, 'ph': 'X', 'pid': 1, 'tid': 0,
+                    'ts': round((start - self._start) * 1000000), 'dur': round((end - start) * 1000000)})
+        with open(path, 'w') as trace_file:
+            json.dump({'traceEvents': events + self._events, 'displayTimeUnit': 'ms'}, trace_file)
+        return '{} samples of {} threads in {:.2f}s'.format(self.samples, len(self._threads), self._end - self._start)
+
+PROFILES = {'cpu': CpuProfile, 'mem': MemoryProfile, 'wall': WallProfile}
+
+@contextmanager
+def profile_project(mode, directory, project_name):
+    """
+    Profile what runs inside the context and save the profile of the project
+    in the directory, showing its report
+
+    :param mode: 'cpu', 'mem' or 'wall'
+    :param directory: directory where save profiles
+    :param project_name: name of the profiled project
+    :return: profile object, its stats attribute can be set with the sync stats
+    """
+    profile = PROFILES[mode]()
+    profile.start()
+    try:
+        yield profile
+    finally:
+        profile.stop()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, 'trellowarrior-{}.{}'.format(re.sub(r'[^\w.-]+', '_', project_name), profile.extension))
+        report = profile.write(path)
+        sys.stdout.write('Project \'{}\' {} profile written in {}:\n'.format(project_name, mode, path))
+        sys.stdout.write('  {}\n'.format(report.replace('\n', '\n  ')))
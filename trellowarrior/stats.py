@@ -0,0 +1,221 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2015-2020 Óscar García Amor <ogarcia@connectical.com>
+#
+# Distributed under terms of the GNU GPLv3 license.
+
+import functools
+import inspect
+import logging
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Trello IDs (and Taskwarrior UUIDs) are replaced in endpoints to group requests
+ID_REGEX = re.compile(r'/([0-9a-f]{24}|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})(?=/|$)')
+
+def endpoint(method, url, api_url):
+    """
+    Get the endpoint of a Trello request without IDs nor query
+
+    :param method: HTTP method
+    :param url: request URL
+    :param api_url: base URL of Trello API
+    :return: endpoint like 'GET /boards/{id}/cards'
+    :rtype: string
+    """
+    path = url.split('?', 1)[0]
+    if path.startswith(api_url):
+        path = '/{}'.format(path[len(api_url):])
+    return '{} {}'.format(method, ID_REGEX.sub('/{id}', path))
+
+class SyncStats:
+    """
+    Time spent by a project sync in every phase and client method, and the
+    Trello requests and Taskwarrior commands that it needed
+
+    Clients record here from any thread while the stats are attached to them
+    """
+
+    def __init__(self, project_name):
+        self.project_name = project_name
+        self.phases = {} # Seconds by phase name, in run order
+        self.timeline = [] # Phase names and their start times, in run order
+        self.methods = {} # Calls and seconds by client method name
+        self.trello_endpoints = {} # Requests by endpoint
+        self.counters = {
+                'trello_requests': 0,
+                'trello_seconds': 0.0,
+                'trello_retries': 0,
+                'trello_rate_limited': 0,
+                'trello_throttled_seconds': 0.0,
+                'trello_bytes_received': 0,
+                'trello_bytes_sent': 0,
+                'taskwarrior_commands': 0,
+                'taskwarrior_seconds': 0.0}
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self._end = None
+        self._phase = None
+        self._phase_start = None
+
+    def phase(self, name):
+        """
+        End running phase (if any) and start a new one
+
+        :param name: phase name
+        """
+        now = time.perf_counter()
+        if self._phase is not None:
+            self.phases[self._phase] = self.phases.get(self._phase, 0.0) + now - self._phase_start
+        self._phase = name
+        self._phase_start = now
+        if name is not None:
+            self.timeline.append((name, now))
+
+    def stop(self):
+        """
+        End running phase and the stats wall time
+        """
+        self.phase(None)
+        self._end = time.perf_counter()
+
+    def wall_seconds(self):
+        """
+        Get the seconds since stats started until they were stopped (or now)
+
+        :return: seconds
+        :rtype: float
+        """
+        return (self._end if self._end is not None else time.perf_counter()) - self._start
+
+    def count(self, counter, value=1):
+        """
+        Add a value to a counter
+
+        :param counter: counter name
+        :param value: value to add (1 by default)
+        """
+        with self._lock:
+            self.counters[counter] += value
+
+    def method(self, name, seconds):
+        """
+        Record a call of a client method
+
+        :param name: method name like 'TrelloClient.get_cards_dict'
+        :param seconds: call duration
+        """
+        with self._lock:
+            calls, total = self.methods.get(name, (0, 0.0))
+            self.methods[name] = (calls + 1, total + seconds)
+
+    def trello_response(self, endpoint, response, seconds):
+        """
+        Record a Trello request and its response
+
+        :param endpoint: request endpoint
+        :param response: HTTP response
+        :param seconds: request duration
+        """
+        try:
+            received = int(response.headers.get('Content-Length'))
+        except (TypeError, ValueError):
+            received = len(response.content)
+        body = response.request.body if response.request is not None else None
+        with self._lock:
+            self.trello_endpoints[endpoint] = self.trello_endpoints.get(endpoint, 0) + 1
+            self.counters['trello_seconds'] += seconds
+            self.counters['trello_bytes_received'] += received
+            self.counters['trello_bytes_sent'] += len(body) if body is not None else 0
+            if response.status_code == 429:
+                self.counters['trello_rate_limited'] += 1
+
+    def as_dict(self):
+        """
+        Get the stats as a dict ready to be dumped to JSON
+
+        :return: stats dict
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                    'project': self.project_name,
+                    'wall_seconds': round(self.wall_seconds(), 3),
+                    'phases': {phase: round(seconds, 3) for phase, seconds in self.phases.items()},
+                    'counters': {counter: round(value, 3) if isinstance(value, float) else value for counter, value in self.counters.items()},
+                    'trello_endpoints': dict(sorted(self.trello_endpoints.items())),
+                    'methods': {method: {'calls': calls, 'seconds': round(seconds, 3)} for method, (calls, seconds) in sorted(self.methods.items())}}
+
+def instrument(cls):
+    """
+    Class decorator that records the calls to every public method of a
+    client in the stats attached to it (in its 'stats' attribute), if any
+    """
+    def wrap(name, function):
+        @functools.wraps(function)
+        def wrapper(self, *args, **kwargs):
+            stats = self.stats
+            if stats is None:
+                return function(self, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(self, *args, **kwargs)
+            finally:
+                stats.method(name, time.perf_counter() - start)
+        return wrapper
+    for name, function in list(vars(cls).items()):
+        if inspect.isfunction(function) and not name.startswith('_'):
+            setattr(cls, name, wrap('{}.{}'.format(cls.__name__, name), function))
+    return cls
+
+def format_table(header, rows):
+    """
+    Format rows as a text table, first column aligned to left and the rest
+    to right
+
+    :param header: list of column titles
+    :param rows: list of rows (lists of strings)
+    :return: table lines
+    :rtype: list
+    """
+    widths = [max(len(row[column]) for row in [header] + rows) for column in range(len(header))]
+    return ['  '.join(value.ljust(width) if column == 0 else value.rjust(width)
+        for column, (value, width) in enumerate(zip(row, widths))).rstrip() for row in [header] + rows]
+
+def format_stats(stats_list):
+    """
+    Format the stats of several project syncs as text tables
+
+    :param stats_list: list of SyncStats objects
+    :return: report text
+    :rtype: string
+    """
+    phases = []
+    for stats in stats_list:
+        phases += [phase for phase in stats.phases if phase not in phases]
+    header = ['Project', 'Total'] + [phase.capitalize() for phase in phases] + \
+            ['Trello', 'Requests', 'Retries', '429', 'Throttled', 'KiB in', 'KiB out', 'Taskwarrior', 'Commands']
+    rows = []
+    for stats in stats_list:
+        counters = stats.counters
+        rows.append([stats.project_name, '{:.2f}s'.format(stats.wall_seconds())] +
+                ['{:.2f}s'.format(stats.phases[phase]) if phase in stats.phases else '-' for phase in phases] +
+                ['{:.2f}s'.format(counters['trello_seconds']), str(counters['trello_requests']), str(counters['trello_retries']),
+                    str(counters['trello_rate_limited']), '{:.2f}s'.format(counters['trello_throttled_seconds']),
+                    '{:.1f}'.format(counters['trello_bytes_received'] / 1024), '{:.1f}'.format(counters['trello_bytes_sent'] / 1024),
+                    '{:.2f}s'.format(counters['taskwarrior_seconds']), str(counters['taskwarrior_commands'])])
+    lines = format_table(header, rows)
+    for stats in stats_list:
+        lines += ['', 'Project \'{}\' Trello requests by endpoint:'.format(stats.project_name)]
+        lines += ['  {}'.format(line) for line in format_table(['Endpoint', 'Requests'],
+            [[endpoint, str(requests)] for endpoint, requests in sorted(stats.trello_endpoints.items())])]
+        lines += ['', 'Project \'{}\' time by client method:'.format(stats.project_name)]
+        lines += ['  {}'.format(line) for line in format_table(['Method', 'Calls', 'Time'],
+            [[method, str(calls), '{:.2f}s'.format(seconds)] for method, (calls, seconds) in sorted(stats.methods.items(),
+                key=lambda item: item[1][1], reverse=True)])]
+    return '\n'.join(lines) + '\n'
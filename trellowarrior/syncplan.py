@@ -0,0 +1,149 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2015-2020 Óscar García Amor <ogarcia@connectical.com>
+#
+# Distributed under terms of the GNU GPLv3 license.
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+TRELLO = 'Trello'
+TASKWARRIOR = 'Taskwarrior'
+
+class SyncOperation:
+    """
+    A change planned in one side of the sync
+    """
+
+    def __init__(self, side, action, target, detail=None):
+        self.side = side
+        self.action = action
+        self.target = target
+        self.detail = detail
+        self.trello_operation = None # Queued Trello call, if any
+
+    def failed(self):
+        """
+        Check if the Trello call of the change was run and failed
+
+        :return: the error of the call or None
+        :rtype: Exception
+        """
+        return self.trello_operation.error if self.trello_operation is not None else None
+
+    def __str__(self):
+        operation = '{}: {} {}'.format(self.side, self.action, self.target)
+        return operation if self.detail is None else '{} ({})'.format(operation, self.detail)
+
+class SyncPlan:
+    """
+    Changes decided by a project sync step that are applied together, Trello
+    calls through the Trello engine and Taskwarrior changes in a single
+    import. In dry run the changes are only recorded
+    """
+
+    def __init__(self, project, trello_engine, taskwarrior_client, dry_run=False):
+        self.project = project
+        self.trello_engine = trello_engine
+        self.taskwarrior_client = taskwarrior_client
+        self.dry_run = dry_run
+        self.operations = []
+        self.trello_reads = 0 # Trello requests made to build the plan
+        self.stats = None # Stats of the sync that built the plan
+
+    def add(self, side, action, target, detail=None):
+        """
+        Record a planned change
+
+        :param side: TRELLO or TASKWARRIOR
+        :param action: what is done (like 'create card')
+        :param target: the changed card, task, list or label
+        :param detail: extra information (None by default)
+        :return: the planned change
+        :rtype: SyncOperation
+        """
+        operation = SyncOperation(side, action, target, detail)
+        self.operations.append(operation)
+        logger.debug('Planned {}'.format(operation))
+        return operation
+
+    def trello(self, action, target, key, function, *args, detail=None, callback=None, **kwargs):
+        """
+        Record a Trello change and queue its call in the Trello engine
+
+        :param action: what is done (like 'create card')
+        :param target: the changed card
+        :param key: calls with the same key are run in order
+        :param function: function to call
+        :param args: function arguments
+        :param detail: extra information (None by default)
+        :param callback: function called with the result of call (None by default)
+        :param kwargs: function keyword arguments
+        :return: the planned change
+        :rtype: SyncOperation
+        """
+        operation = self.add(TRELLO, action, target, detail)
+        operation.trello_operation = self.trello_engine.submit(key, function, *args, callback=callback, **kwargs)
+        return operation
+
+    def taskwarrior(self, action, target, detail=None):
+        """
+        Record a Taskwarrior change, the change itself must be queued in
+        Taskwarrior client by caller
+
+        :param action: what is done (like 'complete task')
+        :param target: the changed task
+        :param detail: extra information (None by default)
+        """
+        self.add(TASKWARRIOR, action, target, detail)
+
+    def execute(self):
+        """
+        Apply all queued changes (or discard them in dry run)
+        """
+        if self.dry_run:
+            self.trello_engine.discard()
+            self.taskwarrior_client.discard()
+            return
+        try:
+            self.trello_engine.run()
+        finally:
+            self.taskwarrior_client.flush()
+
+    def trello_cards_ids(self):
+        """
+        Get the IDs of the Trello cards changed by the successful Trello calls
+
+        :return: a set of Trello cards IDs
+        :rtype: set
+        """
+        trello_cards_ids = set()
+        for operation in self.operations:
+            if operation.trello_operation is None or not operation.trello_operation.done:
+                continue
+            if operation.action == 'create card':
+                trello_cards_ids.add(operation.trello_operation.result.id) # Key is the task UUID
+            else:
+                trello_cards_ids.add(operation.trello_operation.key)
+        return trello_cards_ids
+
+    def trello_writes(self):
+        """
+        Get the number of planned Trello calls
+
+        :return: number of calls
+        :rtype: int
+        """
+        return len([operation for operation in self.operations if operation.side == TRELLO])
+
+    def taskwarrior_changes(self):
+        """
+        Get the number of planned Taskwarrior changes
+
+        :return: number of changes
+        :rtype: int
+        """
+        return len([operation for operation in self.operations if operation.side == TASKWARRIOR])
@@ -0,0 +1,103 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2015-2020 Óscar García Amor <ogarcia@connectical.com>
+#
+# Distributed under terms of the GNU GPLv3 license.
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+def snapshot_hash(snapshot):
+    """
+    Get a hash of a snapshot content
+
+    :param snapshot: a snapshot dict
+    :return: the snapshot hash
+    :rtype: string
+    """
+    return hashlib.sha1(json.dumps(snapshot, sort_keys=True).encode('utf-8')).hexdigest()
+
+class SyncState:
+    """
+    Local database with the last synchronized snapshot of every task/card
+    pair, used to skip unchanged pairs and to know which side changed
+
+    Changes are kept in memory until commit, so several instances (one per
+    thread) can work over the same database without holding its lock
+    """
+
+    def __init__(self, database_file):
+        self.database_file = database_file
+        self._connection = None
+        self._changes = {}
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.database_file), exist_ok=True)
+            # Every instance is used by only one thread at a time, but not always by the one that created it
+            self._connection = sqlite3.connect(self.database_file, timeout=30, check_same_thread=False)
+            self._connection.execute('CREATE TABLE IF NOT EXISTS pairs (trelloid TEXT PRIMARY KEY, uuid TEXT, project TEXT, snapshot TEXT, hash TEXT)')
+            logger.debug('Sync state database {} opened'.format(self.database_file))
+        return self._connection
+
+    def get(self, trello_id):
+        """
+        Get the last synchronized snapshot of a pair
+
+        :param trello_id: Trello card ID
+        :return: a tuple with task UUID, snapshot dict and snapshot hash or None if pair was never synchronized
+        :rtype: tuple
+        """
+        if trello_id in self._changes:
+            row = self._changes[trello_id]
+            return None if row is None else (row[1], json.loads(row[3]), row[4])
+        row = self.connection.execute('SELECT uuid, snapshot, hash FROM pairs WHERE trelloid = ?', (trello_id,)).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1]), row[2]
+
+    def set(self, project, trello_id, uuid, snapshot):
+        """
+        Store the synchronized snapshot of a pair
+
+        :param project: TrelloWarrior project object
+        :param trello_id: Trello card ID
+        :param uuid: Taskwarrior task UUID
+        :param snapshot: a snapshot dict
+        """
+        self._changes[trello_id] = (trello_id, uuid, project.name, json.dumps(snapshot, sort_keys=True), snapshot_hash(snapshot))
+
+    def delete(self, trello_id):
+        """
+        Forget a pair
+
+        :param trello_id: Trello card ID
+        """
+        self._changes[trello_id] = None
+
+    def rollback(self):
+        """
+        Forget all changes since last commit
+        """
+        self._changes = {}
+
+    def commit(self):
+        """
+        Save to disk all changes
+        """
+        if not self._changes:
+            return
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO pairs VALUES (?, ?, ?, ?, ?)',
+                    [row for row in self._changes.values() if row is not None])
+            self.connection.executemany('DELETE FROM pairs WHERE trelloid = ?',
+                    [(trello_id,) for trello_id, row in self._changes.items() if row is None])
+        self._changes = {}
@@ -0,0 +1,152 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2015-2020 Óscar García Amor <ogarcia@connectical.com>
+#
+# Distributed under terms of the GNU GPLv3 license.
+
+from contextlib import contextmanager
+
+import fcntl
+import logging
+import os
+import stat
+import sys
+
+logger = logging.getLogger(__name__)
+
+# Taskwarrior hook script, it only uses standard library (and skips site
+# packages) to add as little time as possible to every task command
+HOOK_SCRIPT = '''#!{python} -S
+# TrelloWarrior Taskwarrior hook, installed by 'trellowarrior hook install'
+# Queues the UUID of changed tasks of synchronized projects for next push
+import fcntl
+import json
+import os
+import sys
+
+QUEUE_FILE = {queue_file!r}
+PROJECTS = {projects!r}
+
+lines = sys.stdin.readlines()
+if lines:
+    sys.stdout.write(lines[-1])
+# Changes made by TrelloWarrior itself are already synchronized
+if lines and not os.environ.get({skip_variable!r}):
+    try:
+        tasks = [json.loads(line) for line in lines]
+        # Taskwarrior matches projects from the left, so parent projects include their subprojects
+        projects = sorted(set(project for task in tasks for project in PROJECTS if task.get('project', '').startswith(project)))
+        if projects:
+            queue_file = os.open(QUEUE_FILE, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            # Locked like TrelloWarrior does to drain the queue, so no line is lost meanwhile
+            fcntl.flock(queue_file, fcntl.LOCK_EX)
+            os.write(queue_file, ''.join('{{}}\\t{{}}\\n'.format(tasks[-1]['uuid'], project) for project in projects).encode('utf-8'))
+            os.close(queue_file)
+    except Exception:
+        pass # Never break a task command
+'''
+# Names of installed hooks (Taskwarrior runs hooks by name prefix)
+HOOK_NAMES = ['on-add-trellowarrior', 'on-modify-trellowarrior']
+# Environment variable set in the task commands run by TrelloWarrior, hooks do not queue their changes
+SKIP_HOOKS_VARIABLE = 'TRELLOWARRIOR_SYNC'
+
+class TaskQueue:
+    """
+    Queue of changed Taskwarrior tasks, filled by Taskwarrior hooks and
+    drained by TrelloWarrior to push only those tasks
+    """
+
+    def __init__(self, queue_file):
+        self.queue_file = queue_file
+
+    def install_hooks(self, hooks_location, taskwarrior_projects_names):
+        """
+        Install the Taskwarrior hooks that fill the queue
+
+        :param hooks_location: Taskwarrior hooks directory
+        :param taskwarrior_projects_names: list of Taskwarrior projects to queue
+        :return: list of installed hooks paths
+        :rtype: list
+        """
+        os.makedirs(hooks_location, exist_ok=True)
+        os.makedirs(os.path.dirname(self.queue_file), exist_ok=True)
+        hook_script = HOOK_SCRIPT.format(python=sys.executable, queue_file=self.queue_file,
+                projects=sorted(taskwarrior_projects_names), skip_variable=SKIP_HOOKS_VARIABLE)
+        hooks = []
+        for hook_name in HOOK_NAMES:
+            hook_file = os.path.join(hooks_location, hook_name)
+            with open(hook_file, 'w') as hook:
+                hook.write(hook_script)
+            os.chmod(hook_file, os.stat(hook_file).st_mode | stat.S_IXUSR)
+            logger.debug('Installed Taskwarrior hook {}'.format(hook_file))
+            hooks.append(hook_file)
+        return hooks
+
+    def remove_hooks(self, hooks_location):
+        """
+        Remove the installed Taskwarrior hooks
+
+        :param hooks_location: Taskwarrior hooks directory
+        :return: list of removed hooks paths
+        :rtype: list
+        """
+        hooks = []
+        for hook_name in HOOK_NAMES:
+            hook_file = os.path.join(hooks_location, hook_name)
+            if os.path.exists(hook_file):
+                os.remove(hook_file)
+                logger.debug('Removed Taskwarrior hook {}'.format(hook_file))
+                hooks.append(hook_file)
+        return hooks
+
+    @contextmanager
+    def _locked(self, flags):
+        """
+        Open the queue file with the same lock that hooks take to write in it
+
+        :param flags: os.open flags
+        :return: queue file object
+        """
+        queue_file = os.fdopen(os.open(self.queue_file, flags, 0o600), 'r+' if flags & os.O_RDWR else 'a')
+        try:
+            fcntl.flock(queue_file, fcntl.LOCK_EX)
+            yield queue_file
+        finally:
+            queue_file.close()
+
+    def drain(self):
+        """
+        Take all queued tasks out of the queue
+
+        :return: a dict of sets of UUIDs by Taskwarrior project name
+        :rtype: dict
+        """
+        queued = {}
+        try:
+            with self._locked(os.O_RDWR) as queue_file:
+                lines = queue_file.readlines()
+                # Hooks wait for the lock, so nothing is written between read and truncate
+                queue_file.truncate(0)
+        except FileNotFoundError:
+            return {}
+        for line in lines:
+            try:
+                uuid, project = line.rstrip('\n').split('\t', 1)
+            except ValueError:
+                continue # Line partially written
+            queued.setdefault(project, set()).add(uuid)
+        logger.debug('Drained {} queued tasks'.format(sum(len(uuids) for uuids in queued.values())))
+        return queued
+
+    def put_back(self, queued):
+        """
+        Return some drained tasks to the queue
+
+        :param queued: a dict of sets of UUIDs by Taskwarrior project name
+        """
+        lines = ['{}\t{}\n'.format(uuid, project) for project, uuids in queued.items() for uuid in uuids]
+        if lines:
+            with self._locked(os.O_WRONLY | os.O_APPEND | os.O_CREAT) as queue_file:
+                queue_file.write(''.join(lines))
@@ -16,6 +16,8 @@ class TrelloWarriorProject:
         self.trello_done_list = kwargs.get('trello_done_list', 'Done')
         self.trello_lists_filter = kwargs.get('trello_lists_filter', None)
         self.only_my_cards = kwargs.get('only_my_cards', False)
+        self.incremental_sync = kwargs.get('incremental_sync', False)
+        self.sync_interval = kwargs.get('sync_interval', 0)
 
     def __repr__(self):
         return '<TrelloWarriorProject {}>'.format(self.name)
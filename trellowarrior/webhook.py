@@ -0,0 +1,148 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2015-2020 Óscar García Amor <ogarcia@connectical.com>
+#
+# Distributed under terms of the GNU GPLv3 license.
+
+from trellowarrior.clients.trellowarrior import BOARD_WIDE_ACTIONS
+
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+def webhook_signature(secret, body, callback_url):
+    """
+    Get the signature that Trello sends in X-Trello-Webhook header
+
+    :param secret: Trello API secret
+    :param body: request body (bytes)
+    :param callback_url: URL registered in Trello webhook
+    :return: base64 signature
+    :rtype: string
+    """
+    digest = hmac.new(secret.encode('utf-8'), body + callback_url.encode('utf-8'), hashlib.sha1).digest()
+    return base64.b64encode(digest).decode('utf-8')
+
+class WebhookApplication:
+    """
+    WSGI application that receives Trello webhooks of the synchronized
+    boards and syncs in background only the changed card, or the whole
+    project if the change affects several cards
+
+    Every webhook request must be signed by Trello with the API secret and
+    the callback URL, the rest are rejected. It also serves the sync metrics
+    in '/metrics' path
+    """
+
+    def __init__(self, trellowarrior_client, projects, api_secret, callback_url, metrics_file=None):
+        self.trellowarrior_client = trellowarrior_client
+        self.api_secret = api_secret
+        self.callback_url = callback_url
+        self.metrics_file = metrics_file
+        # Map Trello board IDs to projects
+        self.projects = {}
+        for project in projects:
+            trellowarrior_client.trello_client.project(project)
+            self.projects.setdefault(trellowarrior_client.trello_client.board_id, []).append(project)
+        self._queue = queue.Queue()
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def start(self):
+        """
+        Start the background thread that syncs the received changes
+        """
+        self._worker = threading.Thread(target=self._work, name='webhook', daemon=True)
+        self._worker.start()
+
+    def stop(self):
+        """
+        Wait until the queued changes are synchronized and stop
+        """
+        self._queue.put(None)
+        self._worker.join()
+
+    def enqueue(self, payload):
+        """
+        Queue the sync of the card (or projects) changed by a Trello webhook payload
+
+        :param payload: webhook payload dict
+        :return: False if payload does not belong to a synchronized board
+        :rtype: boolean
+        """
+        projects = self.projects.get(payload.get('model', {}).get('id'))
+        if projects is None:
+            return False
+        action = payload.get('action', {})
+        trello_card_id = action.get('data', {}).get('card', {}).get('id')
+        if action.get('type') in BOARD_WIDE_ACTIONS:
+            trello_card_id = None # Sync all cards
+        for project in projects:
+            job = (project.name, trello_card_id)
+            with self._lock:
+                if job in self._queued:
+                    continue # Already waiting to be synchronized
+                self._queued.add(job)
+            self._queue.put((project, trello_card_id))
+        return True
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            project, trello_card_id = job
+            with self._lock:
+                self._queued.discard((project.name, trello_card_id))
+            try:
+                if trello_card_id is None:
+                    self.trellowarrior_client.sync_project(project)
+                    if self.metrics_file is not None:
+                        self.trellowarrior_client.metrics.write_textfile(self.metrics_file)
+                else:
+                    self.trellowarrior_client.sync_card(project, trello_card_id)
+            except Exception:
+                logger.exception('Cannot sync changes of project {} received by webhook'.format(project.name))
+
+    def __call__(self, environ, start_response):
+        method = environ['REQUEST_METHOD']
+        if method == 'HEAD':
+            # Trello checks the callback URL with a HEAD request when creating the webhook
+            start_response('200 OK', [('Content-Length', '0')])
+            return [b'']
+        if method == 'GET' and environ.get('PATH_INFO') == '/metrics':
+            body = self.trellowarrior_client.metrics.format().encode('utf-8')
+            start_response('200 OK', [('Content-Type', 'text/plain; version=0.0.4; charset=utf-8'), ('Content-Length', str(len(body)))])
+            return [body]
+        if method != 'POST':
+            start_response('405 Method Not Allowed', [('Allow', 'GET, HEAD, POST'), ('Content-Length', '0')])
+            return [b'']
+        try:
+            body = environ['wsgi.input'].read(int(environ.get('CONTENT_LENGTH') or 0))
+        except ValueError:
+            body = b''
+        signature = webhook_signature(self.api_secret, body, self.callback_url)
+        if not hmac.compare_digest(signature, environ.get('HTTP_X_TRELLO_WEBHOOK', '')):
+            logger.warning('Ignoring webhook request with a wrong signature')
+            start_response('401 Unauthorized', [('Content-Length', '0')])
+            return [b'']
+        try:
+            payload = json.loads(body.decode('utf-8'))
+        except ValueError:
+            start_response('400 Bad Request', [('Content-Length', '0')])
+            return [b'']
+        if self.enqueue(payload):
+            logger.info('Received {} webhook action'.format(payload.get('action', {}).get('type')))
+        else:
+            logger.debug('Ignoring webhook of a not synchronized board')
+        start_response('200 OK', [('Content-Length', '0')])
+        return [b'']